@@ -0,0 +1,235 @@
+"""Contadores por producto y por cliente para las métricas de analítica.
+
+Cada documento de analitica_productos (clave producto) y analitica_clientes
+(clave cliente_id) acumula con $inc lo que aportan sus ventas, igual que el
+resumen diario. Las métricas derivadas (tasa de devolución, margen promedio)
+se calculan al leer y el top-N se elige con un heap.
+"""
+import heapq
+import logging
+from collections import defaultdict
+
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+
+import busqueda
+import esquema
+import etags
+from bloqueos import anotar, bloqueo, marcar_terminada, terminada
+from indices import crear_indices
+from resumen_diario import escribir
+
+logger = logging.getLogger(__name__)
+
+# Colección -> campo de la venta que hace de clave
+COLECCIONES = {"analitica_productos": "producto", "analitica_clientes": "cliente_id"}
+BLOQUEO = "reconstruir_analitica"
+
+CAMPOS = ("ventas", "entregados", "devueltos", "ganancia", "perdidas", "valor_venta", "suma_margen")
+# Campos de dinero: en las ventas v2 se suman en centavos
+DINERO = ("ganancia", "perdidas", "valor_venta")
+
+ORDENES = ("ganancia", "perdidas", "ventas", "tasa_devolucion", "margen_promedio")
+
+
+def aporte_venta(venta: dict) -> dict:
+    """Contribución de una venta a los contadores de su producto y de su cliente"""
+    valor_venta = venta.get("valor_venta") or 0
+    aporte = {
+        "ventas": 1,
+        "valor_venta": valor_venta,
+        "suma_margen": (venta.get("ganancia") or 0) / valor_venta if valor_venta else 0,
+    }
+    if venta.get("entregado") is True:
+        aporte.update(entregados=1, ganancia=venta.get("ganancia") or 0)
+    elif venta.get("entregado") is False:
+        aporte.update(devueltos=1, perdidas=venta.get("valor_perdida") or 0)
+    return aporte
+
+
+def operaciones_ventas(cambios, campo_clave: str):
+    """Operaciones $inc para una lista de (venta, signo), combinadas por clave"""
+    incrementos = defaultdict(lambda: defaultdict(int))
+    for venta, signo in cambios:
+        clave = venta.get(campo_clave)
+        if clave is None:
+            continue
+        for campo, valor in aporte_venta(venta).items():
+            incrementos[clave][campo] += signo * valor
+
+    operaciones = []
+    for clave, campos in incrementos.items():
+        inc = {campo: valor for campo, valor in campos.items() if valor}
+        if inc:
+            cambios = {"$inc": inc}
+            if campo_clave == "producto":
+                cambios["$setOnInsert"] = {busqueda.CAMPO: busqueda.terminos_producto(clave)}
+            operaciones.append(UpdateOne({campo_clave: clave}, cambios, upsert=True))
+    return operaciones
+
+
+async def registrar_ventas(db, cambios):
+    """Actualizar los contadores con una lista de (venta, signo).
+
+    Durante una reconstrucción se anotan las claves en su bloqueo, como en el resumen diario.
+    """
+    cambios = list(cambios)
+    if await anotar(db, BLOQUEO, claves(cambios)):
+        return
+    for coleccion, campo_clave in COLECCIONES.items():
+        await escribir(db, operaciones_ventas(cambios, campo_clave), coleccion)
+
+
+def claves(cambios) -> list:
+    """Producto y cliente de cada venta de los cambios, sin repetir"""
+    return [
+        dict(zip(COLECCIONES.values(), valores))
+        for valores in dict.fromkeys(tuple(venta.get(c) for c in COLECCIONES.values()) for venta, _ in cambios)
+    ]
+
+
+def pipeline_contadores(campo_clave: str, version: int = 1, filtro: dict = None):
+    entregado = {"$eq": ["$entregado", True]}
+    devuelto = {"$eq": ["$entregado", False]}
+    return [
+        {"$match": {**esquema.filtro_version(version), **(filtro or {})}},
+        {"$group": {
+            "_id": f"${campo_clave}",
+            "ventas": {"$sum": 1},
+            "entregados": {"$sum": {"$cond": [entregado, 1, 0]}},
+            "devueltos": {"$sum": {"$cond": [devuelto, 1, 0]}},
+            "ganancia": {"$sum": {"$cond": [entregado, "$ganancia", 0]}},
+            "perdidas": {"$sum": {"$cond": [devuelto, {"$ifNull": ["$valor_perdida", 0]}, 0]}},
+            "valor_venta": {"$sum": "$valor_venta"},
+            "suma_margen": {"$sum": {"$cond": [
+                {"$gt": ["$valor_venta", 0]}, {"$divide": ["$ganancia", "$valor_venta"]}, 0
+            ]}},
+        }},
+        {"$match": {"_id": {"$ne": None}}},
+    ]
+
+
+async def _agregar(db, campo_clave: str, filtro: dict = None) -> list:
+    """Contadores por clave desde las ventas de las dos versiones del esquema"""
+    por_clave = {}
+    for version in esquema.VERSIONES:
+        async for grupo in db.ventas.aggregate(pipeline_contadores(campo_clave, version, filtro)):
+            fila = por_clave.setdefault(grupo["_id"], {campo_clave: grupo["_id"], **dict.fromkeys(CAMPOS, 0)})
+            for campo in CAMPOS:
+                valor = grupo[campo]
+                fila[campo] += esquema.a_unidades(valor, version) if campo in DINERO else valor
+    filas = list(por_clave.values())
+    if campo_clave == "producto":
+        for fila in filas:
+            fila[busqueda.CAMPO] = busqueda.terminos_producto(fila["producto"])
+    return filas
+
+
+async def recalcular(db, claves: list):
+    """Volver a calcular desde las ventas los contadores de las claves anotadas.
+
+    Lo llama quien tiene el bloqueo, mientras nadie incrementa los contadores.
+    """
+    recalculadas = []
+    for coleccion, campo_clave in COLECCIONES.items():
+        valores = {c.get(campo_clave) for c in claves} - {None}
+        if not valores:
+            continue
+        recalculadas.append(coleccion)
+        filas = {f[campo_clave]: f for f in await _agregar(db, campo_clave, {campo_clave: {"$in": list(valores)}})}
+        await db[coleccion].bulk_write([
+            ReplaceOne({campo_clave: valor}, filas[valor], upsert=True)
+            if valor in filas else DeleteOne({campo_clave: valor})
+            for valor in valores
+        ], ordered=False)
+    if recalculadas:
+        await etags.incrementar(db, recalculadas)
+    logger.info("Contadores de analítica: %d ventas anotadas recalculadas", len(claves))
+
+
+def _bloqueo(db):
+    return bloqueo(db, BLOQUEO, atender=lambda claves: recalcular(db, claves))
+
+
+async def reconstruir(db, tamano_lote: int = 1000):
+    """Recalcular los contadores desde las ventas en colecciones temporales que luego se renombran.
+
+    Las ventas de cada versión del esquema se agregan por separado y se suman por clave.
+    Los workers y la CLI se turnan con un bloqueo porque comparten las colecciones temporales.
+    """
+    async with _bloqueo(db):
+        return await _reconstruir(db, tamano_lote)
+
+
+async def _reconstruir(db, tamano_lote: int = 1000):
+    total = 0
+    for coleccion, campo_clave in COLECCIONES.items():
+        filas = await _agregar(db, campo_clave)
+        temporal = db[coleccion + "_tmp"]
+        await temporal.drop()
+        for i in range(0, len(filas), tamano_lote):
+            await temporal.bulk_write([InsertOne(f) for f in filas[i:i + tamano_lote]], ordered=False)
+        if filas:
+            await crear_indices(temporal, coleccion)
+            await temporal.rename(coleccion, dropTarget=True)
+        else:
+            await db[coleccion].delete_many({})
+        total += len(filas)
+    await marcar_terminada(db, BLOQUEO)
+    await etags.incrementar(db, COLECCIONES)
+    logger.info("Contadores de analítica reconstruidos con %d filas", total)
+    return total
+
+
+async def asegurar_contadores(db):
+    """Reconstruir los contadores si nunca se ha completado una reconstrucción (primer arranque).
+
+    Como en el resumen diario, no basta con que tengan filas. Con varios
+    workers solo los reconstruye el primero que toma el bloqueo.
+    """
+    if await terminada(db, BLOQUEO):
+        return
+    async with _bloqueo(db):
+        if not await terminada(db, BLOQUEO):
+            await _reconstruir(db)
+
+
+def metricas(contador: dict) -> dict:
+    """Métricas derivadas de un documento de contadores"""
+    cerradas = contador.get("entregados", 0) + contador.get("devueltos", 0)
+    ventas = contador.get("ventas", 0)
+    return {
+        "ventas": ventas,
+        "entregados": contador.get("entregados", 0),
+        "devueltos": contador.get("devueltos", 0),
+        "pendientes": ventas - cerradas,
+        "ganancia": contador.get("ganancia", 0),
+        "perdidas": contador.get("perdidas", 0),
+        "tasa_devolucion": contador.get("devueltos", 0) / cerradas if cerradas else 0,
+        "margen_promedio": contador.get("suma_margen", 0) / ventas if ventas else 0,
+    }
+
+
+async def ranking(coleccion, campo_clave: str, orden: str, n: int, minimo_ventas: int = 1):
+    """Los n primeros según orden, de mayor a menor.
+
+    Se mantiene un heap de n elementos mientras se recorre el cursor, así que
+    el coste es O(m log n) y en memoria solo quedan n contadores. Los empates
+    se deciden por número de ventas y después por orden de lectura.
+    """
+    heap = []
+    cursor = coleccion.find({"ventas": {"$gte": minimo_ventas}}, {"_id": 0})
+    async for i, contador in _enumerar(cursor):
+        fila = {campo_clave: contador[campo_clave], **metricas(contador)}
+        entrada = (fila[orden], fila["ventas"], -i, fila)
+        if len(heap) < n:
+            heapq.heappush(heap, entrada)
+        elif entrada[:3] > heap[0][:3]:
+            heapq.heapreplace(heap, entrada)
+    return [entrada[-1] for entrada in sorted(heap, key=lambda e: e[:3], reverse=True)]
+
+
+async def _enumerar(cursor):
+    i = 0
+    async for documento in cursor:
+        yield i, documento
+        i += 1
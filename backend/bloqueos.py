@@ -0,0 +1,106 @@
+"""Bloqueos con un documento de Mongo para coordinar a los workers.
+
+Las tareas de arranque que modifican datos compartidos (sembrar los datos
+demo, reconstruir los resúmenes) no deben ejecutarse a la vez en varios
+workers. Cada bloqueo es un documento de la colección `bloqueos` con su dueño
+y su vencimiento: el dueño lo renueva mientras trabaja y, si el proceso muere,
+vence solo y otro worker puede tomarlo.
+
+Mientras alguien tiene un bloqueo, los demás procesos pueden anotar en él lo
+que no deben hacer por su cuenta (las filas del resumen que modificaron
+durante una reconstrucción); el dueño lo atiende antes de soltarlo. Las
+tareas de una sola vez dejan además una marca en `meta` al terminar.
+"""
+import asyncio
+import os
+import socket
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+COLECCION = "bloqueos"
+COLECCION_MARCAS = "meta"
+DURACION = 60  # segundos sin renovar tras los que vence el bloqueo
+ESPERA = 0.5  # segundos entre intentos mientras lo tiene otro
+
+
+async def adquirir(db, nombre: str, dueno: str, duracion: float = DURACION) -> bool:
+    """Tomar o renovar el bloqueo; False si lo tiene otro dueño y no ha vencido"""
+    ahora = datetime.now(timezone.utc)
+    try:
+        # Si el documento existe y no coincide, el upsert intenta insertar el mismo _id y falla
+        await db[COLECCION].update_one(
+            {"_id": nombre, "$or": [{"vence": {"$lt": ahora}}, {"dueno": dueno}]},
+            {"$set": {"dueno": dueno, "vence": ahora + timedelta(seconds=duracion)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def anotar(db, nombre: str, entradas) -> bool:
+    """Dejar entradas para el dueño del bloqueo; False si ahora nadie lo tiene"""
+    resultado = await db[COLECCION].update_one(
+        {"_id": nombre, "vence": {"$gt": datetime.now(timezone.utc)}},
+        {"$push": {"pendientes": {"$each": list(entradas)}}},
+    )
+    return resultado.matched_count == 1
+
+
+async def _atender(db, nombre: str, dueno: str, atender):
+    """Pasar a atender lo anotado hasta que no quede nada y soltar el bloqueo"""
+    while True:
+        anterior = await db[COLECCION].find_one_and_update(
+            {"_id": nombre, "dueno": dueno}, {"$set": {"pendientes": []}}
+        )
+        if anterior is None:
+            return  # venció y lo tomó otro dueño, que atenderá lo que se anote
+        if anterior.get("pendientes"):
+            await atender(anterior["pendientes"])
+            continue
+        # Se suelta en la misma operación que comprueba que nadie anotó nada más
+        soltado = await db[COLECCION].delete_one({"_id": nombre, "dueno": dueno, "pendientes": {"$size": 0}})
+        if soltado.deleted_count:
+            return
+
+
+async def _renovar(db, nombre: str, dueno: str, duracion: float):
+    while True:
+        await asyncio.sleep(duracion / 3)
+        await adquirir(db, nombre, dueno, duracion)
+
+
+@asynccontextmanager
+async def bloqueo(db, nombre: str, duracion: float = DURACION, atender=None):
+    """Esperar a tener el bloqueo y mantenerlo renovado mientras dura el bloque.
+
+    Con atender, las entradas anotadas mientras se tenía se le pasan al salir
+    del bloque, aunque haya fallado. Si atender falla, el bloqueo se queda con
+    sus entradas hasta vencer y las atiende el siguiente dueño.
+    """
+    dueno = f"{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}"
+    while not await adquirir(db, nombre, dueno, duracion):
+        await asyncio.sleep(ESPERA)
+    renovacion = asyncio.create_task(_renovar(db, nombre, dueno, duracion))
+    try:
+        yield
+    finally:
+        try:
+            if atender:
+                await _atender(db, nombre, dueno, atender)
+        finally:
+            renovacion.cancel()
+        await db[COLECCION].delete_one({"_id": nombre, "dueno": dueno})
+
+
+async def marcar_terminada(db, tarea: str):
+    """Dejar constancia de que una tarea de una sola vez terminó"""
+    await db[COLECCION_MARCAS].update_one(
+        {"_id": tarea}, {"$set": {"terminada": datetime.now(timezone.utc)}}, upsert=True
+    )
+
+
+async def terminada(db, tarea: str) -> bool:
+    return await db[COLECCION_MARCAS].find_one({"_id": tarea}, {"_id": 1}) is not None
@@ -0,0 +1,116 @@
+"""Búsqueda por prefijo, sin acentos ni mayúsculas, de clientes y productos.
+
+Cada cliente guarda en `busqueda` las palabras normalizadas de nombre y
+apellidos, además de los dígitos del teléfono. Cada producto de
+analitica_productos guarda las de su nombre. El índice multikey sobre ese
+campo resuelve una expresión regular anclada (^ana) como un rango del índice,
+así que una búsqueda lee unos pocos cientos de entradas aunque haya 100k
+clientes. El índice de texto de Mongo no sirve: no busca por prefijo, y el
+selector se consulta mientras el usuario escribe.
+
+Se leen como mucho CANDIDATOS documentos que contienen todas las palabras como
+término exacto y otros tantos que las contienen como prefijo. Después se
+ordenan en Python: primero los que tienen más palabras exactas, luego los que
+empiezan por el texto buscado y por último por el orden propio de la colección.
+"""
+import logging
+import re
+import unicodedata
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+CAMPO = "busqueda"
+CANDIDATOS = 200
+LIMITE = 10
+LIMITE_MAXIMO = 50
+TAMANO_LOTE = 1000
+
+
+def normalizar(texto) -> str:
+    """Texto en minúsculas y sin marcas diacríticas (Peña Díaz -> pena diaz)"""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def palabras(texto) -> list:
+    """Palabras normalizadas del texto, sin repetir y en orden"""
+    return list(dict.fromkeys(re.findall(r"\w+", normalizar(texto or ""))))
+
+
+def terminos_cliente(cliente: dict) -> list:
+    terminos = palabras(f"{cliente.get('nombre') or ''} {cliente.get('apellidos') or ''}")
+    digitos = "".join(re.findall(r"\d", cliente.get("telefono") or ""))
+    if digitos and digitos not in terminos:
+        terminos.append(digitos)
+    return terminos
+
+
+def terminos_producto(producto) -> list:
+    return palabras(producto)
+
+
+def con_terminos(coleccion: str, documento: dict) -> dict:
+    """Documento con su campo de búsqueda, si la colección lo tiene"""
+    if coleccion == "clientes":
+        return {**documento, CAMPO: terminos_cliente(documento)}
+    return documento
+
+
+def _exactas(documento: dict, buscadas: list) -> int:
+    terminos = set(documento.get(CAMPO) or ())
+    return sum(palabra in terminos for palabra in buscadas)
+
+
+async def buscar(coleccion, texto: str, texto_de, orden, limite: int = LIMITE, proyeccion: dict = None) -> list:
+    """Documentos que contienen todas las palabras de texto como prefijo de algún término.
+
+    texto_de(documento) es el texto mostrado, para premiar los que empiezan por
+    lo buscado; orden(documento) desempata. Devuelve los documentos crudos.
+    """
+    buscadas = palabras(texto)
+    if not buscadas:
+        return []
+    filtros = (
+        {CAMPO: {"$all": buscadas}},
+        {"$and": [{CAMPO: {"$regex": "^" + re.escape(palabra)}} for palabra in buscadas]},
+    )
+    candidatos = {}
+    for filtro in filtros:
+        async for documento in coleccion.find(filtro, proyeccion).limit(CANDIDATOS):
+            candidatos.setdefault(documento["_id"], documento)
+
+    inicio = " ".join(buscadas)
+    return sorted(candidatos.values(), key=lambda d: (
+        -_exactas(d, buscadas),
+        not " ".join(palabras(texto_de(d))).startswith(inicio),
+        orden(d),
+    ))[:limite]
+
+
+async def _completar(coleccion, terminos_de, proyeccion: dict, tamano_lote: int) -> int:
+    completados = 0
+    while True:
+        lote = await coleccion.find({CAMPO: {"$exists": False}}, proyeccion).limit(tamano_lote).to_list(length=None)
+        if not lote:
+            return completados
+        await coleccion.bulk_write(
+            [UpdateOne({"_id": d["_id"]}, {"$set": {CAMPO: terminos_de(d)}}) for d in lote], ordered=False
+        )
+        completados += len(lote)
+
+
+async def indexar(db, tamano_lote: int = TAMANO_LOTE) -> dict:
+    """Añadir el campo de búsqueda a los clientes y productos que no lo tengan"""
+    completados = {
+        "clientes": await _completar(
+            db.clientes, terminos_cliente, {"nombre": 1, "apellidos": 1, "telefono": 1}, tamano_lote
+        ),
+        "analitica_productos": await _completar(
+            db.analitica_productos, lambda p: terminos_producto(p["producto"]), {"producto": 1}, tamano_lote
+        ),
+    }
+    if any(completados.values()):
+        logger.info("Términos de búsqueda añadidos: %s", completados)
+    return completados
@@ -0,0 +1,143 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import esquema
+
+TAMANO_MAXIMO = 256
+TTL = 30  # segundos
+
+
+class CacheTTL:
+    """Cache LRU en memoria con TTL, agrupación de fallos concurrentes e invalidación por etiquetas.
+
+    Cada entrada guarda las colecciones de las que depende (etiquetas); una escritura
+    invalida solo las entradas que dependen de la colección modificada.
+    """
+
+    def __init__(self, tamano_maximo: int = TAMANO_MAXIMO, ttl: float = TTL):
+        self.tamano_maximo = tamano_maximo
+        self.ttl = ttl
+        self._entradas = OrderedDict()  # clave -> (valor, expira, etiquetas)
+        self._en_curso = {}  # clave -> Task compartida por los fallos concurrentes
+        self._generacion = {}  # etiqueta -> contador de invalidaciones
+        self.aciertos = 0
+        self.fallos = 0
+        self.coalescidos = 0
+        self.expulsados = 0
+
+    @staticmethod
+    def clave(endpoint: str, **params) -> tuple:
+        """Clave normalizada: parámetros ordenados y sin los que no se indicaron"""
+        return (endpoint,) + tuple(sorted((k, v) for k, v in params.items() if v is not None))
+
+    def _generaciones(self, etiquetas):
+        return tuple(self._generacion.get(e, 0) for e in etiquetas)
+
+    async def obtener(self, clave: tuple, etiquetas, calcular):
+        """Devolver el valor cacheado o calcularlo una sola vez aunque lo pidan varios a la vez"""
+        entrada = self._entradas.get(clave)
+        if entrada and entrada[1] > time.monotonic():
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+        if clave in self._en_curso:
+            self.coalescidos += 1
+            return await asyncio.shield(self._en_curso[clave])
+
+        self.fallos += 1
+        # El cálculo es una tarea propia: si se cancela quien lo inició (el cliente se
+        # desconecta), los demás que esperan la misma clave siguen recibiendo el valor
+        tarea = asyncio.create_task(self._calcular(clave, etiquetas, calcular))
+        # Evitar el aviso de excepción no recuperada si ya nadie esperaba
+        tarea.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._en_curso[clave] = tarea
+        return await asyncio.shield(tarea)
+
+    async def _calcular(self, clave: tuple, etiquetas, calcular):
+        generaciones = self._generaciones(etiquetas)
+        try:
+            valor = await calcular()
+        finally:
+            del self._en_curso[clave]
+        # Si hubo una escritura mientras se calculaba, el valor puede estar desactualizado
+        if generaciones == self._generaciones(etiquetas):
+            self._guardar(clave, valor, etiquetas)
+        return valor
+
+    def _guardar(self, clave, valor, etiquetas):
+        self._entradas[clave] = (valor, time.monotonic() + self.ttl, frozenset(etiquetas))
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.tamano_maximo:
+            self._entradas.popitem(last=False)
+            self.expulsados += 1
+
+    def invalidar(self, *etiquetas):
+        """Eliminar las entradas que dependen de alguna de las colecciones indicadas"""
+        for etiqueta in etiquetas:
+            self._generacion[etiqueta] = self._generacion.get(etiqueta, 0) + 1
+        afectadas = [k for k, (_, _, tags) in self._entradas.items() if tags.intersection(etiquetas)]
+        for clave in afectadas:
+            del self._entradas[clave]
+
+    def limpiar(self):
+        self._entradas.clear()
+
+    def estadisticas(self) -> dict:
+        consultas = self.aciertos + self.fallos + self.coalescidos
+        return {
+            "entradas": len(self._entradas),
+            "tamano_maximo": self.tamano_maximo,
+            "ttl": self.ttl,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "coalescidos": self.coalescidos,
+            "expulsados": self.expulsados,
+            "tasa_aciertos": round((self.aciertos + self.coalescidos) / consultas, 4) if consultas else 0,
+        }
+
+
+cache = CacheTTL()
+
+
+class NombresClientes:
+    """Mapa id -> nombre completo de clientes, completado bajo demanda con $in.
+
+    Los endpoints de clientes lo mantienen al día al crear clientes, así que una
+    consulta solo va a Mongo por los ids que todavía no conoce.
+    """
+
+    NO_ENCONTRADO = "Cliente no encontrado"
+
+    def __init__(self, tamano_maximo: int = 100_000):
+        self.tamano_maximo = tamano_maximo
+        self._nombres = OrderedDict()
+
+    @staticmethod
+    def nombre(cliente: dict) -> str:
+        return f"{cliente['nombre']} {cliente['apellidos']}"
+
+    def guardar(self, clientes):
+        for cliente in clientes:
+            self._nombres[cliente["id"]] = self.nombre(cliente)
+            self._nombres.move_to_end(cliente["id"])
+        while len(self._nombres) > self.tamano_maximo:
+            self._nombres.popitem(last=False)
+
+    async def obtener(self, db, ids) -> dict:
+        """Nombres de los ids pedidos; los desconocidos se buscan en una sola consulta"""
+        ids = set(ids)
+        faltantes = [i for i in ids if i not in self._nombres]
+        if faltantes:
+            clientes = await db.clientes.find(
+                esquema.filtro_ids(faltantes), {"id": 1, "nombre": 1, "apellidos": 1}
+            ).to_list(length=None)
+            self.guardar(esquema.a_api("clientes", c) for c in clientes)
+        return {i: self._nombres[i] for i in ids if i in self._nombres}
+
+    def limpiar(self):
+        self._nombres.clear()
+
+
+nombres_clientes = NombresClientes()
@@ -0,0 +1,119 @@
+import asyncio
+import os
+
+import typer
+
+import analitica
+import busqueda
+import esquema
+import lanzador
+import reportes
+import resumen_diario
+from conexion import cliente_mongo
+from datos_demo import sembrar_demo
+
+app = typer.Typer(help="Tareas de mantenimiento del sistema de control de gastos")
+
+
+@app.callback()
+def main():
+    """Comandos disponibles"""
+
+
+def conectar():
+    client = cliente_mongo(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    return client[os.environ.get("DB_NAME", "control_gastos")]
+
+
+@app.command("reconstruir-resumen")
+def reconstruir_resumen():
+    """Recalcular desde cero el resumen diario ventas_diarias"""
+    filas = asyncio.run(resumen_diario.reconstruir(conectar()))
+    typer.echo(f"Resumen diario reconstruido: {filas} filas")
+
+
+@app.command("reconstruir-analitica")
+def reconstruir_analitica():
+    """Recalcular desde cero los contadores por producto y por cliente"""
+    filas = asyncio.run(analitica.reconstruir(conectar()))
+    typer.echo(f"Contadores de analítica reconstruidos: {filas} filas")
+
+
+@app.command("indexar-busqueda")
+def indexar_busqueda(
+    tamano_lote: int = typer.Option(busqueda.TAMANO_LOTE, help="documentos actualizados por lote"),
+):
+    """Añadir los términos de búsqueda a los clientes y productos que no los tengan"""
+    completados = asyncio.run(busqueda.indexar(conectar(), tamano_lote))
+    typer.echo("Términos de búsqueda añadidos: " + ", ".join(f"{c} {n}" for c, n in completados.items()))
+
+
+@app.command("generar-reportes")
+def generar_reportes(
+    desde: str = typer.Option(None, help="primer mes AAAA-MM; por defecto el de la primera venta"),
+    hasta: str = typer.Option(None, help="último mes AAAA-MM; por defecto el último cerrado"),
+    forzar: bool = typer.Option(False, help="volver a generar también los informes que ya existen"),
+):
+    """Generar los informes mensuales de pérdidas y ganancias de los meses cerrados que falten"""
+    async def generar():
+        db = conectar()
+        if desde:
+            meses = reportes.meses_entre(f"{desde}-01", f"{hasta or reportes.ultimo_cerrado()}-01")
+        else:
+            meses = [m for m in await reportes.meses_con_datos(db) if not hasta or m <= hasta]
+        return await reportes.generador.generar(db, meses, forzar)
+
+    generados = asyncio.run(generar())
+    typer.echo(f"Informes generados en {reportes.DIRECTORIO_REPORTES}: {', '.join(generados) or 'ninguno'}")
+
+
+@app.command("sembrar-demo")
+def sembrar_demo_cli(
+    ventas: int = typer.Option(30, help="número de ventas de ejemplo"),
+    dias: int = typer.Option(30, help="días de historia de las ventas"),
+):
+    """Cargar datos de demostración si la base no tiene ventas"""
+    async def sembrar():
+        db = conectar()
+        datos = await sembrar_demo(db, ventas, dias)
+        if datos:
+            await resumen_diario.reconstruir(db)
+            await analitica.reconstruir(db)
+        return datos
+
+    datos = asyncio.run(sembrar())
+    if datos is None:
+        typer.echo("La base ya tiene ventas; no se cargaron datos demo")
+    else:
+        typer.echo(f"Datos demo cargados: {datos['clientes']} clientes, {datos['ventas']} ventas, {datos['gastos']} gastos")
+
+
+@app.command("migrar-esquema")
+def migrar_esquema(
+    tamano_lote: int = typer.Option(esquema.TAMANO_LOTE, help="documentos convertidos por lote"),
+    pausa: float = typer.Option(0.0, help="segundos de espera entre lotes para no saturar el primario"),
+):
+    """Convertir ventas, clientes y gastos al esquema v2 con la API en marcha (desplegada con ESQUEMA_DATOS=2)"""
+    async def migrar():
+        db = conectar()
+        migrados = await esquema.migrar(db, tamano_lote=tamano_lote, pausa=pausa)
+        # El orden de aparición de los productos pasa a tomarse de los _id nuevos
+        await resumen_diario.reconstruir(db)
+        return migrados
+
+    migrados = asyncio.run(migrar())
+    typer.echo("Documentos migrados al esquema v2: " + ", ".join(f"{c} {n}" for c, n in migrados.items()))
+
+
+@app.command("servir")
+def servir_cli(
+    workers: int = typer.Option(None, help="procesos de uvicorn; por defecto uno por CPU"),
+    host: str = typer.Option(lanzador.HOST),
+    port: int = typer.Option(lanzador.PORT),
+):
+    """Levantar la API con varios workers"""
+    lanzador.servir(host, port, workers)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,164 @@
+"""Motor columnar del dashboard con NumPy y pandas.
+
+Lee solo las columnas necesarias de ventas (o de ventas_diarias) en arrays con
+tipo y calcula las mismas facetas que pipeline_ventas y pipeline_resumen con
+operaciones vectorizadas. Así el agrupado se hace en los workers de la API,
+que escalan en horizontal, en lugar de en el primario de Mongo. La conversión
+de cada lote y el DataFrame se construyen en el pool de hilos de concurrencia,
+fuera del bucle de eventos.
+
+Las sumas de dinero se redondean una sola vez (math.fsum), igual que $sum de
+MongoDB con su suma en doble-doble, para que los totales coincidan con los de
+la agregación y no dependan del orden de las filas.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+from bson import Binary, ObjectId
+
+import esquema
+from concurrencia import en_hilo
+
+TAMANO_LOTE = 10000
+
+PROYECCION_VENTAS = {"_id": 1, "fecha_venta": 1, "producto": 1, "ganancia": 1, "valor_perdida": 1, "entregado": 1}
+PROYECCION_RESUMEN = {
+    "_id": 0, "fecha": 1, "producto": 1, "entregados": 1, "ganancia": 1, "devueltos": 1, "perdidas": 1, "orden": 1,
+}
+
+# Clave de orden de las filas sin orden: mayor que cualquier _id, como hace $min al ignorarlas
+SIN_ORDEN = b"\xff" * 17
+
+
+def clave_orden(valor) -> bytes:
+    """Bytes que ordenan igual que Mongo los _id del orden de aparición.
+
+    El primer byte es el tipo BSON: los UUID binarios del esquema v2 quedan
+    antes que los ObjectId, como en Mongo.
+    """
+    if valor is None:
+        return SIN_ORDEN
+    if isinstance(valor, ObjectId):
+        return b"\x07" + valor.binary
+    if isinstance(valor, Binary):
+        return b"\x05" + bytes(valor)
+    return str(valor).encode()
+
+
+async def lotes(cursor, tamano_lote: int):
+    """Documentos del cursor por lotes, para convertir cada lote fuera del bucle de eventos"""
+    while True:
+        lote = await cursor.to_list(length=tamano_lote)
+        if not lote:
+            return
+        yield lote
+
+
+def _agregar_ventas(columnas, lote):
+    fechas, productos, ganancias, perdidas, estados, ordenes = columnas
+    for documento in lote:
+        venta = esquema.a_api("ventas", documento, conservar_id=True)
+        fechas.append(venta["fecha_venta"])
+        productos.append(venta["producto"])
+        ganancias.append(venta.get("ganancia") or 0)
+        perdidas.append(venta.get("valor_perdida") or 0)
+        estado = venta.get("entregado")
+        estados.append(1 if estado is True else 0 if estado is False else -1)
+        ordenes.append(clave_orden(venta["_id"]))
+
+
+def _marco_ventas(fechas, productos, ganancias, perdidas, estados, ordenes) -> pd.DataFrame:
+    estados = np.array(estados, dtype=np.int8)
+    entregado, devuelto = estados == 1, estados == 0
+    return pd.DataFrame({
+        "fecha": np.array(fechas, dtype="datetime64[D]"),
+        "producto": pd.Categorical(productos),
+        "entregados": entregado.astype(np.int64),
+        "ganancia": np.where(entregado, np.array(ganancias, dtype=np.float64), 0.0),
+        "devueltos": devuelto.astype(np.int64),
+        "perdidas": np.where(devuelto, np.array(perdidas, dtype=np.float64), 0.0),
+        "orden": np.array(ordenes, dtype="S17"),
+    })
+
+
+async def columnas_ventas(coleccion, filtro: dict, tamano_lote: int = TAMANO_LOTE) -> pd.DataFrame:
+    """Ventas del filtro como columnas con el mismo significado que las filas del resumen"""
+    columnas = ([], [], [], [], [], [])
+    async for lote in lotes(coleccion.find(filtro, PROYECCION_VENTAS).batch_size(tamano_lote), tamano_lote):
+        await en_hilo(_agregar_ventas, columnas, lote)
+    return await en_hilo(_marco_ventas, *columnas)
+
+
+def _agregar_resumen(columnas, lote):
+    fechas, productos, entregados, ganancias, devueltos, perdidas, ordenes = columnas
+    for fila in lote:
+        fechas.append(fila["fecha"])
+        productos.append(fila["producto"])
+        entregados.append(fila.get("entregados") or 0)
+        ganancias.append(fila.get("ganancia") or 0)
+        devueltos.append(fila.get("devueltos") or 0)
+        perdidas.append(fila.get("perdidas") or 0)
+        ordenes.append(clave_orden(fila.get("orden")))
+
+
+def _marco_resumen(fechas, productos, entregados, ganancias, devueltos, perdidas, ordenes) -> pd.DataFrame:
+    return pd.DataFrame({
+        "fecha": np.array(fechas, dtype="datetime64[D]"),
+        "producto": pd.Categorical(productos),
+        "entregados": np.array(entregados, dtype=np.int64),
+        "ganancia": np.array(ganancias, dtype=np.float64),
+        "devueltos": np.array(devueltos, dtype=np.int64),
+        "perdidas": np.array(perdidas, dtype=np.float64),
+        "orden": np.array(ordenes, dtype="S17"),
+    })
+
+
+async def columnas_resumen(coleccion, filtro: dict, tamano_lote: int = TAMANO_LOTE) -> pd.DataFrame:
+    """Filas por producto de ventas_diarias como columnas"""
+    columnas = ([], [], [], [], [], [], [])
+    cursor = coleccion.find(filtro, PROYECCION_RESUMEN).batch_size(tamano_lote)
+    async for lote in lotes(cursor, tamano_lote):
+        await en_hilo(_agregar_resumen, columnas, lote)
+    return await en_hilo(_marco_resumen, *columnas)
+
+
+def suma(valores) -> float:
+    return math.fsum(np.asarray(valores).tolist())
+
+
+def facetas(filas: pd.DataFrame, dias: list) -> dict:
+    """Mismo documento que devuelve el $facet de pipeline_ventas o pipeline_resumen"""
+    if filas.empty:
+        return {}
+
+    totales = {
+        "ganancias_totales": suma(filas["ganancia"]),
+        "perdidas_totales": suma(filas["perdidas"]),
+        "productos_vendidos": int(filas["entregados"].sum()),
+        "productos_devueltos": int(filas["devueltos"].sum()),
+    }
+
+    con_entregas = filas[filas["entregados"] > 0]
+    inicio, final = np.datetime64(dias[0], "D"), np.datetime64(dias[-1], "D")
+    en_periodo = con_entregas[(con_entregas["fecha"] >= inicio) & (con_entregas["fecha"] <= final)]
+    por_dia = en_periodo.groupby("fecha").agg(entregados=("entregados", "sum"), ganancia=("ganancia", suma))
+
+    por_producto = con_entregas.groupby("producto", observed=True).agg(
+        ganancia=("ganancia", suma), orden=("orden", "min")
+    )
+    # Como $min, la clave de las filas sin orden queda delante si ninguna lo tiene
+    por_producto["orden"] = por_producto["orden"].where(por_producto["orden"] != SIN_ORDEN, b"")
+    por_producto = por_producto.sort_values("orden", kind="stable")
+
+    return {
+        "totales": [totales],
+        "por_dia": [
+            {"_id": str(fecha.date()), "ventas": int(fila.entregados), "ganancia": float(fila.ganancia)}
+            for fecha, fila in por_dia.iterrows()
+        ],
+        "por_producto": [
+            {"_id": producto, "ganancia": float(ganancia)}
+            for producto, ganancia in por_producto["ganancia"].items()
+        ],
+    }
@@ -0,0 +1,158 @@
+"""Compresión gzip/Brotli de las respuestas grandes.
+
+Brotli se usa si el cliente lo acepta y el paquete brotli está instalado; si
+no, gzip. No se comprimen las respuestas pequeñas, las ya codificadas ni los
+flujos SSE, que deben llegar evento a evento. Las respuestas en streaming
+(exportaciones) se comprimen por bloques con un flush en cada uno.
+
+Un ETag fuerte identifica también la codificación, así que al comprimir se le
+añade el sufijo de la codificación (etag.coincide lo ignora al comparar). Los
+cuerpos comprimidos de las respuestas con ETag se guardan en una LRU pequeña
+por su hash: una respuesta cacheada no se vuelve a comprimir en cada acierto.
+"""
+import hashlib
+import os
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional
+    brotli = None
+
+UMBRAL_COMPRESION = int(os.environ.get("UMBRAL_COMPRESION", "1024"))  # bytes
+NIVEL_GZIP = 6
+CALIDAD_BROTLI = 5
+TAMANO_CACHE = 64
+
+EXCLUIDOS = ("text/event-stream", "application/gzip", "application/zip", "image/")
+
+
+def aceptadas(accept_encoding: str) -> set:
+    """Codificaciones de Accept-Encoding que el cliente acepta (q=0 la rechaza)"""
+    resultado = set()
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        if parametros.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        resultado.add(nombre.strip())
+    return resultado
+
+
+def elegir_codificacion(accept_encoding: str):
+    """Codificación preferida entre las que acepta el cliente"""
+    aceptadas_cliente = aceptadas(accept_encoding)
+    if brotli is not None and "br" in aceptadas_cliente:
+        return "br"
+    if "gzip" in aceptadas_cliente:
+        return "gzip"
+    return None
+
+
+class Compresor:
+    """Compresión incremental con la misma interfaz para gzip y Brotli"""
+
+    def __init__(self, codificacion: str):
+        self.codificacion = codificacion
+        if codificacion == "br":
+            self._compresor = brotli.Compressor(quality=CALIDAD_BROTLI)
+        else:
+            self._compresor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+
+    def bloque(self, datos: bytes) -> bytes:
+        if self.codificacion == "br":
+            return self._compresor.process(datos) + self._compresor.flush()
+        return self._compresor.compress(datos) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+
+    def final(self, datos: bytes = b"") -> bytes:
+        if self.codificacion == "br":
+            return self._compresor.process(datos) + self._compresor.finish()
+        return self._compresor.compress(datos) + self._compresor.flush()
+
+
+def _cabeceras_sin(cabeceras, *nombres):
+    return [(k, v) for k, v in cabeceras if k.lower() not in nombres]
+
+
+class MiddlewareCompresion:
+    """Middleware ASGI que comprime las respuestas de más de `umbral` bytes"""
+
+    def __init__(self, app, umbral: int = UMBRAL_COMPRESION, tamano_cache: int = TAMANO_CACHE):
+        self.app = app
+        self.umbral = umbral
+        self.tamano_cache = tamano_cache
+        self._comprimidos = OrderedDict()  # (hash del cuerpo, codificación) -> cuerpo comprimido
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        cabeceras = dict(scope.get("headers", []))
+        codificacion = elegir_codificacion(cabeceras.get(b"accept-encoding", b"").decode("latin-1"))
+        if codificacion is None:
+            return await self.app(scope, receive, send)
+
+        inicio = None
+        compresor = None
+        directo = False
+
+        async def enviar(mensaje):
+            nonlocal inicio, compresor, directo
+            if mensaje["type"] == "http.response.start":
+                inicio = mensaje
+                respuesta = {k.lower(): v for k, v in mensaje.get("headers", [])}
+                tipo = respuesta.get(b"content-type", b"").decode("latin-1").lower()
+                directo = (
+                    b"content-encoding" in respuesta
+                    or mensaje["status"] in (204, 206, 304)
+                    or any(tipo.startswith(excluido) for excluido in EXCLUIDOS)
+                )
+                if directo:
+                    await send(mensaje)
+                return
+            if mensaje["type"] != "http.response.body" or directo:
+                return await send(mensaje)
+
+            cuerpo = mensaje.get("body", b"")
+            mas = mensaje.get("more_body", False)
+            if compresor is None and inicio is not None:
+                # Primer bloque: decidir si se comprime la respuesta
+                if not mas and len(cuerpo) < self.umbral:
+                    directo = True
+                    await send(inicio)
+                    return await send(mensaje)
+                compresor = Compresor(codificacion)
+                originales = {k.lower(): v for k, v in inicio.get("headers", [])}
+                etag, vary = originales.get(b"etag"), originales.get(b"vary")
+                if not vary:
+                    vary = b"Accept-Encoding"
+                elif b"accept-encoding" not in vary.lower():
+                    vary += b", Accept-Encoding"
+                cabeceras_respuesta = _cabeceras_sin(
+                    inicio.get("headers", []), b"content-length", b"etag", b"vary"
+                ) + [(b"content-encoding", codificacion.encode()), (b"vary", vary)]
+                if etag:
+                    cabeceras_respuesta.append((b"etag", etag[:-1] + b"-" + codificacion.encode() + b'"'))
+                if not mas:
+                    cuerpo = self._comprimir(cuerpo, codificacion, etag)
+                    cabeceras_respuesta.append((b"content-length", str(len(cuerpo)).encode()))
+                    await send({**inicio, "headers": cabeceras_respuesta})
+                    return await send({**mensaje, "body": cuerpo})
+                await send({**inicio, "headers": cabeceras_respuesta})
+                inicio = None
+            cuerpo = compresor.bloque(cuerpo) if mas else compresor.final(cuerpo)
+            await send({**mensaje, "body": cuerpo})
+
+        await self.app(scope, receive, enviar)
+
+    def _comprimir(self, cuerpo: bytes, codificacion: str, etag) -> bytes:
+        if not etag:
+            return Compresor(codificacion).final(cuerpo)
+        clave = (hashlib.blake2b(cuerpo, digest_size=16).digest(), codificacion)
+        comprimido = self._comprimidos.get(clave)
+        if comprimido is None:
+            comprimido = Compresor(codificacion).final(cuerpo)
+            self._comprimidos[clave] = comprimido
+            while len(self._comprimidos) > self.tamano_cache:
+                self._comprimidos.popitem(last=False)
+        self._comprimidos.move_to_end(clave)
+        return comprimido
@@ -0,0 +1,155 @@
+"""Límites de concurrencia por clase de ruta y pool de hilos para el cálculo.
+
+Las rutas de analítica (dashboard, rankings e informes) pueden tardar segundos
+con rangos de varios años; las de CRUD son baratas. Cada clase tiene su
+semáforo, con una cola acotada delante: si la cola está llena la petición se
+rechaza en el acto con 429, y si espera más de la cuenta con 503, ambas con
+Retry-After. Así una ráfaga de dashboards no deja sin turno a las escrituras.
+
+El cálculo en Python (columnas, facetas de pandas y series del dashboard) se
+hace en un pool de hilos con en_hilo, para que el bucle de eventos siga
+atendiendo las escrituras mientras tanto. Es un pool de hilos y no de
+procesos: las entradas son DataFrames y listas de documentos que costaría más
+serializar que procesar, y NumPy y pandas sueltan el GIL en sus operaciones.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+
+from metricas import metricas
+
+
+def _config(clase: str, parametro: str, defecto: str) -> float:
+    return float(os.environ.get(f"{parametro}_{clase.upper()}", defecto))
+
+
+class Saturado(Exception):
+    def __init__(self, estado: int, detalle: str, reintentar: int):
+        super().__init__(detalle)
+        self.estado = estado
+        self.detalle = detalle
+        self.reintentar = reintentar
+
+
+class Limitador:
+    """Semáforo con cola acotada y tiempo máximo de espera en ella"""
+
+    def __init__(self, nombre: str, concurrencia: int, cola: int, espera: float):
+        self.nombre = nombre
+        self.concurrencia = concurrencia
+        self.cola = cola
+        self.espera = espera
+        self._semaforo = asyncio.Semaphore(concurrencia)
+        self.en_cola = 0
+
+    @classmethod
+    def desde_entorno(cls, nombre: str, concurrencia: str, cola: str, espera: str):
+        """LIMITE_<CLASE>, COLA_<CLASE> y ESPERA_<CLASE> (segundos) con sus valores por defecto"""
+        return cls(
+            nombre,
+            int(_config(nombre, "LIMITE", concurrencia)),
+            int(_config(nombre, "COLA", cola)),
+            _config(nombre, "ESPERA", espera),
+        )
+
+    @property
+    def en_curso(self) -> int:
+        return self.concurrencia - self._semaforo._value
+
+    async def entrar(self):
+        if not self._semaforo.locked():
+            return await self._semaforo.acquire()
+        if self.en_cola >= self.cola:
+            raise Saturado(429, f"Demasiadas peticiones de {self.nombre} en espera", 1)
+        self.en_cola += 1
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), self.espera)
+        except asyncio.TimeoutError:
+            raise Saturado(503, f"Servicio saturado: {self.nombre} no obtuvo turno a tiempo", max(1, round(self.espera)))
+        finally:
+            self.en_cola -= 1
+
+    def salir(self):
+        self._semaforo.release()
+
+    def estadisticas(self) -> dict:
+        return {
+            "concurrencia": self.concurrencia,
+            "en_curso": self.en_curso,
+            "en_cola": self.en_cola,
+            "cola": self.cola,
+            "espera": self.espera,
+        }
+
+
+limitadores = {
+    "analitica": Limitador.desde_entorno("analitica", "4", "32", "5"),
+    "crud": Limitador.desde_entorno("crud", "128", "512", "10"),
+}
+
+# Prefijo de ruta -> clase (None: sin límite); gana el primer prefijo que coincida
+CLASES = (
+    ("/api/eventos", None),  # conexiones SSE de larga duración
+    ("/api/admin", None),
+    ("/api/dashboard", "analitica"),
+    ("/api/analytics/", "analitica"),
+    ("/api/reportes/", "analitica"),  # la primera petición de un mes genera su informe
+    ("/api/", "crud"),
+)
+
+
+def clase_ruta(ruta: str):
+    for prefijo, clase in CLASES:
+        if ruta.startswith(prefijo):
+            return clase
+    return None
+
+
+class MiddlewareLimites:
+    """Middleware ASGI que hace pasar cada petición por el limitador de su clase de ruta"""
+
+    def __init__(self, app, limitadores: dict = limitadores):
+        self.app = app
+        self.limitadores = limitadores
+
+    async def __call__(self, scope, receive, send):
+        clase = clase_ruta(scope["path"]) if scope["type"] == "http" else None
+        if clase is None:
+            return await self.app(scope, receive, send)
+
+        limitador = self.limitadores[clase]
+        try:
+            await limitador.entrar()
+        except Saturado as e:
+            metricas.rechazos[(clase, e.estado)] += 1
+            return await self._rechazar(send, e)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limitador.salir()
+
+    @staticmethod
+    async def _rechazar(send, error: Saturado):
+        cuerpo = orjson.dumps({"detail": error.detalle})
+        await send({
+            "type": "http.response.start",
+            "status": error.estado,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(cuerpo)).encode()),
+                (b"retry-after", str(error.reintentar).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": cuerpo})
+
+
+HILOS_CALCULO = int(os.environ.get("HILOS_CALCULO", str(limitadores["analitica"].concurrencia)))
+ejecutor = ThreadPoolExecutor(max_workers=HILOS_CALCULO, thread_name_prefix="calculo")
+
+
+async def en_hilo(funcion, *args, **kwargs):
+    """Ejecutar una función de cálculo síncrona en el pool sin bloquear el bucle de eventos"""
+    return await asyncio.get_running_loop().run_in_executor(ejecutor, functools.partial(funcion, *args, **kwargs))
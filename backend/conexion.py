@@ -0,0 +1,38 @@
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Variable de entorno -> (opción de pymongo, conversión)
+OPCIONES_ENTORNO = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_READ_PREFERENCE": ("readPreference", str),
+}
+
+# Los 30 s por defecto de pymongo dejan /api/ready colgado demasiado tiempo si Mongo no responde
+POR_DEFECTO = {"serverSelectionTimeoutMS": 5000, "connectTimeoutMS": 5000}
+
+
+def opciones_mongo(entorno=None) -> dict:
+    """Opciones del cliente a partir de las variables MONGO_* que estén definidas"""
+    entorno = os.environ if entorno is None else entorno
+    opciones = dict(POR_DEFECTO)
+    for variable, (opcion, convertir) in OPCIONES_ENTORNO.items():
+        valor = entorno.get(variable)
+        if valor:
+            opciones[opcion] = convertir(valor)
+    return opciones
+
+
+def cliente_mongo(url: str, escuchas=(), entorno=None) -> AsyncIOMotorClient:
+    """Cliente de motor con el pool configurado.
+
+    Debe crearse dentro del proceso que lo usa: el pool no sobrevive a un fork,
+    así que cada worker crea el suyo al arrancar.
+    """
+    return AsyncIOMotorClient(url, event_listeners=list(escuchas), **opciones_mongo(entorno))
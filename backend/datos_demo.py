@@ -0,0 +1,116 @@
+import random
+import uuid
+from datetime import date, timedelta
+
+import esquema
+import etags
+from bloqueos import bloqueo
+
+NOMBRES = ["Juan", "María", "Carlos", "Ana", "Luis", "Laura", "Andrés", "Paula", "Jorge", "Camila"]
+APELLIDOS = ["Pérez", "González", "Rodríguez", "Martínez", "Gómez", "López", "Díaz", "Torres", "Ramírez", "Rojas"]
+CONCEPTOS = ["Facebook Ads", "Google Ads", "Instagram Promoción", "TikTok Ads"]
+
+
+def generar_clientes(n: int, rnd: random.Random):
+    for _ in range(n):
+        yield {
+            "id": str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            "nombre": rnd.choice(NOMBRES),
+            "apellidos": f"{rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}",
+            "telefono": f"300{rnd.randint(0, 9999999):07d}",
+        }
+
+
+def generar_ventas(n: int, cliente_ids: list, dias: int, rnd: random.Random, n_productos: int = 5):
+    """Ventas con la distribución de los datos demo (40% pendientes, 40% entregadas, 20% devueltas)"""
+    productos = [f"Producto {i + 1}" for i in range(n_productos)]
+    hoy = date.today()
+    for _ in range(n):
+        fecha_venta = hoy - timedelta(days=rnd.randint(0, dias))
+        valor_venta = round(rnd.uniform(50000, 500000), 2)
+        ganancia = round(valor_venta * rnd.uniform(0.2, 0.4), 2)
+
+        # 40% pendientes (null), 40% entregados (True), 20% devueltos (False)
+        estado = rnd.choice([None, None, None, None, True, True, True, True, False, False])
+        fecha_entrega = None
+        valor_perdida = 0
+        if estado is not None:
+            fecha_entrega = fecha_venta + timedelta(days=rnd.randint(1, 7))
+            if estado is False:
+                valor_perdida = round(rnd.uniform(10000, 50000), 2)
+
+        yield {
+            "id": str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            "cliente_id": rnd.choice(cliente_ids),
+            "producto": rnd.choice(productos),
+            "fecha_venta": fecha_venta.isoformat(),
+            "fecha_entrega": fecha_entrega.isoformat() if fecha_entrega else None,
+            "valor_venta": valor_venta,
+            "ganancia": ganancia,
+            "entregado": estado,
+            "valor_perdida": valor_perdida,
+        }
+
+
+def generar_gastos(n: int, dias: int, rnd: random.Random):
+    hoy = date.today()
+    for _ in range(n):
+        inicio = hoy - timedelta(days=rnd.randint(0, dias))
+        yield {
+            "id": str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            "concepto": rnd.choice(CONCEPTOS),
+            "valor": rnd.randint(50, 300) * 1000,
+            "fecha_inicio": inicio.isoformat(),
+            "fecha_final": (inicio + timedelta(days=rnd.randint(3, 14))).isoformat(),
+        }
+
+
+async def insertar_por_lotes(coleccion, documentos, tamano_lote: int = 5000):
+    """Insertar los documentos generados con la versión del esquema configurada"""
+    lote = []
+    total = 0
+    for documento in documentos:
+        lote.append(esquema.documento(coleccion.name, documento))
+        if len(lote) >= tamano_lote:
+            await coleccion.insert_many(lote, ordered=False)
+            total += len(lote)
+            lote = []
+    if lote:
+        await coleccion.insert_many(lote, ordered=False)
+        total += len(lote)
+    return total
+
+
+async def poblar(db, n_ventas: int, n_clientes: int = None, n_gastos: int = None,
+                 dias: int = 365, semilla: int = 42, n_productos: int = 50):
+    """Cargar datos sintéticos a gran escala con inserciones por lotes.
+
+    Por defecto crea un cliente por cada 10 ventas y una campaña por cada 1000.
+    """
+    rnd = random.Random(semilla)
+    n_clientes = n_clientes or max(4, n_ventas // 10)
+    n_gastos = n_gastos or max(3, n_ventas // 1000)
+
+    clientes = list(generar_clientes(n_clientes, rnd))
+    await insertar_por_lotes(db.clientes, clientes)
+    cliente_ids = [c["id"] for c in clientes]
+    del clientes
+
+    await insertar_por_lotes(db.ventas, generar_ventas(n_ventas, cliente_ids, dias, rnd, n_productos))
+    await insertar_por_lotes(db.gastos, generar_gastos(n_gastos, dias, rnd))
+    return {"clientes": n_clientes, "ventas": n_ventas, "gastos": n_gastos}
+
+
+async def sembrar_demo(db, n_ventas: int = 30, dias: int = 30, semilla: int = None):
+    """Datos de demostración para una base vacía: 4 clientes, 30 ventas y 3 campañas.
+
+    Devuelve None si ya hay ventas. Usa el conteo estimado de los metadatos de la
+    colección en lugar de contar los documentos. Los workers que arrancan a la
+    vez esperan al bloqueo, así que solo siembra el primero.
+    """
+    async with bloqueo(db, "sembrar_demo"):
+        if await db.ventas.estimated_document_count() > 0:
+            return None
+        datos = await poblar(db, n_ventas, n_clientes=4, n_gastos=3, dias=dias, semilla=semilla, n_productos=5)
+    await etags.incrementar(db, datos)
+    return datos
@@ -0,0 +1,271 @@
+"""Versiones del esquema de almacenamiento de ventas, clientes y gastos.
+
+v1 (el original) guarda un `id` UUID en texto junto al ObjectId de Mongo, las
+fechas como texto ISO y el dinero como float. v2 (opcional, ESQUEMA_DATOS=2)
+usa el UUID binario como `_id`, fechas BSON y el dinero en centavos enteros,
+que se suman sin error de redondeo. Un documento es v2 si su `_id` es binario,
+así que no hace falta un campo de versión.
+
+Durante la migración conviven las dos versiones. Las lecturas pasan cada
+documento por a_api. Las agregaciones sobre ventas se ejecutan una vez por
+versión, con filtro_version, que usa el índice de `_id`, y se combinan en
+Python. Mientras existe, la copia v1 de un documento es la que ven las
+escrituras con ESQUEMA_DATOS=1, y la v2 la que ven con ESQUEMA_DATOS=2. La
+migración (`python cli.py migrar-esquema`) debe lanzarse con la API ya
+desplegada con ESQUEMA_DATOS=2.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import date, datetime
+from typing import Optional
+
+from bson import Binary
+from bson.int64 import Int64
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+
+import busqueda
+import etags
+from indices import asegurar_indices
+
+logger = logging.getLogger(__name__)
+
+ESQUEMA = int(os.environ.get("ESQUEMA_DATOS", "1"))
+VERSIONES = (1, 2)
+TAMANO_LOTE = 1000
+
+CAMPOS_FECHA = {
+    "ventas": ("fecha_venta", "fecha_entrega"),
+    "clientes": (),
+    "gastos": ("fecha_inicio", "fecha_final"),
+}
+CAMPOS_DINERO = {
+    "ventas": ("valor_venta", "ganancia", "valor_perdida"),
+    "clientes": (),
+    "gastos": ("valor",),
+}
+# Campos que los endpoints pueden modificar en un documento existente
+CAMPOS_MUTABLES = {
+    "ventas": ("fecha_entrega", "entregado", "valor_perdida"),
+    "clientes": (),
+    "gastos": (),
+}
+# _id v1 del que sale cada copia de la migración; el change stream no la anuncia como nueva
+MARCA_MIGRACION = "migrado_de"
+# Campos de uso interno que la API no devuelve
+CAMPOS_INTERNOS = (busqueda.CAMPO, MARCA_MIGRACION)
+
+
+def nuevo_id() -> str:
+    """UUID versión 7: los primeros 48 bits son los milisegundos actuales.
+
+    Como _id binario crece en orden de creación, así las inserciones van al
+    final del índice y el orden de aparición de los productos se conserva.
+    """
+    valor = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    valor = valor & ~(0xF << 76) | 0x7 << 76
+    valor = valor & ~(0x3 << 62) | 0x2 << 62
+    return str(uuid.UUID(int=valor))
+
+
+def binario(id: str) -> Optional[Binary]:
+    """_id v2 de un id de la API (None si no es un UUID)"""
+    try:
+        return Binary.from_uuid(uuid.UUID(id))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def version(documento: dict) -> int:
+    return 2 if isinstance(documento.get("_id"), (Binary, uuid.UUID)) else 1
+
+
+def _id_texto(valor) -> str:
+    return str(valor if isinstance(valor, uuid.UUID) else valor.as_uuid())
+
+
+def _fecha_v2(valor):
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    dia = valor if isinstance(valor, date) else date.fromisoformat(valor)
+    return datetime(dia.year, dia.month, dia.day)
+
+
+def _centavos(valor):
+    return None if valor is None else Int64(round(valor * 100))
+
+
+def a_version(coleccion: str, campos: dict, version_destino: int) -> dict:
+    """Convertir fechas y dinero de un dict con valores de la API a los tipos de la versión"""
+    if version_destino == 1:
+        return {
+            k: v.isoformat() if isinstance(v, date) and k in CAMPOS_FECHA[coleccion] else v
+            for k, v in campos.items()
+        }
+    convertido = dict(campos)
+    for campo in CAMPOS_FECHA[coleccion]:
+        if campo in convertido:
+            convertido[campo] = _fecha_v2(convertido[campo])
+    for campo in CAMPOS_DINERO[coleccion]:
+        if campo in convertido:
+            convertido[campo] = _centavos(convertido[campo])
+    return convertido
+
+
+def a_v2(coleccion: str, documento: dict) -> dict:
+    """Documento v2 a partir de uno v1 o de un dict de la API con id"""
+    campos = {k: v for k, v in documento.items() if k not in ("_id", "id")}
+    return {"_id": binario(documento["id"]), **a_version(coleccion, campos, 2)}
+
+
+def documento(coleccion: str, datos: dict) -> dict:
+    """Documento a insertar según ESQUEMA; datos trae el id y las fechas como date o ISO"""
+    datos = busqueda.con_terminos(coleccion, datos)
+    if ESQUEMA == 2:
+        return a_v2(coleccion, datos)
+    return a_version(coleccion, datos, 1)
+
+
+def a_api(coleccion: str, documento: dict, conservar_id: bool = False) -> dict:
+    """Documento de cualquier versión con la forma de la API: id en texto, fechas ISO y dinero en float.
+
+    Necesita el _id para saber la versión. Con conservar_id se mantiene el _id,
+    que el resumen diario usa para el orden de aparición.
+    """
+    if version(documento) == 1:
+        return {
+            k: v for k, v in documento.items()
+            if k not in CAMPOS_INTERNOS and (conservar_id or k != "_id")
+        }
+    resultado = {"id": _id_texto(documento["_id"])}
+    for campo, valor in documento.items():
+        if campo == "_id" or campo in CAMPOS_INTERNOS:
+            continue
+        if isinstance(valor, datetime):
+            valor = valor.date().isoformat()
+        elif campo in CAMPOS_DINERO[coleccion] and valor is not None:
+            valor = valor / 100
+        resultado[campo] = valor
+    if conservar_id:
+        resultado["_id"] = documento["_id"]
+    return resultado
+
+
+def filtro_id(id: str, version_id: Optional[int] = None) -> Optional[dict]:
+    """Filtro por id de la API en una versión o en las dos (None si la versión no puede tenerlo)"""
+    id_binario = binario(id)
+    if version_id == 1:
+        return {"id": id}
+    if version_id == 2:
+        return {"_id": id_binario} if id_binario else None
+    return {"$or": [{"id": id}, {"_id": id_binario}]} if id_binario else {"id": id}
+
+
+def filtro_ids(ids) -> dict:
+    ids = list(ids)
+    binarios = [b for b in map(binario, ids) if b]
+    return {"$or": [{"id": {"$in": ids}}, {"_id": {"$in": binarios}}]} if binarios else {"id": {"$in": ids}}
+
+
+def filtro_version(version_docs: int) -> dict:
+    """Documentos de una versión; el rango por tipo de _id se resuelve con su índice"""
+    return {"_id": {"$type": "binData" if version_docs == 2 else "objectId"}}
+
+
+def rango_fechas(campo: str, inicio: date, final: date, version_docs: int) -> dict:
+    """Filtro inclusivo de un rango de días con el tipo de fecha de la versión"""
+    if version_docs == 2:
+        return {campo: {"$gte": _fecha_v2(inicio), "$lte": _fecha_v2(final)}}
+    return {campo: {"$gte": inicio.isoformat(), "$lte": final.isoformat()}}
+
+
+def expresion_fecha(campo: str, version_docs: int):
+    """Expresión de agregación con el día ISO de un campo de fecha"""
+    if version_docs == 2:
+        return {"$dateToString": {"format": "%Y-%m-%d", "date": f"${campo}"}}
+    return f"${campo}"
+
+
+def a_unidades(valor, version_docs: int):
+    """Suma de dinero de una agregación llevada a unidades (v2 suma centavos)"""
+    return valor / 100 if version_docs == 2 and valor is not None else valor
+
+
+async def actualizar_por_id(coleccion, id: str, cambios: dict) -> Optional[dict]:
+    """$set por id de la API y documento anterior con la forma de la API (y su _id).
+
+    Se prueba primero la versión de ESQUEMA: mientras se migra un documento es
+    la copia que ven las escrituras de este despliegue.
+    """
+    for version_docs in sorted(VERSIONES, key=lambda v: v != ESQUEMA):
+        filtro = filtro_id(id, version_docs)
+        if filtro is None:
+            continue
+        anterior = await coleccion.find_one_and_update(
+            filtro,
+            {"$set": a_version(coleccion.name, cambios, version_docs)},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if anterior:
+            return a_api(coleccion.name, anterior, conservar_id=True)
+    return None
+
+
+async def migrar_coleccion(db, nombre: str, tamano_lote: int = TAMANO_LOTE, pausa: float = 0) -> int:
+    """Convertir a v2 los documentos v1 de una colección por lotes, con la API en marcha.
+
+    Cada lote inserta las copias v2 (sin pisar las que ya existan de una
+    ejecución interrumpida) y borra los v1 solo si sus campos mutables no
+    cambiaron mientras tanto. Si cambiaron, se descarta la copia recién
+    insertada y el documento se reintenta en el siguiente lote; si la copia ya
+    había recibido escrituras, ella es la vigente y se borra el v1.
+    """
+    coleccion = db[nombre]
+    mutables = CAMPOS_MUTABLES[nombre]
+    migrados = 0
+    while True:
+        lote = await coleccion.find(filtro_version(1)).sort("_id", 1).limit(tamano_lote).to_list(length=None)
+        if not lote:
+            break
+        copias = [a_v2(nombre, d) for d in lote]
+        await coleccion.bulk_write([
+            UpdateOne(
+                {"_id": c["_id"]},
+                {"$setOnInsert": {**{k: v for k, v in c.items() if k != "_id"}, MARCA_MIGRACION: d["_id"]}},
+                upsert=True,
+            )
+            for d, c in zip(lote, copias)
+        ], ordered=False)
+        borrados = await coleccion.bulk_write([
+            DeleteOne({"_id": d["_id"], **{campo: d.get(campo) for campo in mutables}}) for d in lote
+        ], ordered=False)
+        migrados += borrados.deleted_count
+
+        if borrados.deleted_count < len(lote):
+            pendientes = {d["_id"] for d in await coleccion.find(
+                {"_id": {"$in": [d["_id"] for d in lote]}}, {"_id": 1}
+            ).to_list(length=None)}
+            for original, copia in zip(lote, copias):
+                if original["_id"] not in pendientes:
+                    continue
+                descartada = await coleccion.delete_one(
+                    {"_id": copia["_id"], **{campo: copia.get(campo) for campo in mutables}}
+                )
+                if not descartada.deleted_count:
+                    await coleccion.delete_one({"_id": original["_id"]})
+                    migrados += 1
+        # Cambian los _id y con ellos el orden de los listados: los ETags no pueden seguir valiendo
+        await etags.incrementar(db, [nombre])
+        logger.info("Migración de %s: %d documentos convertidos", nombre, migrados)
+        if pausa:
+            await asyncio.sleep(pausa)
+    return migrados
+
+
+async def migrar(db, colecciones=("clientes", "gastos", "ventas"), tamano_lote: int = TAMANO_LOTE,
+                 pausa: float = 0) -> dict:
+    """Preparar los índices de id para documentos sin id y migrar las colecciones en orden"""
+    await asegurar_indices(db)
+    return {nombre: await migrar_coleccion(db, nombre, tamano_lote, pausa) for nombre in colecciones}
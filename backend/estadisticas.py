@@ -0,0 +1,272 @@
+from datetime import date, timedelta
+from typing import Optional
+import asyncio
+import os
+
+import columnar
+import esquema
+from concurrencia import en_hilo
+from publicidad import IndicePublicidad
+
+MOTORES = ("mongo", "columnar")
+# Filas de la fuente a partir de las que el dashboard pasa solo al motor columnar
+UMBRAL_COLUMNAR = int(os.environ.get("UMBRAL_COLUMNAR", "200000"))
+# Días como máximo de un rango del dashboard: la serie diaria tiene un punto por día
+MAXIMO_DIAS = int(os.environ.get("MAXIMO_DIAS_DASHBOARD", "3660"))
+
+
+def limites_del_periodo(fecha_inicio_dt: Optional[date], fecha_final_dt: Optional[date]):
+    """Primer y último día de la serie ventas_por_dia (últimos 7 días si no hay rango)"""
+    if fecha_inicio_dt and fecha_final_dt:
+        return fecha_inicio_dt, fecha_final_dt
+    final = date.today()
+    return final - timedelta(days=6), final
+
+
+def dias_del_periodo(fecha_inicio_dt: Optional[date], fecha_final_dt: Optional[date]):
+    """Días que cubre la serie ventas_por_dia.
+
+    Se enumeran por ordinal: sumar un día a date.max desborda.
+    """
+    inicio, final = limites_del_periodo(fecha_inicio_dt, fecha_final_dt)
+    return [date.fromordinal(dia) for dia in range(inicio.toordinal(), final.toordinal() + 1)]
+
+
+GRANULARIDADES = ("dia", "semana", "mes")
+
+
+def inicio_periodo(dia: date, granularidad: str) -> date:
+    """Primer día de la semana (lunes) o del mes al que pertenece el día"""
+    if granularidad == "semana":
+        return dia - timedelta(days=dia.weekday())
+    if granularidad == "mes":
+        return dia.replace(day=1)
+    return dia
+
+
+def serie_por_periodo(dias: list, granularidad: str = "dia", **valores_dia):
+    """Histograma en una sola pasada, con ceros en los periodos sin datos.
+
+    Cada argumento con nombre es un dict fecha ISO -> valor que se suma por periodo.
+    Cada periodo se etiqueta con su primer día dentro del rango consultado.
+    """
+    serie = []
+    periodo_actual = None
+    for dia in dias:
+        periodo = inicio_periodo(dia, granularidad)
+        if periodo != periodo_actual:
+            serie.append({"fecha": dia.isoformat(), **{campo: 0 for campo in valores_dia}})
+            periodo_actual = periodo
+        for campo, valores in valores_dia.items():
+            serie[-1][campo] += valores.get(dia.isoformat(), 0)
+    return serie
+
+
+def serie_ventas(ventas_dia: dict, dias: list, granularidad: str = "dia"):
+    return serie_por_periodo(dias, granularidad, ventas=ventas_dia)
+
+
+def serie_inversion(inversion_dia: dict, ganancia_dia: dict, dias: list, granularidad: str = "dia"):
+    """Inversión, ganancia y ROI por periodo (ROI nulo si no hubo inversión)"""
+    serie = serie_por_periodo(dias, granularidad, inversion=inversion_dia, ganancia=ganancia_dia)
+    for periodo in serie:
+        inversion = periodo["inversion"]
+        periodo["roi"] = (periodo["ganancia"] - inversion) / inversion if inversion else None
+    return serie
+
+
+def filtro_fechas_ventas(fecha_inicio_dt: Optional[date], fecha_final_dt: Optional[date], version: int = None):
+    """Filtro de ventas para el rango seleccionado, en una versión del esquema o en las dos"""
+    if version is not None:
+        filtro = esquema.filtro_version(version)
+        if fecha_inicio_dt and fecha_final_dt:
+            filtro.update(esquema.rango_fechas("fecha_venta", fecha_inicio_dt, fecha_final_dt, version))
+        return filtro
+    if not (fecha_inicio_dt and fecha_final_dt):
+        return {}
+    return {"$or": [esquema.rango_fechas("fecha_venta", fecha_inicio_dt, fecha_final_dt, v) for v in esquema.VERSIONES]}
+
+
+def filtro_fechas_resumen(fecha_inicio_dt: Optional[date], fecha_final_dt: Optional[date]):
+    """Filtro de ventas_diarias, cuyas fechas siempre son días ISO"""
+    if not (fecha_inicio_dt and fecha_final_dt):
+        return {}
+    return esquema.rango_fechas("fecha", fecha_inicio_dt, fecha_final_dt, 1)
+
+
+def pipeline_ventas(filtro_ventas: dict, dias: list, version: int = 1):
+    """Pipeline que resume las ventas del periodo en un solo documento.
+
+    filtro_ventas debe limitarse a una versión del esquema: las fechas del
+    rango de la serie y la clave de día se expresan en los tipos de esa versión.
+    """
+    entregado = {"$eq": ["$entregado", True]}
+    devuelto = {"$eq": ["$entregado", False]}
+    return [
+        {"$match": filtro_ventas},
+        {"$facet": {
+            "totales": [
+                {"$group": {
+                    "_id": None,
+                    "ganancias_totales": {"$sum": {"$cond": [entregado, "$ganancia", 0]}},
+                    "perdidas_totales": {"$sum": {"$cond": [devuelto, {"$ifNull": ["$valor_perdida", 0]}, 0]}},
+                    "productos_vendidos": {"$sum": {"$cond": [entregado, 1, 0]}},
+                    "productos_devueltos": {"$sum": {"$cond": [devuelto, 1, 0]}},
+                }}
+            ],
+            "por_dia": [
+                {"$match": {"entregado": True, **esquema.rango_fechas("fecha_venta", dias[0], dias[-1], version)}},
+                {"$group": {
+                    "_id": esquema.expresion_fecha("fecha_venta", version),
+                    "ventas": {"$sum": 1},
+                    "ganancia": {"$sum": "$ganancia"},
+                }},
+            ],
+            # El orden por el primer _id conserva el orden de aparición de los productos
+            "por_producto": [
+                {"$match": {"entregado": True}},
+                {"$group": {"_id": "$producto", "ganancia": {"$sum": "$ganancia"}, "orden": {"$min": "$_id"}}},
+                {"$sort": {"orden": 1}},
+            ],
+        }},
+    ]
+
+
+def pipeline_resumen(filtro_fechas: dict, dias: list):
+    """Pipeline equivalente a pipeline_ventas sobre el resumen diario por producto"""
+    return [
+        {"$match": filtro_fechas},
+        {"$facet": {
+            "totales": [
+                {"$group": {
+                    "_id": None,
+                    "ganancias_totales": {"$sum": "$ganancia"},
+                    "perdidas_totales": {"$sum": "$perdidas"},
+                    "productos_vendidos": {"$sum": "$entregados"},
+                    "productos_devueltos": {"$sum": "$devueltos"},
+                }}
+            ],
+            "por_dia": [
+                {"$match": {
+                    "entregados": {"$gt": 0},
+                    "fecha": {"$gte": dias[0].isoformat(), "$lte": dias[-1].isoformat()},
+                }},
+                {"$group": {"_id": "$fecha", "ventas": {"$sum": "$entregados"}, "ganancia": {"$sum": "$ganancia"}}},
+            ],
+            "por_producto": [
+                {"$match": {"entregados": {"$gt": 0}}},
+                {"$group": {"_id": "$producto", "ganancia": {"$sum": "$ganancia"}, "orden": {"$min": "$orden"}}},
+                {"$sort": {"orden": 1}},
+            ],
+        }},
+    ]
+
+
+def combinar_facetas(por_version: dict) -> dict:
+    """Unir las facetas de pipeline_ventas de cada versión del esquema, con el dinero en unidades"""
+    totales, por_dia, por_producto = {}, {}, {}
+    for version, facetas in por_version.items():
+        for campo, valor in ((facetas.get("totales") or [{}])[0]).items():
+            if campo != "_id":
+                totales[campo] = totales.get(campo, 0) + (
+                    esquema.a_unidades(valor, version) if campo.endswith("_totales") else valor
+                )
+        for dia in facetas.get("por_dia", []):
+            fila = por_dia.setdefault(dia["_id"], {"_id": dia["_id"], "ventas": 0, "ganancia": 0})
+            fila["ventas"] += dia["ventas"]
+            fila["ganancia"] += esquema.a_unidades(dia["ganancia"], version)
+        for producto in facetas.get("por_producto", []):
+            fila = por_producto.setdefault(producto["_id"], {"_id": producto["_id"], "ganancia": 0})
+            fila["ganancia"] += esquema.a_unidades(producto["ganancia"], version)
+            if fila.get("orden") is None or columnar.clave_orden(producto["orden"]) < columnar.clave_orden(fila["orden"]):
+                fila["orden"] = producto["orden"]
+    if not totales:
+        return {}
+    return {
+        "totales": [totales],
+        "por_dia": list(por_dia.values()),
+        "por_producto": sorted(por_producto.values(), key=lambda p: columnar.clave_orden(p["orden"])),
+    }
+
+
+async def calcular_estadisticas(
+    db,
+    fecha_inicio_dt: Optional[date] = None,
+    fecha_final_dt: Optional[date] = None,
+    granularidad: str = "dia",
+    fuente: str = "resumen",
+    indice: Optional[IndicePublicidad] = None,
+    motor: Optional[str] = None,
+):
+    """Calcular todas las métricas del dashboard.
+
+    Con fuente="resumen" se leen las filas diarias de ventas_diarias; con
+    fuente="ventas" se agregan directamente las ventas (mismo resultado).
+    Con motor="mongo" se agrega en MongoDB y con motor="columnar" en el proceso
+    con pandas; sin motor se usa el columnar cuando la fuente supera UMBRAL_COLUMNAR filas.
+    La inversión en publicidad se prorratea con el índice de campañas; si no
+    se pasa uno se construye leyendo los gastos.
+    """
+    dias = dias_del_periodo(fecha_inicio_dt, fecha_final_dt)
+    if not dias:
+        # Rango invertido: no cubre ningún día, como en el cálculo original todo queda en cero
+        return componer({}, 0, {}, dias, granularidad)
+    coleccion = db.ventas_diarias if fuente == "resumen" else db.ventas
+    if fuente == "resumen":
+        filtro = filtro_fechas_resumen(fecha_inicio_dt, fecha_final_dt)
+    else:
+        filtro = filtro_fechas_ventas(fecha_inicio_dt, fecha_final_dt)
+    if motor is None:
+        motor = "columnar" if await coleccion.estimated_document_count() >= UMBRAL_COLUMNAR else "mongo"
+
+    if motor == "columnar":
+        cargar = columnar.columnas_resumen if fuente == "resumen" else columnar.columnas_ventas
+
+        async def consulta_ventas():
+            return await en_hilo(columnar.facetas, await cargar(coleccion, filtro), dias)
+    elif fuente == "resumen":
+        async def consulta_ventas():
+            resumen_ventas = await coleccion.aggregate(pipeline_resumen(filtro, dias)).to_list(length=1)
+            return resumen_ventas[0] if resumen_ventas else {}
+    else:
+        # Un pipeline por versión del esquema: cada una guarda las fechas y el dinero con otros tipos
+        async def consulta_version(version):
+            filtro_version = filtro_fechas_ventas(fecha_inicio_dt, fecha_final_dt, version)
+            resumen_ventas = await coleccion.aggregate(pipeline_ventas(filtro_version, dias, version)).to_list(length=1)
+            return resumen_ventas[0] if resumen_ventas else {}
+
+        async def consulta_ventas():
+            facetas = await asyncio.gather(*(consulta_version(v) for v in esquema.VERSIONES))
+            return await en_hilo(combinar_facetas, dict(zip(esquema.VERSIONES, facetas)))
+
+    if indice is None:
+        facetas, indice = await asyncio.gather(consulta_ventas(), IndicePublicidad().cargar(db))
+    else:
+        facetas = await consulta_ventas()
+
+    inversion_total = indice.total(fecha_inicio_dt, fecha_final_dt)
+    inversion_dia = await en_hilo(indice.por_dia, dias[0], dias[-1])
+    return await en_hilo(componer, facetas, inversion_total, inversion_dia, dias, granularidad)
+
+
+def componer(facetas: dict, inversion_total: float, inversion_dia: dict, dias: list, granularidad: str) -> dict:
+    """Respuesta del dashboard a partir de las facetas; con rangos de años son bucles largos"""
+    totales = (facetas.get("totales") or [{}])[0]
+    # Los conteos se convierten a int: la respuesta no pasa por EstadisticasResponse y
+    # un resumen con filas antiguas guardadas como double los devolvería como float
+    ventas_dia = {d["_id"]: int(d["ventas"]) for d in facetas.get("por_dia", [])}
+    ganancia_dia = {d["_id"]: d["ganancia"] for d in facetas.get("por_dia", [])}
+
+    return {
+        "ganancias_totales": totales.get("ganancias_totales", 0),
+        "perdidas_totales": totales.get("perdidas_totales", 0),
+        "inversion_publicidad": inversion_total,
+        "productos_vendidos": int(totales.get("productos_vendidos", 0)),
+        "productos_devueltos": int(totales.get("productos_devueltos", 0)),
+        "ventas_por_dia": serie_ventas(ventas_dia, dias, granularidad),
+        "inversion_por_dia": serie_inversion(inversion_dia, ganancia_dia, dias, granularidad),
+        "ganancias_por_producto": [
+            {"producto": p["_id"], "ganancia": p["ganancia"]}
+            for p in facetas.get("por_producto", [])
+        ],
+    }
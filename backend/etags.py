@@ -0,0 +1,76 @@
+"""ETags fuertes para los GET condicionales de listados, dashboard y analítica.
+
+El ETag se deriva de la clave de la consulta y de la versión de las
+colecciones de las que depende. Las versiones se guardan en la colección
+`versiones` de Mongo y cada escritura incrementa las de las colecciones que
+modificó después de escribir, así que todos los workers calculan el mismo ETag
+para los mismos datos: una revalidación que llega a otro worker también recibe
+304. Comprobarlo cuesta una lectura por _id de uno o dos documentos, sin
+consultar los datos ni serializar nada.
+
+La cache en memoria de cada worker usa la misma versión en sus claves, de
+modo que nunca sirve un cuerpo más antiguo que el ETag que lo acompaña aunque
+la escritura se hiciera en otro worker y sin change stream.
+"""
+import hashlib
+import os
+
+from pymongo import UpdateOne
+
+COLECCION = "versiones"
+# Sufijos que MiddlewareCompresion añade al ETag de una respuesta comprimida
+SUFIJOS = ("-gzip", "-br")
+
+
+async def version(db, etiquetas) -> tuple:
+    """Versión compartida de cada colección: (época, contador), o None si nunca se escribió.
+
+    La época se fija al crear el documento: si la colección de versiones se
+    borra, los contadores vuelven a empezar pero los ETags no se repiten.
+    """
+    documentos = await db[COLECCION].find({"_id": {"$in": list(etiquetas)}}).to_list(length=None)
+    por_coleccion = {d["_id"]: (d.get("epoca"), d.get("version")) for d in documentos}
+    return tuple(por_coleccion.get(etiqueta) for etiqueta in etiquetas)
+
+
+async def incrementar(db, colecciones):
+    """Nueva versión de las colecciones modificadas; se llama cuando la escritura ya terminó"""
+    await db[COLECCION].bulk_write([
+        UpdateOne(
+            {"_id": coleccion},
+            {"$inc": {"version": 1}, "$setOnInsert": {"epoca": os.urandom(8).hex()}},
+            upsert=True,
+        )
+        for coleccion in set(colecciones)
+    ], ordered=False)
+
+
+def calcular(clave: tuple, version: tuple) -> str:
+    partes = (version, clave)
+    return '"%s"' % hashlib.blake2b(repr(partes).encode(), digest_size=12).hexdigest()
+
+
+def _normalizar(etag: str) -> str:
+    etag = etag.strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    etag = etag.strip('"')
+    for sufijo in SUFIJOS:
+        if etag.endswith(sufijo):
+            return etag[:-len(sufijo)]
+    return etag
+
+
+def coincide(if_none_match: str, etag: str) -> bool:
+    """Si la cabecera If-None-Match incluye el ETag (comparación débil, como pide RFC 9110 para GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    buscado = _normalizar(etag)
+    return any(_normalizar(candidato) == buscado for candidato in if_none_match.split(","))
+
+
+def cabeceras(etag: str) -> dict:
+    # no-cache: el navegador guarda la respuesta pero la revalida siempre con If-None-Match
+    return {"ETag": etag, "Cache-Control": "no-cache"}
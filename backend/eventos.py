@@ -0,0 +1,166 @@
+"""Eventos de escritura para los clientes conectados a /api/eventos (SSE).
+
+Si Mongo es un replica set los eventos salen de un change stream, así cada
+worker ve también las escrituras de los demás. Contra un mongod standalone los
+publican los propios endpoints de escritura en un pub/sub en proceso; en ese
+caso cada worker solo emite sus escrituras y el frontend recarga si no recibe
+el evento de la suya.
+"""
+import asyncio
+import itertools
+import logging
+from collections import deque
+
+import orjson
+
+import esquema
+
+logger = logging.getLogger(__name__)
+
+TAMANO_COLA = 256  # eventos pendientes por cliente antes de pedirle que recargue
+HISTORIAL = 1000  # eventos que se pueden reenviar a un cliente que reconecta con Last-Event-ID
+LATIDO = 15  # segundos entre comentarios de keep-alive
+
+# Colección -> (evento de inserción, clave del documento en el evento)
+INSERCIONES = {
+    "ventas": ("venta_creada", "venta"),
+    "clientes": ("cliente_creado", "cliente"),
+    "gastos": ("gasto_creado", "gasto"),
+}
+
+
+class Bus:
+    """Pub/sub en proceso con un historial corto para reanudar conexiones"""
+
+    def __init__(self, historial: int = HISTORIAL, tamano_cola: int = TAMANO_COLA):
+        self._ids = itertools.count(1)
+        self._historial = deque(maxlen=historial)
+        self._suscriptores = set()
+        self.tamano_cola = tamano_cola
+        self.change_stream = False
+
+    def publicar(self, tipo: str, datos: dict):
+        evento = (next(self._ids), tipo, datos)
+        self._historial.append(evento)
+        for cola in list(self._suscriptores):
+            try:
+                cola.put_nowait(evento)
+            except asyncio.QueueFull:
+                # Cliente demasiado lento: en lugar de acumular eventos se le pide que recargue
+                while not cola.empty():
+                    cola.get_nowait()
+                cola.put_nowait((evento[0], "recargar", {}))
+
+    def escritura(self, tipo: str, datos: dict):
+        """Evento publicado por un endpoint; se omite si ya llega por el change stream"""
+        if not self.change_stream:
+            self.publicar(tipo, datos)
+
+    def suscribir(self, ultimo_id: int = None) -> asyncio.Queue:
+        cola = asyncio.Queue(self.tamano_cola)
+        if ultimo_id is not None and self._historial:
+            pendientes = [e for e in self._historial if e[0] > ultimo_id]
+            # Si el historial ya no llega hasta ultimo_id o no cabe en la cola, se pide recargar
+            if self._historial[0][0] > ultimo_id + 1 or len(pendientes) >= self.tamano_cola:
+                cola.put_nowait((self._historial[-1][0], "recargar", {}))
+            else:
+                for evento in pendientes:
+                    cola.put_nowait(evento)
+        self._suscriptores.add(cola)
+        return cola
+
+    def cancelar(self, cola: asyncio.Queue):
+        self._suscriptores.discard(cola)
+
+    @property
+    def suscriptores(self) -> int:
+        return len(self._suscriptores)
+
+
+bus = Bus()
+
+
+def formatear(id_evento: int, tipo: str, datos: dict) -> bytes:
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (id_evento, tipo.encode(), orjson.dumps(datos, default=str))
+
+
+async def flujo(bus: Bus, ultimo_id: int = None, latido: float = LATIDO):
+    """Cuerpo text/event-stream de una conexión; termina cuando el cliente se desconecta"""
+    cola = bus.suscribir(ultimo_id)
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), latido)
+            except asyncio.TimeoutError:
+                yield b": latido\n\n"
+                continue
+            yield formatear(*evento)
+    finally:
+        bus.cancelar(cola)
+
+
+def sin_id_mongo(documento):
+    if documento is None:
+        return None
+    return {k: v for k, v in documento.items() if k != "_id"}
+
+
+def _api(coleccion: str, documento):
+    return None if documento is None else esquema.a_api(coleccion, documento)
+
+
+def evento_de_cambio(cambio: dict):
+    """Traducir un documento del change stream al mismo evento que publican los endpoints"""
+    coleccion = cambio["ns"]["coll"]
+    documento = _api(coleccion, cambio.get("fullDocument"))
+    if documento is None:
+        return None
+    if cambio["operationType"] == "insert":
+        if esquema.MARCA_MIGRACION in cambio["fullDocument"]:
+            return None  # la copia v2 de un documento que ya existía: para la interfaz no cambia nada
+        tipo, clave = INSERCIONES[coleccion]
+        return tipo, {clave: documento}
+    if coleccion == "ventas":
+        # Sin pre-imágenes activadas en la colección no se conoce el estado anterior
+        return "venta_actualizada", {"venta": documento, "anterior": _api(coleccion, cambio.get("fullDocumentBeforeChange"))}
+    return None
+
+
+async def es_replica_set(db) -> bool:
+    try:
+        hola = await db.command("hello")
+    except Exception:
+        return False
+    return bool(hola.get("setName")) or hola.get("msg") == "isdbgrid"
+
+
+async def escuchar_cambios(db, bus: Bus, al_cambiar=None):
+    """Publicar en el bus los cambios de las colecciones mientras el change stream siga abierto.
+
+    al_cambiar(coleccion) se llama con cada cambio, incluidos los de otros workers.
+    """
+    if not await es_replica_set(db):
+        logger.info("Mongo sin replica set: los eventos se publican desde los endpoints del proceso")
+        return
+    pipeline = [{"$match": {
+        "ns.coll": {"$in": list(INSERCIONES)},
+        "operationType": {"$in": ["insert", "update", "replace"]},
+    }}]
+    try:
+        async with db.watch(
+            pipeline, full_document="updateLookup", full_document_before_change="whenAvailable"
+        ) as cambios:
+            bus.change_stream = True
+            async for cambio in cambios:
+                if al_cambiar:
+                    al_cambiar(cambio["ns"]["coll"])
+                evento = evento_de_cambio(cambio)
+                if evento:
+                    bus.publicar(*evento)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("Change stream cerrado; los eventos vuelven a publicarse desde los endpoints")
+    finally:
+        bus.change_stream = False
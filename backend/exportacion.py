@@ -0,0 +1,55 @@
+import csv
+import io
+
+import orjson
+
+import esquema
+from cache import nombres_clientes
+
+TAMANO_LOTE = 500
+
+COLUMNAS_VENTAS = [
+    "id", "cliente_id", "cliente_nombre", "producto", "fecha_venta", "fecha_entrega",
+    "valor_venta", "ganancia", "entregado", "valor_perdida",
+]
+
+
+async def lotes(cursor, tamano: int = TAMANO_LOTE):
+    """Agrupar un cursor de motor en listas de como máximo tamano documentos"""
+    lote = []
+    async for documento in cursor:
+        lote.append(documento)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+async def con_nombre_cliente(db, ventas: list):
+    """Añadir cliente_nombre a un lote de ventas consultando solo sus clientes"""
+    nombres = await nombres_clientes.obtener(db, (v.get("cliente_id") for v in ventas))
+    for venta in ventas:
+        venta["cliente_nombre"] = nombres.get(venta.get("cliente_id"), nombres_clientes.NO_ENCONTRADO)
+    return ventas
+
+
+async def exportar_ventas(db, filtro: dict, formato: str = "ndjson", tamano_lote: int = TAMANO_LOTE):
+    """Generar la exportación de ventas por lotes; en memoria solo vive un lote"""
+    cursor = db.ventas.find(filtro).sort([("fecha_venta", 1), ("_id", 1)]).batch_size(tamano_lote)
+
+    if formato == "csv":
+        buffer = io.StringIO()
+        escritor = csv.DictWriter(buffer, fieldnames=COLUMNAS_VENTAS, extrasaction="ignore")
+        escritor.writeheader()
+        yield buffer.getvalue()
+
+    async for lote in lotes(cursor, tamano_lote):
+        lote = await con_nombre_cliente(db, [esquema.a_api("ventas", venta) for venta in lote])
+        if formato == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            escritor.writerows(lote)
+            yield buffer.getvalue()
+        else:
+            yield b"".join(orjson.dumps(venta, default=str) + b"\n" for venta in lote)
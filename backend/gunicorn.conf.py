@@ -0,0 +1,13 @@
+# Perfil de despliegue con gunicorn y workers de uvicorn: gunicorn -c gunicorn.conf.py server:app
+import os
+
+from lanzador import HOST, PORT, workers_por_defecto
+
+bind = f"{HOST}:{PORT}"
+workers = workers_por_defecto()
+worker_class = "uvicorn.workers.UvicornWorker"
+# La app no se precarga: cada worker importa server y crea su pool de Mongo en el lifespan
+preload_app = False
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,147 @@
+import csv
+import json
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+TAMANO_LOTE = 1000
+MAX_ERRORES = 1000
+
+TIPOS_NDJSON = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
+
+async def lineas(flujo):
+    """Partir un flujo de bytes en líneas de texto sin leerlo completo"""
+    resto = b""
+    async for bloque in flujo:
+        resto += bloque
+        *completas, resto = resto.split(b"\n")
+        for linea in completas:
+            yield linea.decode("utf-8-sig").rstrip("\r")
+    if resto:
+        yield resto.decode("utf-8-sig").rstrip("\r")
+
+
+async def filas(request):
+    """Filas del cuerpo de la petición: lista JSON, NDJSON o CSV con cabecera.
+
+    NDJSON y CSV se leen en streaming; cada fila que no se puede decodificar
+    se entrega como la excepción correspondiente para informarla. Si falla el
+    propio flujo (bytes que no son UTF-8) se lanza ValueError.
+    Los campos CSV no pueden contener saltos de línea.
+    """
+    tipo = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if tipo in TIPOS_NDJSON:
+        async for linea in lineas(request.stream()):
+            if not linea.strip():
+                continue
+            try:
+                yield json.loads(linea)
+            except ValueError as e:
+                yield e
+    elif tipo == "text/csv":
+        cabecera = None
+        async for linea in lineas(request.stream()):
+            if not linea.strip():
+                continue
+            try:
+                valores = next(csv.reader([linea]))
+            except csv.Error as e:
+                yield e
+                continue
+            if cabecera is None:
+                cabecera = [c.strip() for c in valores]
+                continue
+            # Las celdas vacías toman el valor por defecto del modelo
+            yield {k: v for k, v in zip(cabecera, valores) if v != ""}
+    else:
+        datos = await request.json()
+        if not isinstance(datos, list):
+            raise ValueError("Se esperaba una lista de registros")
+        for fila in datos:
+            yield fila
+
+
+async def insertar_lote(coleccion, lote: list, informe: dict):
+    """Insertar un lote sin orden y registrar las filas rechazadas por Mongo.
+
+    Devuelve los documentos que sí se insertaron.
+    """
+    documentos = [doc for _, doc in lote]
+    try:
+        resultado = await coleccion.insert_many(documentos, ordered=False)
+        informe["insertados"] += len(resultado.inserted_ids)
+        return documentos
+    except BulkWriteError as e:
+        informe["insertados"] += e.details.get("nInserted", 0)
+        rechazados = set()
+        for error in e.details.get("writeErrors", []):
+            rechazados.add(error["index"])
+            registrar_error(informe, lote[error["index"]][0], error.get("errmsg", "Error de escritura"))
+        return [doc for i, doc in enumerate(documentos) if i not in rechazados]
+
+
+async def procesar_lote(coleccion, lote: list, informe: dict, al_insertar=None):
+    insertados = await insertar_lote(coleccion, lote, informe)
+    if al_insertar and insertados:
+        await al_insertar(insertados)
+
+
+def registrar_error(informe: dict, fila: int, mensaje: str):
+    if len(informe["errores"]) < MAX_ERRORES:
+        informe["errores"].append({"fila": fila, "error": mensaje})
+    else:
+        informe["errores_omitidos"] += 1
+
+
+async def importar(request, coleccion, modelo, a_documento, al_insertar=None, tamano_lote: int = None):
+    """Validar las filas con el modelo Pydantic e insertarlas por lotes.
+
+    Devuelve un informe con el total de filas, las insertadas y los errores por fila
+    (numeradas desde 1). Se guardan como máximo MAX_ERRORES errores detallados.
+    al_insertar, si se indica, se espera con los documentos insertados de cada lote.
+
+    Si el cuerpo no se puede leer desde el principio se lanza ValueError. Si se
+    corta a mitad, los lotes anteriores ya están insertados: se insertan también
+    las filas válidas pendientes, se registra el error en la fila siguiente y el
+    informe se devuelve con interrumpida=True.
+    """
+    tamano_lote = tamano_lote or TAMANO_LOTE
+    informe = {"total": 0, "insertados": 0, "errores": [], "errores_omitidos": 0, "interrumpida": False}
+    lote = []
+    pendientes = filas(request)
+    while True:
+        try:
+            datos = await anext(pendientes)
+        except StopAsyncIteration:
+            break
+        except ValueError as e:
+            if not informe["total"]:
+                raise
+            informe["interrumpida"] = True
+            registrar_error(informe, informe["total"] + 1, f"Lectura interrumpida: {e}")
+            break
+        informe["total"] += 1
+        fila = informe["total"]
+        if isinstance(datos, Exception):
+            formato = "CSV" if isinstance(datos, csv.Error) else "JSON"
+            registrar_error(informe, fila, f"{formato} inválido: {datos}")
+            continue
+        try:
+            documento = a_documento(modelo(**datos))
+        except ValidationError as e:
+            registrar_error(informe, fila, "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            ))
+            continue
+        except TypeError:
+            registrar_error(informe, fila, "Se esperaba un objeto")
+            continue
+        lote.append((fila, documento))
+        if len(lote) >= tamano_lote:
+            await procesar_lote(coleccion, lote, informe, al_insertar)
+            lote = []
+    if lote:
+        await procesar_lote(coleccion, lote, informe, al_insertar)
+    return informe
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from datetime import date, timedelta
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Índices secundarios que necesitan las consultas de la API. id_unico es sparse
+# porque los documentos del esquema v2 no tienen id (ver esquema.py); el
+# desempate de los listados es _id, que existe en las dos versiones. Los
+# marcados con reconstruir se borran y se vuelven a crear si difieren: el
+# id_unico original sin sparse no admite más de un documento v2.
+INDICES = {
+    "ventas": [
+        {"name": "id_unico", "keys": [("id", 1)], "unique": True, "sparse": True, "reconstruir": True},
+        {"name": "entregado_fecha_venta", "keys": [("entregado", 1), ("fecha_venta", 1)]},
+        {"name": "fecha_venta__id", "keys": [("fecha_venta", 1), ("_id", 1)]},
+    ],
+    "clientes": [
+        {"name": "id_unico", "keys": [("id", 1)], "unique": True, "sparse": True, "reconstruir": True},
+        {"name": "apellidos_nombre__id", "keys": [("apellidos", 1), ("nombre", 1), ("_id", 1)]},
+        {"name": "busqueda", "keys": [("busqueda", 1)]},
+    ],
+    "gastos": [
+        {"name": "id_unico", "keys": [("id", 1)], "unique": True, "sparse": True, "reconstruir": True},
+        {"name": "fecha_inicio__id", "keys": [("fecha_inicio", 1), ("_id", 1)]},
+        {"name": "fecha_final", "keys": [("fecha_final", 1)]},
+    ],
+    "ventas_diarias": [
+        {"name": "fecha_producto", "keys": [("fecha", 1), ("producto", 1)], "unique": True},
+    ],
+    "analitica_productos": [
+        {"name": "producto_unico", "keys": [("producto", 1)], "unique": True},
+        {"name": "busqueda", "keys": [("busqueda", 1)]},
+    ],
+    "analitica_clientes": [
+        {"name": "cliente_id_unico", "keys": [("cliente_id", 1)], "unique": True},
+    ],
+}
+
+# Opciones de índice que se comparan para detectar diferencias
+OPCIONES = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _opciones(definicion: dict):
+    return {k: definicion[k] for k in OPCIONES if definicion.get(k)}
+
+
+async def asegurar_indices(db, crear: bool = True):
+    """Crear los índices que falten y registrar los que difieran de la definición.
+
+    Es idempotente: un índice que ya existe con las mismas claves no se vuelve a crear.
+    Los índices con diferencias se avisan en el log y solo se reconstruyen los
+    que lo indican en su definición.
+    Con crear=False solo se informa el estado sin modificar la base de datos.
+    Las colecciones se revisan a la vez.
+    """
+    resultados = await asyncio.gather(*(
+        _revisar_coleccion(db, coleccion, definiciones, crear) for coleccion, definiciones in INDICES.items()
+    ))
+    return dict(zip(INDICES, resultados))
+
+
+async def _revisar_coleccion(db, coleccion: str, definiciones: list, crear: bool):
+    existentes = await db[coleccion].index_information()
+    por_claves = {tuple(tuple(k) for k in info["key"]): (nombre, info) for nombre, info in existentes.items()}
+    estado = []
+    for definicion in definiciones:
+        claves = tuple(definicion["keys"])
+        esperado = _opciones(definicion)
+        if claves in por_claves:
+            nombre, info = por_claves[claves]
+            actual = _opciones(info)
+            if actual != esperado:
+                logger.warning("Índice %s.%s difiere: esperado %s, actual %s", coleccion, nombre, esperado, actual)
+                if crear and definicion.get("reconstruir"):
+                    estado.append(await _reconstruir(db[coleccion], nombre, definicion))
+                else:
+                    estado.append({"nombre": nombre, "estado": "difiere", "esperado": esperado, "actual": actual})
+            else:
+                estado.append({"nombre": nombre, "estado": "ok"})
+            continue
+
+        logger.warning("Falta el índice %s.%s", coleccion, definicion["name"])
+        if not crear:
+            estado.append({"nombre": definicion["name"], "estado": "falta"})
+            continue
+        try:
+            await db[coleccion].create_index(definicion["keys"], name=definicion["name"], **esperado)
+            estado.append({"nombre": definicion["name"], "estado": "creado"})
+        except OperationFailure as e:
+            logger.error("No se pudo crear el índice %s.%s: %s", coleccion, definicion["name"], e)
+            estado.append({"nombre": definicion["name"], "estado": "error", "detalle": str(e)})
+    return estado
+
+
+async def _reconstruir(coleccion, nombre: str, definicion: dict) -> dict:
+    """Borrar un índice que difiere y crearlo con la definición actual"""
+    try:
+        await coleccion.drop_index(nombre)
+    except OperationFailure:
+        pass  # otro worker que arrancaba a la vez ya lo borró
+    try:
+        await coleccion.create_index(definicion["keys"], name=definicion["name"], **_opciones(definicion))
+    except OperationFailure as e:
+        logger.error("No se pudo reconstruir el índice %s.%s: %s", coleccion.name, definicion["name"], e)
+        return {"nombre": definicion["name"], "estado": "error", "detalle": str(e)}
+    logger.info("Índice %s.%s reconstruido", coleccion.name, definicion["name"])
+    return {"nombre": definicion["name"], "estado": "reconstruido"}
+
+
+async def crear_indices(coleccion, nombre: str):
+    """Crear en coleccion (la temporal de una reconstrucción) los índices definidos para nombre"""
+    for definicion in INDICES[nombre]:
+        await coleccion.create_index(definicion["keys"], name=definicion["name"], **_opciones(definicion))
+
+
+def consultas_principales():
+    """Consultas de la API cuyo plan de ejecución se revisa"""
+    hoy = date.today()
+    rango = {"$gte": (hoy - timedelta(days=30)).isoformat(), "$lte": hoy.isoformat()}
+    return {
+        "venta_por_id": ("ventas", {"id": ""}),
+        "ventas_pendientes": ("ventas", {"entregado": None}),
+        "ventas_por_fecha": ("ventas", {"fecha_venta": rango}),
+        "cliente_por_id": ("clientes", {"id": ""}),
+        "buscar_clientes": ("clientes", {"busqueda": {"$regex": "^a"}}),
+        "gastos_por_fecha": ("gastos", {"fecha_inicio": {"$lte": rango["$lte"]}, "fecha_final": {"$gte": rango["$gte"]}}),
+    }
+
+
+def _etapas(plan: dict):
+    """Recorrer el árbol del plan ganador y devolver (etapa, índice) de cada nodo"""
+    etapas = [(plan.get("stage"), plan.get("indexName"))]
+    for hijo in ("inputStage", "queryPlan"):
+        if hijo in plan:
+            etapas.extend(_etapas(plan[hijo]))
+    for sub in plan.get("inputStages", []):
+        etapas.extend(_etapas(sub))
+    return etapas
+
+
+async def explicar_consultas(db):
+    """Resumen de explain() para las consultas principales"""
+    resultado = {}
+    for nombre, (coleccion, filtro) in consultas_principales().items():
+        explain = await db[coleccion].find(filtro).explain()
+        etapas = _etapas(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        resultado[nombre] = {
+            "coleccion": coleccion,
+            "filtro": filtro,
+            "etapas": [etapa for etapa, _ in etapas],
+            "indices": [indice for _, indice in etapas if indice],
+            "collscan": any(etapa == "COLLSCAN" for etapa, _ in etapas),
+        }
+    return resultado
@@ -0,0 +1,39 @@
+"""Arranque de la API con varios workers.
+
+Cada worker es un proceso con su propio bucle de eventos y su propio pool de
+Mongo, así que las conexiones abiertas son workers × MONGO_MAX_POOL_SIZE.
+
+    python lanzador.py                      # un worker por CPU
+    WEB_CONCURRENCY=4 python lanzador.py
+    gunicorn -c gunicorn.conf.py server:app
+"""
+import os
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "8001"))
+
+
+def workers_por_defecto() -> int:
+    """WEB_CONCURRENCY si está definida; si no, un worker por CPU disponible"""
+    if os.environ.get("WEB_CONCURRENCY"):
+        return max(1, int(os.environ["WEB_CONCURRENCY"]))
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def servir(host: str = HOST, port: int = PORT, workers: int = None):
+    import uvicorn
+
+    uvicorn.run(
+        "server:app",
+        host=host,
+        port=port,
+        workers=workers or workers_por_defecto(),
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+if __name__ == "__main__":
+    servir()
@@ -0,0 +1,197 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+import bson
+from pymongo import monitoring
+
+# Límites de los buckets de los histogramas, en segundos
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Scope ASGI y tiempos de Mongo de la petición en curso, para etiquetar las consultas
+peticion_actual = ContextVar("peticion_actual", default=None)
+mongo_peticion = ContextVar("mongo_peticion", default=None)
+
+
+class Histograma:
+    """Histograma acumulado al estilo Prometheus"""
+
+    __slots__ = ("conteos", "suma", "total")
+
+    def __init__(self):
+        self.conteos = [0] * (len(BUCKETS) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.conteos[bisect_left(BUCKETS, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+
+class Metricas:
+    def __init__(self):
+        self.peticiones = defaultdict(Histograma)  # (método, ruta, estado)
+        self.consultas = defaultdict(Histograma)  # (ruta, comando, colección)
+        self.documentos = defaultdict(int)  # (ruta, comando, colección)
+        self.bytes = defaultdict(int)  # (ruta, comando, colección)
+        self.fallos_mongo = defaultdict(int)  # (ruta, comando)
+        self.rechazos = defaultdict(int)  # (clase de ruta, estado)
+
+    def exportar(self) -> str:
+        """Texto en formato de exposición de Prometheus"""
+        lineas = []
+        self._histogramas(lineas, "http_request_duration_seconds", "Duración de las peticiones HTTP",
+                          ("method", "route", "status"), self.peticiones)
+        self._histogramas(lineas, "mongo_command_duration_seconds", "Duración de los comandos de Mongo",
+                          ("route", "command", "collection"), self.consultas)
+        self._contadores(lineas, "mongo_documents_returned_total", "Documentos devueltos por Mongo",
+                         ("route", "command", "collection"), self.documentos)
+        self._contadores(lineas, "mongo_bytes_returned_total", "Bytes de respuesta de Mongo",
+                         ("route", "command", "collection"), self.bytes)
+        self._contadores(lineas, "mongo_command_failures_total", "Comandos de Mongo fallidos",
+                         ("route", "command"), self.fallos_mongo)
+        self._contadores(lineas, "http_requests_rejected_total", "Peticiones rechazadas por los límites de concurrencia",
+                         ("class", "status"), self.rechazos)
+        return "\n".join(lineas) + "\n"
+
+    @staticmethod
+    def _etiquetas(nombres, valores, extra=""):
+        pares = [f'{n}="{str(v).replace(chr(34), chr(39))}"' for n, v in zip(nombres, valores)]
+        if extra:
+            pares.append(extra)
+        return "{" + ",".join(pares) + "}"
+
+    def _histogramas(self, lineas, nombre, ayuda, etiquetas, datos):
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+        for clave, h in list(datos.items()):
+            acumulado = 0
+            for limite, conteo in zip(BUCKETS + ("+Inf",), h.conteos):
+                acumulado += conteo
+                le = 'le="%s"' % limite
+                lineas.append(f"{nombre}_bucket{self._etiquetas(etiquetas, clave, le)} {acumulado}")
+            lineas.append(f"{nombre}_sum{self._etiquetas(etiquetas, clave)} {h.suma}")
+            lineas.append(f"{nombre}_count{self._etiquetas(etiquetas, clave)} {h.total}")
+
+    def _contadores(self, lineas, nombre, ayuda, etiquetas, datos):
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} counter"]
+        for clave, valor in list(datos.items()):
+            lineas.append(f"{nombre}{self._etiquetas(etiquetas, clave)} {valor}")
+
+
+metricas = Metricas()
+
+
+class EscuchaComandos(monitoring.CommandListener):
+    """Listener de pymongo que mide cada comando y lo atribuye a la ruta que lo lanzó.
+
+    Los eventos de inicio y fin se emiten en el mismo contexto que la operación,
+    así que la ruta se toma de la ContextVar de la petición. Motor los emite
+    desde sus hilos de trabajo, por eso las escrituras van bajo un lock.
+    """
+
+    def __init__(self):
+        self._en_curso = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        self._en_curso[event.request_id] = (plantilla_ruta(peticion_actual.get()), _coleccion(event))
+
+    def succeeded(self, event):
+        ruta, coleccion = self._en_curso.pop(event.request_id, (plantilla_ruta(peticion_actual.get()), ""))
+        segundos = event.duration_micros / 1e6
+        clave = (ruta, event.command_name, coleccion)
+        documentos, tamano = _documentos(event.reply), _tamano(event.reply)
+        acumulado = mongo_peticion.get()
+        with self._lock:
+            metricas.consultas[clave].observar(segundos)
+            metricas.documentos[clave] += documentos
+            metricas.bytes[clave] += tamano
+            if acumulado is not None:
+                acumulado[0] += segundos
+                acumulado[1] += 1
+
+    def failed(self, event):
+        ruta, _ = self._en_curso.pop(event.request_id, (plantilla_ruta(peticion_actual.get()), ""))
+        with self._lock:
+            metricas.fallos_mongo[(ruta, event.command_name)] += 1
+
+
+def _coleccion(event) -> str:
+    valor = event.command.get(event.command_name)
+    if event.command_name == "getMore":
+        valor = event.command.get("collection")
+    return valor if isinstance(valor, str) else ""
+
+
+def _lote(reply) -> list:
+    cursor = reply.get("cursor")
+    if not cursor:
+        return []
+    return cursor.get("firstBatch") or cursor.get("nextBatch") or []
+
+
+def _documentos(reply) -> int:
+    if reply.get("cursor"):
+        return len(_lote(reply))
+    return int(reply.get("n", 0) or 0)
+
+
+def _tamano(reply) -> int:
+    """Bytes aproximados del lote: tamaño BSON del primer documento por el número de documentos.
+
+    Codificar cada documento de nuevo costaría tanto como decodificarlo.
+    """
+    lote = _lote(reply)
+    if not lote:
+        return 0
+    return len(bson.encode(lote[0])) * len(lote)
+
+
+def plantilla_ruta(scope) -> str:
+    """Ruta con sus parámetros sin sustituir (/api/ventas/{venta_id}) para acotar las etiquetas"""
+    if scope is None:
+        return "sin_ruta"
+    return getattr(scope.get("route"), "path", None) or "sin_ruta"
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI que mide cada petición y añade la cabecera Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        inicio = time.perf_counter()
+        acumulado = [0.0, 0]
+        token_mongo = mongo_peticion.set(acumulado)
+        token_peticion = peticion_actual.set(scope)
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                total_ms = (time.perf_counter() - inicio) * 1000
+                mongo_ms = acumulado[0] * 1000
+                cabeceras = list(mensaje.get("headers", []))
+                cabeceras.append((b"server-timing", (
+                    f"mongo;dur={mongo_ms:.2f};desc=\"{acumulado[1]} consultas\", "
+                    f"app;dur={max(total_ms - mongo_ms, 0):.2f}, total;dur={total_ms:.2f}"
+                ).encode()))
+                mensaje = {**mensaje, "headers": cabeceras}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            metricas.peticiones[(scope["method"], plantilla_ruta(scope), estado)].observar(
+                time.perf_counter() - inicio
+            )
+            peticion_actual.reset(token_peticion)
+            mongo_peticion.reset(token_mongo)
@@ -0,0 +1,127 @@
+import base64
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from bson import ObjectId, json_util
+
+LIMITE_MAXIMO = 1000
+TTL_CONTEO = 30  # segundos
+
+# Tipos que pueden tener los campos de orden, en el orden de BSON. Mientras
+# conviven las dos versiones del esquema, fecha_venta es texto o fecha y _id
+# es ObjectId o binario.
+TIPOS_BSON = (("string", str), ("binData", bytes), ("objectId", ObjectId), ("date", datetime))
+
+
+def codificar_cursor(valores: list) -> str:
+    """Cursor opaco con los valores de ordenamiento del último documento (JSON extendido, conserva los tipos BSON)"""
+    return base64.urlsafe_b64encode(json_util.dumps(valores).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, n_campos: int) -> list:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json_util.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except Exception:
+        # JSON extendido manipulado: json_util lanza KeyError, InvalidId, errores de bson...
+        raise ValueError("Cursor inválido")
+    if not isinstance(valores, list) or len(valores) != n_campos:
+        raise ValueError("Cursor inválido")
+    # Solo los tipos que pueden tener los campos de orden (un $regex, por ejemplo, no)
+    if not all(valor is None or isinstance(valor, tuple(tipo for _, tipo in TIPOS_BSON)) for valor in valores):
+        raise ValueError("Cursor inválido")
+    return valores
+
+
+def mayor_que(campo: str, valor) -> dict:
+    """Condición de valores posteriores en el orden de Mongo.
+
+    $gt solo compara dentro del mismo tipo, así que también se incluyen los
+    tipos que ordenan después del tipo del valor.
+    """
+    tipos = [alias for alias, _ in TIPOS_BSON]
+    posicion = next((i for i, (_, tipo) in enumerate(TIPOS_BSON) if isinstance(valor, tipo)), None)
+    if posicion is None or posicion == len(tipos) - 1:
+        return {campo: {"$gt": valor}}
+    return {"$or": [{campo: {"$gt": valor}}] + [{campo: {"$type": alias}} for alias in tipos[posicion + 1:]]}
+
+
+def filtro_despues_de(orden: List[str], valores: list) -> dict:
+    """Filtro keyset: documentos estrictamente posteriores a valores según orden"""
+    condiciones = []
+    for i, campo in enumerate(orden):
+        condicion = {orden[j]: valores[j] for j in range(i)}
+        condicion.update(mayor_que(campo, valores[i]))
+        condiciones.append(condicion)
+    return condiciones[0] if len(condiciones) == 1 else {"$or": condiciones}
+
+
+def proyeccion(fields: Optional[str], permitidos, orden: List[str]):
+    """Proyección de Mongo; devuelve también los campos pedidos por el cliente.
+
+    Siempre se lee el _id: con él se sabe la versión del documento y es el id
+    de los documentos v2.
+    """
+    if not fields:
+        return None, None
+    pedidos = [f.strip() for f in fields.split(",") if f.strip()]
+    desconocidos = [f for f in pedidos if f not in permitidos]
+    if desconocidos:
+        raise ValueError(f"Campos desconocidos: {', '.join(desconocidos)}")
+    # Los campos de orden siempre se leen para poder construir el cursor
+    return dict.fromkeys(pedidos + orden, 1), set(pedidos)
+
+
+class ConteoEstimado:
+    """Total aproximado de documentos por colección, cacheado unos segundos"""
+
+    def __init__(self, ttl: float = TTL_CONTEO):
+        self.ttl = ttl
+        self._valores = {}
+
+    async def obtener(self, coleccion) -> int:
+        guardado = self._valores.get(coleccion.name)
+        if guardado and time.monotonic() - guardado[1] < self.ttl:
+            return guardado[0]
+        total = await coleccion.estimated_document_count()
+        self._valores[coleccion.name] = (total, time.monotonic())
+        return total
+
+
+conteos = ConteoEstimado()
+
+
+def sin_id(documento: dict) -> dict:
+    return {k: v for k, v in documento.items() if k != "_id"}
+
+
+async def listar_pagina(coleccion, orden: List[str], permitidos, limit: Optional[int] = None,
+                        cursor: Optional[str] = None, fields: Optional[str] = None,
+                        a_api: Optional[Callable[[dict], dict]] = None):
+    """Leer una página ordenada por orden a partir del cursor.
+
+    Devuelve (documentos, siguiente_cursor, total_estimado). Sin limit se
+    devuelve el resto de la colección y no hay siguiente cursor. a_api
+    convierte cada documento a la forma de la API; sin ella solo se quita el _id.
+    """
+    filtro = filtro_despues_de(orden, decodificar_cursor(cursor, len(orden))) if cursor else {}
+    campos, pedidos = proyeccion(fields, permitidos, orden)
+
+    consulta = coleccion.find(filtro, campos).sort([(campo, 1) for campo in orden])
+    if limit:
+        consulta = consulta.limit(limit)
+    documentos = await consulta.to_list(length=None)
+
+    siguiente = None
+    if limit and len(documentos) == limit:
+        siguiente = codificar_cursor([documentos[-1].get(campo) for campo in orden])
+    # Una sola pasada en Python: el _id se lee siempre (versión y cursor) y los v2 hay que convertirlos
+    if a_api is None:
+        a_api = sin_id
+    if pedidos is None:
+        documentos = [a_api(d) for d in documentos]
+    else:
+        documentos = [{k: v for k, v in a_api(d).items() if k in pedidos} for d in documentos]
+
+    return documentos, siguiente, await conteos.obtener(coleccion)
@@ -0,0 +1,109 @@
+from bisect import bisect_right
+from datetime import date
+from fractions import Fraction
+from typing import Optional
+
+import esquema
+
+
+class IndicePublicidad:
+    """Índice de intervalos sobre las campañas de publicidad.
+
+    Cada campaña reparte su valor a partes iguales entre los días de
+    [fecha_inicio, fecha_final]. El gasto diario total es una función escalonada
+    que se guarda como puntos de cambio ordenados con la tasa diaria de cada tramo
+    y el gasto acumulado hasta cada punto. Así el gasto de un rango sale en
+    O(log n) y la serie diaria de k días en O(log n + k).
+    """
+
+    def __init__(self, gastos=()):
+        self.cargado = False
+        self.version = None  # versión de los ETags de gastos con la que se cargó
+        self._campanas = []
+        self.agregar(gastos)
+
+    @staticmethod
+    def _intervalo(gasto: dict):
+        inicio = date.fromisoformat(gasto["fecha_inicio"]).toordinal()
+        final = max(date.fromisoformat(gasto["fecha_final"]).toordinal(), inicio)
+        return inicio, final, Fraction(gasto.get("valor") or 0) / (final - inicio + 1)
+
+    def agregar(self, gastos):
+        """Añadir campañas y reconstruir los tramos.
+
+        Los tramos se acumulan con fracciones exactas para que la tasa vuelva
+        exactamente a cero cuando terminan todas las campañas. Se construyen
+        aparte y se publican juntos: por_dia puede estar leyéndolos en un hilo.
+        """
+        self._campanas.extend(self._intervalo(g) for g in gastos)
+        cambios = {}
+        for inicio, final, tasa in self._campanas:
+            cambios[inicio] = cambios.get(inicio, 0) + tasa
+            cambios[final + 1] = cambios.get(final + 1, 0) - tasa
+
+        puntos, tasas, acumulados = [], [], []
+        tasa = acumulado = 0
+        for punto in sorted(cambios):
+            if puntos:
+                acumulado += tasa * (punto - puntos[-1])
+            tasa += cambios[punto]
+            puntos.append(punto)
+            tasas.append(float(tasa))
+            acumulados.append(float(acumulado))
+        self._tramos = (puntos, tasas, acumulados)
+        self.total_general = float(sum(tasa * (final - inicio + 1) for inicio, final, tasa in self._campanas))
+
+    def _hasta(self, dia: int) -> float:
+        """Gasto acumulado de todos los días anteriores a dia"""
+        puntos, tasas, acumulados = self._tramos
+        i = bisect_right(puntos, dia) - 1
+        if i < 0:
+            return 0
+        return acumulados[i] + tasas[i] * (dia - puntos[i])
+
+    def total(self, fecha_inicio: Optional[date] = None, fecha_final: Optional[date] = None) -> float:
+        """Gasto prorrateado de los días del rango (todo el gasto si no hay rango)"""
+        if not (fecha_inicio and fecha_final):
+            return self.total_general
+        return self._hasta(fecha_final.toordinal() + 1) - self._hasta(fecha_inicio.toordinal())
+
+    def por_dia(self, fecha_inicio: date, fecha_final: date) -> dict:
+        """Gasto de cada día del rango, con clave ISO; los días sin gasto se omiten"""
+        puntos, tasas, _ = self._tramos
+        dia, fin = fecha_inicio.toordinal(), fecha_final.toordinal()
+        i = bisect_right(puntos, dia) - 1
+        serie = {}
+        while dia <= fin:
+            tasa = tasas[i] if i >= 0 else 0
+            siguiente = puntos[i + 1] if i + 1 < len(puntos) else fin + 1
+            hasta = min(siguiente, fin + 1)
+            if tasa:
+                for d in range(dia, hasta):
+                    serie[date.fromordinal(d).isoformat()] = tasa
+            dia = hasta
+            i += 1
+        return serie
+
+    def vigente(self, version) -> bool:
+        return bool(self.cargado) and self.version == version
+
+    async def cargar(self, db, version=None):
+        """Leer todas las campañas de Mongo y reconstruir el índice"""
+        gastos = await db.gastos.find({}, {"valor": 1, "fecha_inicio": 1, "fecha_final": 1}).to_list(length=None)
+        self._campanas = []
+        self.agregar(esquema.a_api("gastos", g) for g in gastos)
+        self.cargado, self.version = True, version
+        return self
+
+    async def actualizar(self, db, version):
+        """Recargar si el índice no se ha leído o los gastos cambiaron de versión desde entonces.
+
+        La versión es la de los ETags (etags.version), leída antes que las
+        campañas: una escritura que llegue entre medias solo provoca otra recarga.
+        """
+        if not self.vigente(version):
+            await self.cargar(db, version)
+        return self
+
+
+indice_publicidad = IndicePublicidad()
@@ -0,0 +1,237 @@
+"""Informes mensuales de pérdidas y ganancias guardados en disco.
+
+Un mes cerrado ya no cambia, así que su informe se calcula una vez y se
+guarda en DIRECTORIO_REPORTES como JSON comprimido con gzip (AAAA-MM.json.gz).
+El informe tiene las métricas del dashboard para el mes (ganancias, pérdidas,
+inversión en publicidad prorrateada, ganancia por producto y series diarias)
+y además la utilidad neta. /api/reportes/{mes} sirve el archivo mapeado en
+memoria: si el cliente acepta gzip se envía tal cual, sin descomprimir.
+
+Un informe solo se vuelve a generar si una escritura tardía toca su mes: la
+actualización de una venta de ese mes o un gasto cuyo rango lo cubre. En ese
+caso el archivo se borra y se regenera en segundo plano. Los informes se
+generan con `python cli.py generar-reportes`, con la tarea periódica
+cerrar_meses o bajo demanda la primera vez que se piden, si el mes está
+entre los que tienen ventas (meses_con_datos).
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import mmap
+import os
+import re
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+
+import orjson
+
+from estadisticas import calcular_estadisticas
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_REPORTES = os.environ.get(
+    "DIRECTORIO_REPORTES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "reportes_mensuales")
+)
+ESPERA_REGENERACION = 2  # segundos para agrupar varias escrituras tardías del mismo mes
+INTERVALO_CIERRE = 3600  # segundos entre revisiones del último mes cerrado
+MAPAS_ABIERTOS = 64
+REINTENTOS_LECTURA = 3  # generaciones que se esperan si el archivo desaparece antes de abrirlo
+
+MES = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+def primer_dia(mes: str) -> date:
+    """Primer día de un mes AAAA-MM (ValueError si el formato no es válido)"""
+    if not MES.match(mes):
+        raise ValueError(mes)
+    return date.fromisoformat(f"{mes}-01")
+
+
+def ultimo_dia(mes: str) -> date:
+    """Último día de un mes AAAA-MM (ValueError también para 9999-12, que no tiene mes siguiente)"""
+    inicio = primer_dia(mes)
+    try:
+        return (inicio.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    except OverflowError:
+        raise ValueError(mes)
+
+
+def cerrado(mes: str, hoy: date = None) -> bool:
+    return ultimo_dia(mes) < (hoy or date.today())
+
+
+def ultimo_cerrado(hoy: date = None) -> str:
+    return ((hoy or date.today()).replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+
+
+def meses_entre(inicio: str, final: str) -> list:
+    """Meses AAAA-MM que cubre el rango de fechas ISO, ambos incluidos"""
+    actual, fin = primer_dia(inicio[:7]), primer_dia(max(inicio, final)[:7])
+    meses = []
+    while actual <= fin:
+        meses.append(actual.strftime("%Y-%m"))
+        actual = (actual + timedelta(days=32)).replace(day=1)
+    return meses
+
+
+def ruta(mes: str, directorio: str = None) -> str:
+    return os.path.join(directorio or DIRECTORIO_REPORTES, f"{mes}.json.gz")
+
+
+async def calcular(db, mes: str) -> dict:
+    """Informe del mes con los mismos campos que el dashboard más la utilidad neta"""
+    estadisticas = await calcular_estadisticas(db, primer_dia(mes), ultimo_dia(mes), "dia")
+    return {
+        "mes": mes,
+        "generado": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **estadisticas,
+        "utilidad_neta": estadisticas["ganancias_totales"] - estadisticas["perdidas_totales"]
+        - estadisticas["inversion_publicidad"],
+    }
+
+
+def escribir(mes: str, informe: dict, directorio: str = None) -> str:
+    """Guardar el informe de forma atómica: se escribe un temporal y se renombra"""
+    destino = ruta(mes, directorio)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = f"{destino}.{os.getpid()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(gzip.compress(orjson.dumps(informe), compresslevel=9, mtime=0))
+    os.replace(temporal, destino)
+    return destino
+
+
+class Instantanea:
+    """Archivo de un informe mapeado en memoria"""
+
+    __slots__ = ("clave", "mapa", "etag")
+
+    def __init__(self, clave: tuple, mapa: mmap.mmap):
+        self.clave = clave
+        self.mapa = mapa
+        self.etag = '"%s"' % hashlib.blake2b(mapa, digest_size=12).hexdigest()
+
+    def comprimido(self) -> bytes:
+        return self.mapa[:]
+
+    def json(self) -> bytes:
+        return gzip.decompress(self.mapa)
+
+
+class Instantaneas:
+    """Mapas en memoria de los informes en disco, reabiertos si el archivo cambia"""
+
+    def __init__(self, directorio: str = None, maximo: int = MAPAS_ABIERTOS):
+        self.directorio = directorio
+        self.maximo = maximo
+        self._abiertas = OrderedDict()  # mes -> Instantanea
+
+    def abrir(self, mes: str):
+        """Instantánea del mes, o None si no hay archivo"""
+        try:
+            estado = os.stat(ruta(mes, self.directorio))
+        except FileNotFoundError:
+            self.cerrar(mes)
+            return None
+        clave = (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+        instantanea = self._abiertas.get(mes)
+        if instantanea is None or instantanea.clave != clave:
+            self.cerrar(mes)
+            with open(ruta(mes, self.directorio), "rb") as f:
+                instantanea = Instantanea(clave, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            self._abiertas[mes] = instantanea
+            while len(self._abiertas) > self.maximo:
+                self._abiertas.popitem(last=False)[1].mapa.close()
+        self._abiertas.move_to_end(mes)
+        return instantanea
+
+    def cerrar(self, mes: str):
+        instantanea = self._abiertas.pop(mes, None)
+        if instantanea:
+            instantanea.mapa.close()
+
+
+class Generador:
+    """Generación de informes con una sola tarea por mes y descarte de los que quedan viejos.
+
+    Cada escritura tardía incrementa la versión del mes; un informe que se
+    estaba calculando cuando cambió su versión no se guarda y se recalcula.
+    """
+
+    def __init__(self, directorio: str = None, espera: float = ESPERA_REGENERACION):
+        self.directorio = directorio
+        self.espera = espera
+        self._en_curso = {}  # mes -> Task
+        self._version = {}  # mes -> escrituras tardías vistas
+
+    async def _generar(self, db, mes: str, espera: float = 0):
+        try:
+            if espera:
+                await asyncio.sleep(espera)
+            while True:
+                version = self._version.get(mes, 0)
+                informe = await calcular(db, mes)
+                if version != self._version.get(mes, 0):
+                    continue
+                await asyncio.to_thread(escribir, mes, informe, self.directorio)
+                # Una escritura tardía durante la escritura del archivo también lo deja viejo
+                if version == self._version.get(mes, 0):
+                    break
+            logger.info("Informe de %s generado", mes)
+        finally:
+            self._en_curso.pop(mes, None)
+
+    def asegurar(self, db, mes: str, espera: float = 0) -> asyncio.Task:
+        """Tarea que genera el informe del mes; si ya hay una en curso se reutiliza"""
+        tarea = self._en_curso.get(mes)
+        if tarea is None:
+            tarea = asyncio.create_task(self._generar(db, mes, espera))
+            self._en_curso[mes] = tarea
+        return tarea
+
+    def invalidar(self, db, meses):
+        """Escritura tardía en meses cerrados: se borra su informe y se regenera si existía"""
+        for mes in set(meses):
+            if not cerrado(mes):
+                continue
+            self._version[mes] = self._version.get(mes, 0) + 1
+            try:
+                os.remove(ruta(mes, self.directorio))
+            except FileNotFoundError:
+                if mes not in self._en_curso:
+                    continue
+            self.asegurar(db, mes, self.espera)
+
+    async def generar(self, db, meses, forzar: bool = False) -> list:
+        """Generar los informes de los meses cerrados indicados que falten (o todos con forzar)"""
+        generados = []
+        for mes in meses:
+            if cerrado(mes) and (forzar or not os.path.exists(ruta(mes, self.directorio))):
+                await asyncio.shield(self.asegurar(db, mes))
+                generados.append(mes)
+        return generados
+
+
+async def meses_con_datos(db) -> list:
+    """Meses cerrados desde la primera fila del resumen diario"""
+    primera = await db.ventas_diarias.find({}, {"fecha": 1}).sort("fecha", 1).limit(1).to_list(length=1)
+    if not primera:
+        return []
+    return meses_entre(primera[0]["fecha"], ultimo_cerrado() + "-01")
+
+
+async def cerrar_meses(db, generador: "Generador", intervalo: float = INTERVALO_CIERRE):
+    """Tarea de fondo: generar el informe del último mes cerrado en cuanto existe"""
+    while True:
+        try:
+            await generador.generar(db, [ultimo_cerrado()])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("No se pudo generar el informe de %s", ultimo_cerrado())
+        await asyncio.sleep(intervalo)
+
+
+instantaneas = Instantaneas()
+generador = Generador()
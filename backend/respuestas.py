@@ -0,0 +1,32 @@
+"""Serialización JSON de las respuestas con orjson.
+
+Las respuestas que los endpoints construyen con RespuestaJSON no se validan
+contra su response_model, que queda solo como esquema de OpenAPI: quien
+calcula los datos garantiza los tipos declarados (estadisticas.componer
+convierte los conteos a int) y los tests comprueban las respuestas contra los
+modelos.
+"""
+import orjson
+from starlette.responses import Response
+
+
+def serializar(contenido) -> bytes:
+    """JSON con orjson; los documentos ya tienen la forma de la API (esquema.a_api quita el _id)"""
+    return orjson.dumps(contenido, option=orjson.OPT_NON_STR_KEYS)
+
+
+class RespuestaJSON(Response):
+    """Respuesta JSON con orjson que acepta también cuerpos ya serializados.
+
+    Los endpoints calientes la devuelven directamente: FastAPI no pasa entonces
+    el contenido por jsonable_encoder ni por la validación del response_model
+    (los tipos son responsabilidad del endpoint), y la cache puede guardar los
+    bytes en lugar de volver a serializar en cada acierto.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return serializar(content)
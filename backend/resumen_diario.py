@@ -0,0 +1,201 @@
+import logging
+from collections import defaultdict
+from datetime import date
+
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import esquema
+import etags
+from bloqueos import anotar, bloqueo, marcar_terminada, terminada
+from columnar import clave_orden
+
+logger = logging.getLogger(__name__)
+
+# Filas por (fecha, producto) con lo entregado, devuelto y perdido ese día.
+# La inversión en publicidad no se resume aquí: la prorratea publicidad.IndicePublicidad.
+COLECCION = "ventas_diarias"
+BLOQUEO = "reconstruir_" + COLECCION
+
+
+def aporte_venta(venta: dict) -> dict:
+    """Contribución de una venta a su fila del resumen según su estado de entrega"""
+    if venta.get("entregado") is True:
+        return {"entregados": 1, "ganancia": venta.get("ganancia") or 0}
+    if venta.get("entregado") is False:
+        return {"devueltos": 1, "perdidas": venta.get("valor_perdida") or 0}
+    return {}
+
+
+def operaciones_ventas(cambios):
+    """Operaciones $inc para una lista de (venta, signo).
+
+    Un cambio de estado se expresa como (venta_anterior, -1), (venta_nueva, 1);
+    las contribuciones de la misma fila se combinan antes de escribir. Los
+    contadores empiezan en int para que Mongo no los guarde como double.
+    """
+    incrementos = defaultdict(lambda: defaultdict(int))
+    orden = {}
+    for venta, signo in cambios:
+        clave = (venta["fecha_venta"], venta["producto"])
+        aporte = aporte_venta(venta)
+        for campo, valor in aporte.items():
+            incrementos[clave][campo] += signo * valor
+        # El _id de la primera venta entregada conserva el orden de aparición de los productos
+        if signo > 0 and "entregados" in aporte and venta.get("_id") is not None:
+            orden[clave] = min(orden.get(clave, venta["_id"]), venta["_id"])
+
+    operaciones = []
+    for (fecha, producto), campos in incrementos.items():
+        inc = {campo: valor for campo, valor in campos.items() if valor}
+        if not inc and (fecha, producto) not in orden:
+            continue
+        actualizacion = {"$inc": inc} if inc else {}
+        if (fecha, producto) in orden:
+            actualizacion["$min"] = {"orden": orden[(fecha, producto)]}
+        operaciones.append(UpdateOne({"fecha": fecha, "producto": producto}, actualizacion, upsert=True))
+    return operaciones
+
+
+async def escribir(db, operaciones, coleccion: str = COLECCION):
+    """Aplicar las operaciones reintentando una vez las que chocaron al hacer upsert"""
+    if not operaciones:
+        return
+    try:
+        await db[coleccion].bulk_write(operaciones, ordered=False)
+    except BulkWriteError as e:
+        # Dos upserts concurrentes de la misma fila: el segundo falla con clave duplicada
+        fallidas = [operaciones[err["index"]] for err in e.details.get("writeErrors", []) if err.get("code") == 11000]
+        if len(fallidas) != len(e.details.get("writeErrors", [])):
+            raise
+        await db[coleccion].bulk_write(fallidas, ordered=False)
+
+
+async def registrar_ventas(db, cambios):
+    """Actualizar el resumen con una lista de (venta, signo).
+
+    Mientras alguien lo reconstruye, los incrementos se perderían al reemplazar
+    la colección: las filas afectadas se anotan en su bloqueo y las recalcula
+    él desde las ventas antes de soltarlo.
+    """
+    cambios = list(cambios)
+    if await anotar(db, BLOQUEO, claves(cambios)):
+        return
+    await escribir(db, operaciones_ventas(cambios))
+
+
+def claves(cambios) -> list:
+    """Filas (fecha, producto) que tocan los cambios, sin repetir"""
+    return [
+        {"fecha": fecha, "producto": producto}
+        for fecha, producto in dict.fromkeys((venta["fecha_venta"], venta["producto"]) for venta, _ in cambios)
+    ]
+
+
+def pipeline_reconstruccion(version: int, filtro: dict = None):
+    """Filas del resumen agregadas desde las ventas de una versión del esquema"""
+    entregado = {"$eq": ["$entregado", True]}
+    devuelto = {"$eq": ["$entregado", False]}
+    return [
+        {"$match": {**esquema.filtro_version(version), "entregado": {"$in": [True, False]}, **(filtro or {})}},
+        {"$group": {
+            "_id": {"fecha": esquema.expresion_fecha("fecha_venta", version), "producto": "$producto"},
+            "entregados": {"$sum": {"$cond": [entregado, 1, 0]}},
+            "ganancia": {"$sum": {"$cond": [entregado, "$ganancia", 0]}},
+            "devueltos": {"$sum": {"$cond": [devuelto, 1, 0]}},
+            "perdidas": {"$sum": {"$cond": [devuelto, {"$ifNull": ["$valor_perdida", 0]}, 0]}},
+            "orden": {"$min": {"$cond": [entregado, "$_id", None]}},
+        }},
+    ]
+
+
+async def _agregar(db, filtro_version=lambda version: None) -> dict:
+    """Filas por (fecha, producto) desde las ventas de las dos versiones del esquema"""
+    por_fila = {}
+    for version in esquema.VERSIONES:
+        async for grupo in db.ventas.aggregate(pipeline_reconstruccion(version, filtro_version(version))):
+            clave = (grupo["_id"]["fecha"], grupo["_id"]["producto"])
+            fila = por_fila.setdefault(clave, {"fecha": clave[0], "producto": clave[1]})
+            for campo in ("entregados", "devueltos"):
+                fila[campo] = fila.get(campo, 0) + grupo[campo]
+            for campo in ("ganancia", "perdidas"):
+                fila[campo] = fila.get(campo, 0) + esquema.a_unidades(grupo[campo], version)
+            if grupo.get("orden") is not None:
+                fila["orden"] = min(fila.get("orden", grupo["orden"]), grupo["orden"], key=clave_orden)
+    return por_fila
+
+
+async def recalcular(db, filas: list):
+    """Volver a calcular desde las ventas las filas {fecha, producto} indicadas.
+
+    Solo es exacto si nadie incrementa esas filas a la vez: lo llama quien
+    tiene el bloqueo, mientras las escrituras anotan en lugar de incrementar.
+    """
+    pendientes = {(f["fecha"], f["producto"]) for f in filas}
+
+    def filtro_version(version):
+        return {"$or": [
+            {**esquema.rango_fechas("fecha_venta", date.fromisoformat(fecha), date.fromisoformat(fecha), version),
+             "producto": producto}
+            for fecha, producto in pendientes
+        ]}
+
+    por_fila = await _agregar(db, filtro_version)
+    await db[COLECCION].bulk_write([
+        ReplaceOne({"fecha": fecha, "producto": producto}, por_fila[(fecha, producto)], upsert=True)
+        if (fecha, producto) in por_fila else DeleteOne({"fecha": fecha, "producto": producto})
+        for fecha, producto in pendientes
+    ], ordered=False)
+    await etags.incrementar(db, [COLECCION])
+    logger.info("Resumen diario: %d filas recalculadas tras la reconstrucción", len(pendientes))
+
+
+def _bloqueo(db):
+    return bloqueo(db, BLOQUEO, atender=lambda filas: recalcular(db, filas))
+
+
+async def reconstruir(db, tamano_lote: int = 1000):
+    """Recalcular el resumen completo desde las ventas.
+
+    Se construye en una colección temporal que luego reemplaza a la actual,
+    así el dashboard nunca ve el resumen a medio construir. Las ventas de cada
+    versión del esquema se agregan por separado y se combinan por fila. Los
+    workers y la CLI usan la misma colección temporal, así que se turnan con
+    un bloqueo; las filas que otros modificaron mientras tanto se recalculan
+    antes de soltarlo.
+    """
+    async with _bloqueo(db):
+        return await _reconstruir(db, tamano_lote)
+
+
+async def _reconstruir(db, tamano_lote: int = 1000):
+    filas = list((await _agregar(db)).values())
+    temporal = db[COLECCION + "_tmp"]
+    await temporal.drop()
+    for i in range(0, len(filas), tamano_lote):
+        await temporal.bulk_write([InsertOne(f) for f in filas[i:i + tamano_lote]], ordered=False)
+    if filas:
+        await temporal.create_index([("fecha", 1), ("producto", 1)], name="fecha_producto", unique=True)
+        await temporal.rename(COLECCION, dropTarget=True)
+    else:
+        await db[COLECCION].delete_many({})
+    await marcar_terminada(db, BLOQUEO)
+    # El dashboard lee el resumen: sin escribir ventas, sus ETags tienen que cambiar igual
+    await etags.incrementar(db, [COLECCION])
+    logger.info("Resumen diario reconstruido con %d filas", len(filas))
+    return len(filas)
+
+
+async def asegurar_resumen(db):
+    """Reconstruir el resumen si nunca se ha completado una reconstrucción (primer arranque).
+
+    No se deduce de que esté vacío: el worker ya acepta escrituras mientras se
+    prepara y una sola venta crearía su fila. Si varios workers arrancan a la
+    vez, el primero que toma el bloqueo lo reconstruye y los demás encuentran
+    la marca al obtenerlo.
+    """
+    if await terminada(db, BLOQUEO):
+        return
+    async with _bloqueo(db):
+        if not await terminada(db, BLOQUEO):
+            await _reconstruir(db)
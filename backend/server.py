@@ -1,31 +1,83 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, date
+import asyncio
+from contextlib import asynccontextmanager
+import logging
 import os
-import uuid
-from motor.motor_asyncio import AsyncIOMotorClient
 import pymongo
 
+from conexion import cliente_mongo
+from datos_demo import sembrar_demo
+import busqueda
+from compresion import MiddlewareCompresion, aceptadas
+from concurrencia import MiddlewareLimites, limitadores
+import esquema
+import etags
+from estadisticas import (
+    GRANULARIDADES, MAXIMO_DIAS, MOTORES, calcular_estadisticas, filtro_fechas_ventas, limites_del_periodo
+)
+from eventos import bus, escuchar_cambios, flujo, sin_id_mongo
+from exportacion import con_nombre_cliente, exportar_ventas
+from importacion import importar
+from indices import asegurar_indices, explicar_consultas
+from metricas import EscuchaComandos, MiddlewareMetricas, metricas
+from paginacion import LIMITE_MAXIMO, listar_pagina
+from publicidad import indice_publicidad
+import reportes
+from respuestas import RespuestaJSON, serializar
+import resumen_diario
+import analitica
+from cache import cache, nombres_clientes
+
 # Configuración
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.environ.get("DB_NAME", "control_gastos")
+# Actualizaciones de estado de un manifiesto que se envían a Mongo a la vez
+LOTE_ESTADOS = int(os.environ.get("LOTE_ESTADOS", "50"))
+
+logger = logging.getLogger(__name__)
 
-# Inicializar MongoDB
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# Cliente de MongoDB: cada worker crea el suyo en el lifespan
+client = None
+db = None
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    """Crear el pool de Mongo del worker, prepararlo en segundo plano y escuchar el change stream si lo hay"""
+    global client, db
+    client = cliente_mongo(MONGO_URL, escuchas=[EscuchaComandos()])
+    db = client[DB_NAME]
+    tareas = [
+        asyncio.create_task(preparar()),
+        # Las escrituras de otros workers también liberan las entradas afectadas de la cache
+        asyncio.create_task(escuchar_cambios(db, bus, al_cambiar=cache.invalidar)),
+        asyncio.create_task(reportes.cerrar_meses(db, reportes.generador)),
+    ]
+    try:
+        yield
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        client.close()
+
+app = FastAPI(lifespan=lifespan, default_response_class=RespuestaJSON)
 
-# CORS
+# De dentro afuera: compresión, límites de concurrencia, CORS (también en los 429/503) y métricas
+app.add_middleware(MiddlewareCompresion)
+app.add_middleware(MiddlewareLimites)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "Server-Timing", "ETag"],
 )
+app.add_middleware(MiddlewareMetricas)
 
 # Modelos Pydantic
 class Cliente(BaseModel):
@@ -50,6 +102,9 @@ class VentaUpdate(BaseModel):
     entregado: Optional[bool] = None
     valor_perdida: Optional[float] = 0
 
+class VentaEstado(VentaUpdate):
+    id: str
+
 class Gasto(BaseModel):
     id: Optional[str] = None
     concepto: str
@@ -65,98 +120,40 @@ class EstadisticasResponse(BaseModel):
     productos_devueltos: int
     ventas_por_dia: List[dict]
     ganancias_por_producto: List[dict]
+    inversion_por_dia: List[dict] = []
 
-# Datos simulados para demo
-async def crear_datos_demo():
-    """Crear datos de demostración si no existen"""
-    # Verificar si ya hay datos
-    ventas_count = await db.ventas.count_documents({})
-    if ventas_count > 0:
-        return
-    
-    # Clientes demo
-    clientes_demo = [
-        {"id": str(uuid.uuid4()), "nombre": "Juan", "apellidos": "Pérez", "telefono": "3001234567"},
-        {"id": str(uuid.uuid4()), "nombre": "María", "apellidos": "González", "telefono": "3007654321"},
-        {"id": str(uuid.uuid4()), "nombre": "Carlos", "apellidos": "Rodríguez", "telefono": "3009876543"},
-        {"id": str(uuid.uuid4()), "nombre": "Ana", "apellidos": "Martínez", "telefono": "3005555555"}
-    ]
-    
-    for cliente in clientes_demo:
-        await db.clientes.insert_one(cliente)
-    
-    # Ventas demo (últimos 30 días)
-    from datetime import datetime, timedelta
-    import random
-    
-    productos = ["Producto A", "Producto B", "Producto C", "Producto D", "Producto E"]
-    
-    ventas_demo = []
-    for i in range(30):  # 30 ventas de ejemplo
-        fecha_venta = datetime.now().date() - timedelta(days=random.randint(0, 30))
-        
-        valor_venta = round(random.uniform(50000, 500000), 2)
-        ganancia = round(valor_venta * random.uniform(0.2, 0.4), 2)
-        
-        # 40% pendientes (null), 40% entregados (True), 20% devueltos (False)
-        estado_random = random.choice([None, None, None, None, True, True, True, True, False, False])
-        
-        fecha_entrega = None
-        valor_perdida = 0
-        
-        if estado_random is not None:  # Si no está pendiente
-            fecha_entrega = fecha_venta + timedelta(days=random.randint(1, 7))
-            if estado_random == False:  # Si fue devuelto
-                valor_perdida = round(random.uniform(10000, 50000), 2)
-        
-        venta = {
-            "id": str(uuid.uuid4()),
-            "cliente_id": random.choice(clientes_demo)["id"],
-            "producto": random.choice(productos),
-            "fecha_venta": fecha_venta.isoformat(),
-            "fecha_entrega": fecha_entrega.isoformat() if fecha_entrega else None,
-            "valor_venta": valor_venta,
-            "ganancia": ganancia,
-            "entregado": estado_random,
-            "valor_perdida": valor_perdida
-        }
-        ventas_demo.append(venta)
-    
-    for venta in ventas_demo:
-        await db.ventas.insert_one(venta)
-    
-    # Gastos de publicidad demo
-    gastos_demo = [
-        {
-            "id": str(uuid.uuid4()),
-            "concepto": "Facebook Ads",
-            "valor": 200000,
-            "fecha_inicio": (datetime.now().date() - timedelta(days=20)).isoformat(),
-            "fecha_final": (datetime.now().date() - timedelta(days=13)).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "concepto": "Google Ads",
-            "valor": 150000,
-            "fecha_inicio": (datetime.now().date() - timedelta(days=15)).isoformat(),
-            "fecha_final": (datetime.now().date() - timedelta(days=8)).isoformat()
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "concepto": "Instagram Promoción",
-            "valor": 80000,
-            "fecha_inicio": (datetime.now().date() - timedelta(days=10)).isoformat(),
-            "fecha_final": (datetime.now().date() - timedelta(days=3)).isoformat()
-        }
-    ]
-    
-    for gasto in gastos_demo:
-        await db.gastos.insert_one(gasto)
+class ReporteMensual(EstadisticasResponse):
+    mes: str
+    generado: str
+    utilidad_neta: float
+
+# Arranque
+SEED_DEMO = os.environ.get("SEED_DEMO", "").lower() in ("1", "true", "si", "yes")
+arranque = {"listo": False, "error": None}
+REINTENTO_INICIAL = 1  # segundos; se duplica en cada fallo
+REINTENTO_MAXIMO = 30
 
-@app.on_event("startup")
-async def startup_event():
-    """Inicializar datos demo al arrancar"""
-    await crear_datos_demo()
+async def preparar():
+    """Conectar con Mongo y revisar los índices a la vez; sembrar demo solo si se pidió.
+    
+    Si Mongo no responde se reintenta con espera exponencial (hasta
+    REINTENTO_MAXIMO segundos entre intentos) hasta que el worker quede listo.
+    """
+    espera = REINTENTO_INICIAL
+    while True:
+        try:
+            await asyncio.gather(db.command("ping"), asegurar_indices(db))
+            if SEED_DEMO:
+                await sembrar_demo(db)
+            await asyncio.gather(resumen_diario.asegurar_resumen(db), analitica.asegurar_contadores(db))
+            await busqueda.indexar(db)
+            arranque["listo"], arranque["error"] = True, None
+            return
+        except Exception as e:
+            logger.exception("Fallo al preparar el worker; nuevo intento en %s s", espera)
+            arranque["error"] = str(e)
+        await asyncio.sleep(espera)
+        espera = min(espera * 2, REINTENTO_MAXIMO)
 
 # Endpoints
 
@@ -164,123 +161,129 @@ async def startup_event():
 async def root():
     return {"message": "Sistema de Control de Gastos y Ganancias API"}
 
+@app.get("/api/ready")
+async def readiness():
+    """503 mientras el worker arranca o si Mongo no responde"""
+    if not arranque["listo"]:
+        return RespuestaJSON({"listo": False, "error": arranque["error"]}, status_code=503)
+    try:
+        await db.command("ping")
+    except Exception as e:
+        return RespuestaJSON({"listo": False, "error": str(e)}, status_code=503)
+    return {"listo": True}
+
+def parsear_rango(fecha_inicio: Optional[str], fecha_final: Optional[str]):
+    """Validar el rango de fechas opcional de los filtros"""
+    if not (fecha_inicio and fecha_final):
+        return None, None
+    try:
+        return datetime.fromisoformat(fecha_inicio).date(), datetime.fromisoformat(fecha_final).date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+
+async def revalidar(request: Request, clave: tuple, etiquetas):
+    """ETag de la respuesta, clave de cache con la versión de los datos y el 304 si el cliente ya la tiene"""
+    version = await etags.version(db, etiquetas)
+    etag = etags.calcular(clave, version)
+    clave = clave + (("version", version),)
+    if etags.coincide(request.headers.get("if-none-match"), etag):
+        return etag, clave, Response(status_code=304, headers=etags.cabeceras(etag))
+    return etag, clave, None
+
+async def registrar_escritura(*colecciones):
+    """Tras una escritura: invalidar la cache del worker y subir la versión compartida de los ETags"""
+    cache.invalidar(*colecciones)
+    await etags.incrementar(db, colecciones)
+
 @app.get("/api/dashboard", response_model=EstadisticasResponse)
-async def get_dashboard(fecha_inicio: Optional[str] = None, fecha_final: Optional[str] = None):
+async def get_dashboard(
+    request: Request,
+    fecha_inicio: Optional[str] = None,
+    fecha_final: Optional[str] = None,
+    granularidad: str = "dia",
+    motor: Optional[str] = None
+):
     """Obtener estadísticas del dashboard con filtros opcionales de fecha"""
-    from datetime import datetime, timedelta
+    if granularidad not in GRANULARIDADES:
+        raise HTTPException(status_code=400, detail="Granularidad inválida. Use dia, semana o mes")
+    if motor is not None and motor not in MOTORES:
+        raise HTTPException(status_code=400, detail="Motor inválido. Use mongo o columnar")
     
-    # Configurar filtros de fecha
-    filtro_fecha = {}
-    if fecha_inicio and fecha_final:
-        try:
-            fecha_inicio_dt = datetime.fromisoformat(fecha_inicio).date()
-            fecha_final_dt = datetime.fromisoformat(fecha_final).date()
-            filtro_fecha = {
-                "fecha_venta": {
-                    "$gte": fecha_inicio_dt.isoformat(),
-                    "$lte": fecha_final_dt.isoformat()
-                }
-            }
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
-    
-    # Obtener ventas con filtro de fecha
-    ventas = await db.ventas.find(filtro_fecha).to_list(length=None)
-    
-    # Obtener gastos con filtro de fecha (si aplica)
-    filtro_gastos = {}
-    if fecha_inicio and fecha_final:
-        try:
-            filtro_gastos = {
-                "$or": [
-                    {
-                        "fecha_inicio": {
-                            "$gte": fecha_inicio_dt.isoformat(),
-                            "$lte": fecha_final_dt.isoformat()
-                        }
-                    },
-                    {
-                        "fecha_final": {
-                            "$gte": fecha_inicio_dt.isoformat(),
-                            "$lte": fecha_final_dt.isoformat()
-                        }
-                    }
-                ]
-            }
-        except:
-            pass
-    
-    gastos = await db.gastos.find(filtro_gastos).to_list(length=None)
-    
-    # Calcular métricas
-    ganancias_totales = sum(v["ganancia"] for v in ventas if v.get("entregado") == True)
-    perdidas_totales = sum(v.get("valor_perdida", 0) for v in ventas if v.get("entregado") == False)
-    inversion_publicidad = sum(g["valor"] for g in gastos)
-    productos_vendidos = len([v for v in ventas if v.get("entregado") == True])
-    productos_devueltos = len([v for v in ventas if v.get("entregado") == False])
-    
-    # Ventas por día (últimos 7 días o período seleccionado)
-    ventas_por_dia = []
-    if fecha_inicio and fecha_final:
-        # Usar rango seleccionado
-        current_date = fecha_inicio_dt
-        while current_date <= fecha_final_dt:
-            ventas_dia = len([v for v in ventas if v["fecha_venta"] == current_date.isoformat() and v.get("entregado") == True])
-            ventas_por_dia.append({
-                "fecha": current_date.isoformat(),
-                "ventas": ventas_dia
-            })
-            current_date += timedelta(days=1)
-    else:
-        # Últimos 7 días por defecto
-        for i in range(7):
-            fecha = datetime.now().date() - timedelta(days=i)
-            ventas_dia = len([v for v in ventas if v["fecha_venta"] == fecha.isoformat() and v.get("entregado") == True])
-            ventas_por_dia.append({
-                "fecha": fecha.isoformat(),
-                "ventas": ventas_dia
-            })
-        ventas_por_dia.reverse()
-    
-    # Ganancias por producto
-    productos = {}
-    for venta in ventas:
-        if venta.get("entregado") == True:
-            if venta["producto"] not in productos:
-                productos[venta["producto"]] = 0
-            productos[venta["producto"]] += venta["ganancia"]
+    fecha_inicio_dt, fecha_final_dt = parsear_rango(fecha_inicio, fecha_final)
+    if fecha_inicio_dt and (fecha_final_dt - fecha_inicio_dt).days >= MAXIMO_DIAS:
+        raise HTTPException(status_code=400, detail=f"Rango demasiado amplio. Máximo {MAXIMO_DIAS} días")
+    # Sin rango la serie son los últimos 7 días: la clave (y el ETag) lleva los días
+    # resueltos para que a medianoche no se siga dando por buena la ventana de ayer
+    inicio, final = limites_del_periodo(fecha_inicio_dt, fecha_final_dt)
+    clave = cache.clave(
+        "dashboard",
+        fecha_inicio=inicio.isoformat(),
+        fecha_final=final.isoformat(),
+        rango=fecha_inicio_dt is not None,
+        granularidad=granularidad,
+        motor=motor
+    )
+    # El cuerpo sale del resumen diario, que las reconstrucciones cambian sin escribir ventas
+    etiquetas = ("ventas", "gastos", resumen_diario.COLECCION)
+    etag, clave, no_modificado = await revalidar(request, clave, etiquetas)
+    if no_modificado:
+        return no_modificado
     
-    ganancias_por_producto = [
-        {"producto": k, "ganancia": v} for k, v in productos.items()
-    ]
+    # La versión de los gastos que acompaña a la clave decide si el índice de publicidad está al día
+    version_gastos = dict(zip(etiquetas, clave[-1][1]))["gastos"]
+
+    async def calcular():
+        indice = await indice_publicidad.actualizar(db, version_gastos)
+        return serializar(await calcular_estadisticas(
+            db, fecha_inicio_dt, fecha_final_dt, granularidad, indice=indice, motor=motor
+        ))
     
-    return EstadisticasResponse(
-        ganancias_totales=ganancias_totales,
-        perdidas_totales=perdidas_totales,
-        inversion_publicidad=inversion_publicidad,
-        productos_vendidos=productos_vendidos,
-        productos_devueltos=productos_devueltos,
-        ventas_por_dia=ventas_por_dia,
-        ganancias_por_producto=ganancias_por_producto
-    )
+    # Datos calculados aquí mismo: EstadisticasResponse solo documenta el esquema, no se valida
+    return RespuestaJSON(await cache.obtener(clave, etiquetas, calcular), headers=etags.cabeceras(etag))
+
+def documento_venta(venta: Venta) -> dict:
+    """Documento de Mongo para una venta nueva, con id, en la versión de esquema configurada"""
+    venta.id = esquema.nuevo_id()
+    return esquema.documento("ventas", venta.dict())
+
+def documento_cliente(cliente: Cliente) -> dict:
+    """Documento de Mongo para un cliente nuevo"""
+    cliente.id = esquema.nuevo_id()
+    return esquema.documento("clientes", cliente.dict())
+
+def documento_gasto(gasto: Gasto) -> dict:
+    """Documento de Mongo para un gasto nuevo, con id, en la versión de esquema configurada"""
+    gasto.id = esquema.nuevo_id()
+    return esquema.documento("gastos", gasto.dict())
+
+async def registrar_ventas(cambios):
+    """Llevar una lista de (venta, signo) al resumen diario, a los contadores de analítica y a los informes"""
+    await asyncio.gather(resumen_diario.registrar_ventas(db, cambios), analitica.registrar_ventas(db, cambios))
+    reportes.generador.invalidar(db, (venta["fecha_venta"][:7] for venta, _ in cambios))
+
+async def registrar_gastos(gastos):
+    """Llevar gastos nuevos (con la forma de la API) al índice de publicidad y a los informes"""
+    indice_publicidad.agregar(gastos)
+    reportes.generador.invalidar(db, (
+        mes for gasto in gastos for mes in reportes.meses_entre(gasto["fecha_inicio"], gasto["fecha_final"])
+    ))
 
 @app.post("/api/ventas")
 async def crear_venta(venta: Venta):
     """Crear nueva venta (inicialmente sin estado de entrega)"""
-    venta.id = str(uuid.uuid4())
-    venta_dict = venta.dict()
-    venta_dict["fecha_venta"] = venta.fecha_venta.isoformat()
-    if venta.fecha_entrega:
-        venta_dict["fecha_entrega"] = venta.fecha_entrega.isoformat()
+    venta_dict = documento_venta(venta)
     
     result = await db.ventas.insert_one(venta_dict)
     if result.inserted_id:
+        venta_dict = esquema.a_api("ventas", venta_dict, conservar_id=True)
+        await registrar_ventas([(venta_dict, 1)])
+        await registrar_escritura("ventas")
+        bus.escritura("venta_creada", {"venta": sin_id_mongo(venta_dict)})
         return {"message": "Venta creada exitosamente", "id": venta.id}
     raise HTTPException(status_code=400, detail="Error al crear venta")
 
-@app.put("/api/ventas/{venta_id}")
-async def actualizar_venta(venta_id: str, venta_update: VentaUpdate):
-    """Actualizar estado de entrega de una venta"""
+def cambios_venta(venta_update: VentaUpdate) -> dict:
+    """Campos a modificar en Mongo para una actualización de estado"""
     update_dict = {}
     
     if venta_update.fecha_entrega:
@@ -292,85 +295,380 @@ async def actualizar_venta(venta_id: str, venta_update: VentaUpdate):
     if venta_update.valor_perdida is not None:
         update_dict["valor_perdida"] = venta_update.valor_perdida
     
-    result = await db.ventas.update_one(
-        {"id": venta_id}, 
-        {"$set": update_dict}
-    )
+    return update_dict
+
+@app.put("/api/ventas/estado")
+async def actualizar_estados(actualizaciones: List[VentaEstado]):
+    """Actualizar en lote el estado de entrega de varias ventas.
+    
+    Es idempotente: reenviar el mismo manifiesto no vuelve a modificar nada.
+    Si un id aparece varias veces se aplica la última entrada.
+    Cada venta se modifica con find_one_and_update, como en actualizar_venta:
+    los resúmenes descuentan el documento anterior que devuelve Mongo, así dos
+    reintentos simultáneos del mismo manifiesto no aplican dos veces el cambio.
+    """
+    cambios = {}
+    for actualizacion in actualizaciones:
+        cambios[actualizacion.id] = cambios_venta(actualizacion)
+    
+    async def aplicar(venta_id):
+        if not cambios[venta_id]:
+            return await db.ventas.find_one(esquema.filtro_id(venta_id), {"_id": 1})
+        return await esquema.actualizar_por_id(db.ventas, venta_id, cambios[venta_id])
     
-    if result.matched_count:
+    ids = list(cambios)
+    anteriores = []
+    for inicio in range(0, len(ids), LOTE_ESTADOS):
+        anteriores += await asyncio.gather(*(aplicar(venta_id) for venta_id in ids[inicio:inicio + LOTE_ESTADOS]))
+    
+    resultados = []
+    cambios_resumen = []
+    for venta_id, anterior in zip(ids, anteriores):
+        update_dict = cambios[venta_id]
+        modificada = anterior is not None and any(anterior.get(k) != v for k, v in update_dict.items())
+        if modificada:
+            cambios_resumen += [(anterior, -1), ({**anterior, **update_dict}, 1)]
+        resultados.append({
+            "id": venta_id,
+            "encontrada": int(anterior is not None),
+            "modificada": int(modificada)
+        })
+    
+    if cambios_resumen:
+        await registrar_ventas(cambios_resumen)
+        await registrar_escritura("ventas")
+        for anterior, venta in zip(cambios_resumen[::2], cambios_resumen[1::2]):
+            bus.escritura("venta_actualizada", {"venta": sin_id_mongo(venta[0]), "anterior": sin_id_mongo(anterior[0])})
+    
+    return {
+        "encontradas": sum(r["encontrada"] for r in resultados),
+        "modificadas": sum(r["modificada"] for r in resultados),
+        "resultados": resultados
+    }
+
+@app.put("/api/ventas/{venta_id}")
+async def actualizar_venta(venta_id: str, venta_update: VentaUpdate):
+    """Actualizar estado de entrega de una venta"""
+    update_dict = cambios_venta(venta_update)
+    
+    anterior = await esquema.actualizar_por_id(db.ventas, venta_id, update_dict)
+    
+    if anterior:
+        await registrar_ventas([(anterior, -1), ({**anterior, **update_dict}, 1)])
+        await registrar_escritura("ventas")
+        bus.escritura("venta_actualizada", {
+            "venta": sin_id_mongo({**anterior, **update_dict}), "anterior": sin_id_mongo(anterior)
+        })
         return {"message": "Venta actualizada exitosamente"}
     raise HTTPException(status_code=404, detail="Venta no encontrada")
 
+@app.get("/api/ventas/export")
+async def exportar_ventas_http(
+    formato: str = "ndjson",
+    fecha_inicio: Optional[str] = None,
+    fecha_final: Optional[str] = None
+):
+    """Exportar ventas en streaming como NDJSON o CSV"""
+    if formato not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Formato inválido. Use ndjson o csv")
+    filtro_ventas = filtro_fechas_ventas(*parsear_rango(fecha_inicio, fecha_final))
+    tipo = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        exportar_ventas(db, filtro_ventas, formato),
+        media_type=tipo,
+        headers={"Content-Disposition": f"attachment; filename=ventas.{formato}"}
+    )
+
+@app.get("/api/ventas/productos")
+async def buscar_productos(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(busqueda.LIMITE, ge=1, le=busqueda.LIMITE_MAXIMO)
+):
+    """Productos vendidos cuyo nombre contiene palabras que empiezan por q, los más vendidos primero"""
+    productos = await busqueda.buscar(
+        db.analitica_productos, q,
+        texto_de=lambda p: p["producto"],
+        orden=lambda p: (-p.get("ventas", 0), p["producto"]),
+        limite=limit,
+        proyeccion={"producto": 1, "ventas": 1, busqueda.CAMPO: 1},
+    )
+    return [{"producto": p["producto"], "ventas": p.get("ventas", 0)} for p in productos]
+
 @app.get("/api/ventas/pendientes")
-async def listar_ventas_pendientes():
+async def listar_ventas_pendientes(request: Request):
     """Obtener ventas sin estado definido (pendientes de procesamiento)"""
-    ventas_pendientes = await db.ventas.find({"entregado": None}).to_list(length=None)
-    
-    # Get client names for better display
-    clientes = await db.clientes.find({}).to_list(length=None)
-    clientes_dict = {c["id"]: f"{c['nombre']} {c['apellidos']}" for c in clientes}
+    clave, etiquetas = cache.clave("ventas_pendientes"), ("ventas", "clientes")
+    etag, clave, no_modificado = await revalidar(request, clave, etiquetas)
+    if no_modificado:
+        return no_modificado
     
-    for venta in ventas_pendientes:
-        if '_id' in venta:
-            del venta['_id']
-        venta['cliente_nombre'] = clientes_dict.get(venta['cliente_id'], 'Cliente no encontrado')
+    async def consultar():
+        ventas_pendientes = [
+            esquema.a_api("ventas", v) for v in await db.ventas.find({"entregado": None}).to_list(length=None)
+        ]
+        # Solo se resuelven los clientes de las ventas pendientes
+        return serializar(await con_nombre_cliente(db, ventas_pendientes))
     
-    return ventas_pendientes
+    return RespuestaJSON(await cache.obtener(clave, etiquetas, consultar), headers=etags.cabeceras(etag))
+
+@app.get("/api/clientes/buscar")
+async def buscar_clientes(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(busqueda.LIMITE, ge=1, le=busqueda.LIMITE_MAXIMO)
+):
+    """Clientes por prefijo de nombre, apellidos o teléfono, sin distinguir acentos ni mayúsculas"""
+    clientes = await busqueda.buscar(
+        db.clientes, q,
+        texto_de=nombres_clientes.nombre,
+        orden=lambda c: (busqueda.normalizar(c["apellidos"]), busqueda.normalizar(c["nombre"])),
+        limite=limit,
+    )
+    return [esquema.a_api("clientes", c) for c in clientes]
 
 @app.post("/api/clientes")
 async def crear_cliente(cliente: Cliente):
     """Crear nuevo cliente"""
-    cliente.id = str(uuid.uuid4())
-    cliente_dict = cliente.dict()
+    cliente_dict = documento_cliente(cliente)
     
     result = await db.clientes.insert_one(cliente_dict)
     if result.inserted_id:
+        cliente_dict = esquema.a_api("clientes", cliente_dict)
+        nombres_clientes.guardar([cliente_dict])
+        await registrar_escritura("clientes")
+        bus.escritura("cliente_creado", {"cliente": sin_id_mongo(cliente_dict)})
         return {"message": "Cliente creado exitosamente", "id": cliente.id}
     raise HTTPException(status_code=400, detail="Error al crear cliente")
 
 @app.post("/api/gastos")
 async def crear_gasto(gasto: Gasto):
     """Crear nuevo gasto"""
-    gasto.id = str(uuid.uuid4())
-    gasto_dict = gasto.dict()
-    gasto_dict["fecha_inicio"] = gasto.fecha_inicio.isoformat()
-    gasto_dict["fecha_final"] = gasto.fecha_final.isoformat()
+    gasto_dict = documento_gasto(gasto)
     
     result = await db.gastos.insert_one(gasto_dict)
     if result.inserted_id:
+        gasto_dict = esquema.a_api("gastos", gasto_dict)
+        await registrar_gastos([gasto_dict])
+        await registrar_escritura("gastos")
+        bus.escritura("gasto_creado", {"gasto": sin_id_mongo(gasto_dict)})
         return {"message": "Gasto creado exitosamente", "id": gasto.id}
     raise HTTPException(status_code=400, detail="Error al crear gasto")
 
+async def importar_http(request: Request, coleccion, modelo, a_documento, al_insertar=None):
+    """Importación con su informe; la versión y el aviso de recargar solo si se insertó algo"""
+    lotes = []
+
+    async def registrar_lote(documentos):
+        lotes.append(len(documentos))
+        if al_insertar:
+            await al_insertar(documentos)
+
+    try:
+        return await importar(request, coleccion, modelo, a_documento, registrar_lote)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # También si falla a mitad: los lotes anteriores ya están en Mongo
+        if lotes:
+            await registrar_escritura(coleccion.name)
+            bus.escritura("recargar", {"coleccion": coleccion.name})
+
+@app.post("/api/ventas/bulk")
+async def importar_ventas(request: Request):
+    """Importar ventas en lote desde una lista JSON, NDJSON o CSV"""
+    return await importar_http(
+        request, db.ventas, Venta, documento_venta,
+        lambda ventas: registrar_ventas([(esquema.a_api("ventas", v, conservar_id=True), 1) for v in ventas])
+    )
+
+@app.post("/api/clientes/bulk")
+async def importar_clientes(request: Request):
+    """Importar clientes en lote desde una lista JSON, NDJSON o CSV"""
+    async def al_insertar(clientes):
+        nombres_clientes.guardar(esquema.a_api("clientes", c) for c in clientes)
+    
+    return await importar_http(request, db.clientes, Cliente, documento_cliente, al_insertar)
+
+@app.post("/api/gastos/bulk")
+async def importar_gastos(request: Request):
+    """Importar gastos en lote desde una lista JSON, NDJSON o CSV"""
+    async def al_insertar(gastos):
+        await registrar_gastos([esquema.a_api("gastos", g) for g in gastos])
+    
+    return await importar_http(
+        request, db.gastos, Gasto, documento_gasto,
+        al_insertar
+    )
+
+async def listar_pagina_http(request, coleccion, orden, modelo, limit, cursor, fields, cachear=False):
+    """Listar una colección paginada y publicar el cursor y el total en cabeceras"""
+    clave = cache.clave(coleccion.name, limit=limit, cursor=cursor, fields=fields)
+    etag, clave, no_modificado = await revalidar(request, clave, (coleccion.name,))
+    if no_modificado:
+        return no_modificado
+    
+    async def consultar():
+        documentos, siguiente, total = await listar_pagina(
+            coleccion, orden, modelo.model_fields, limit, cursor, fields,
+            a_api=lambda documento: esquema.a_api(coleccion.name, documento)
+        )
+        return serializar(documentos), siguiente, total
+    
+    try:
+        if cachear:
+            documentos, siguiente, total = await cache.obtener(clave, (coleccion.name,), consultar)
+        else:
+            documentos, siguiente, total = await consultar()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cabeceras = {"X-Total-Count": str(total), **etags.cabeceras(etag)}
+    if siguiente:
+        cabeceras["X-Next-Cursor"] = siguiente
+    return RespuestaJSON(documentos, headers=cabeceras)
+
 @app.get("/api/clientes")
-async def listar_clientes():
+async def listar_clientes(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """Obtener lista de clientes"""
-    clientes = await db.clientes.find({}).to_list(length=None)
-    # Convert ObjectId to string for JSON serialization
-    for cliente in clientes:
-        if '_id' in cliente:
-            del cliente['_id']
-    return clientes
+    return await listar_pagina_http(
+        request, db.clientes, ["apellidos", "nombre", "_id"], Cliente, limit, cursor, fields,
+        cachear=True
+    )
 
 @app.get("/api/ventas")
-async def listar_ventas():
+async def listar_ventas(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """Obtener lista de ventas"""
-    ventas = await db.ventas.find({}).to_list(length=None)
-    # Convert ObjectId to string for JSON serialization
-    for venta in ventas:
-        if '_id' in venta:
-            del venta['_id']
-    return ventas
+    return await listar_pagina_http(
+        request, db.ventas, ["fecha_venta", "_id"], Venta, limit, cursor, fields
+    )
 
 @app.get("/api/gastos")
-async def listar_gastos():
+async def listar_gastos(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """Obtener lista de gastos"""
-    gastos = await db.gastos.find({}).to_list(length=None)
-    # Convert ObjectId to string for JSON serialization
-    for gasto in gastos:
-        if '_id' in gasto:
-            del gasto['_id']
-    return gastos
+    return await listar_pagina_http(
+        request, db.gastos, ["fecha_inicio", "_id"], Gasto, limit, cursor, fields
+    )
+
+@app.get("/api/analytics/productos")
+async def analitica_productos(
+    request: Request,
+    orden: str = "ganancia",
+    limit: int = Query(10, ge=1, le=LIMITE_MAXIMO),
+    minimo_ventas: int = Query(1, ge=1)
+):
+    """Ranking de productos por ganancia, pérdidas, ventas, tasa de devolución o margen promedio"""
+    return await ranking_http(request, "analitica_productos", "producto", orden, limit, minimo_ventas)
+
+@app.get("/api/analytics/clientes")
+async def analitica_clientes(
+    request: Request,
+    orden: str = "ganancia",
+    limit: int = Query(10, ge=1, le=LIMITE_MAXIMO),
+    minimo_ventas: int = Query(1, ge=1)
+):
+    """Ranking de clientes con las mismas métricas que el de productos"""
+    return await ranking_http(request, "analitica_clientes", "cliente_id", orden, limit, minimo_ventas)
+
+async def ranking_http(request, coleccion, campo_clave, orden, limit, minimo_ventas):
+    """Top-N de los contadores de analítica; los clientes llevan su nombre"""
+    if orden not in analitica.ORDENES:
+        raise HTTPException(status_code=400, detail=f"Orden inválido. Use {', '.join(analitica.ORDENES)}")
+    
+    clave = cache.clave(coleccion, orden=orden, limit=limit, minimo_ventas=minimo_ventas)
+    etiquetas = ("ventas", coleccion) + (("clientes",) if campo_clave == "cliente_id" else ())
+    etag, clave, no_modificado = await revalidar(request, clave, etiquetas)
+    if no_modificado:
+        return no_modificado
+    
+    async def consultar():
+        filas = await analitica.ranking(db[coleccion], campo_clave, orden, limit, minimo_ventas)
+        if campo_clave == "cliente_id":
+            filas = await con_nombre_cliente(db, filas)
+        return serializar(filas)
+    
+    return RespuestaJSON(await cache.obtener(clave, etiquetas, consultar), headers=etags.cabeceras(etag))
+
+@app.get("/api/reportes/{mes}", response_model=ReporteMensual)
+async def obtener_reporte(request: Request, mes: str):
+    """Informe de pérdidas y ganancias de un mes cerrado (AAAA-MM), servido desde disco"""
+    try:
+        cerrado = reportes.cerrado(mes)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Mes inválido. Use AAAA-MM")
+    if not cerrado:
+        raise HTTPException(status_code=409, detail="El mes aún no ha cerrado; consulte el dashboard")
+    
+    instantanea = reportes.instantaneas.abrir(mes)
+    # Bajo demanda solo se generan los meses desde la primera venta cerrada
+    if instantanea is None and mes not in await reportes.meses_con_datos(db):
+        raise HTTPException(status_code=404, detail="No hay ventas para ese mes")
+    # Una escritura tardía puede borrar el archivo recién generado: se espera a la regeneración
+    for _ in range(reportes.REINTENTOS_LECTURA):
+        if instantanea is not None:
+            break
+        await asyncio.shield(reportes.generador.asegurar(db, mes))
+        instantanea = reportes.instantaneas.abrir(mes)
+    if instantanea is None:
+        raise HTTPException(
+            status_code=503, detail="El informe se está regenerando; intente de nuevo", headers={"Retry-After": "1"}
+        )
+    # El archivo ya está comprimido: se envía tal cual si el cliente acepta gzip, con el
+    # sufijo en el ETag como hace MiddlewareCompresion, porque son dos representaciones
+    gzip = "gzip" in aceptadas(request.headers.get("accept-encoding", ""))
+    etag = instantanea.etag[:-1] + '-gzip"' if gzip else instantanea.etag
+    cabeceras = {**etags.cabeceras(etag), "Vary": "Accept-Encoding"}
+    if etags.coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cabeceras)
+    if gzip:
+        return RespuestaJSON(instantanea.comprimido(), headers={**cabeceras, "Content-Encoding": "gzip"})
+    return RespuestaJSON(instantanea.json(), headers=cabeceras)
+
+@app.get("/api/eventos")
+async def eventos_sse(request: Request):
+    """Flujo SSE con los cambios de ventas, clientes y gastos para actualizar la interfaz sin recargar"""
+    ultimo_id = request.headers.get("last-event-id")
+    return StreamingResponse(
+        flujo(bus, int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+async def exportar_metricas():
+    """Métricas de latencia por ruta y de consultas a Mongo en formato Prometheus"""
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admin/cache")
+async def estadisticas_cache():
+    """Aciertos, fallos y tamaño de la cache en memoria"""
+    return cache.estadisticas()
+
+@app.get("/api/admin/limites")
+async def estado_limites():
+    """Peticiones en curso y en cola de cada clase de ruta"""
+    return {clase: limitador.estadisticas() for clase, limitador in limitadores.items()}
+
+@app.get("/api/admin/indices")
+async def revisar_indices():
+    """Estado de los índices y plan de ejecución de las consultas principales"""
+    return {
+        "indices": await asegurar_indices(db, crear=False),
+        "consultas": await explicar_consultas(db)
+    }
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    from lanzador import servir
+    servir()
\ No newline at end of file
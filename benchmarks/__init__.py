@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos del backend se importan igual que en backend/ (uvicorn server:app)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
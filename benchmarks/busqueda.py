@@ -0,0 +1,88 @@
+"""Latencia de la búsqueda de clientes por prefijo.
+
+Ejemplo:
+
+    python -m benchmarks.busqueda --clientes 100000 --mongo-url mongodb://localhost:27017
+
+Se pueblan los clientes con los nombres de los datos demo, se crean los
+índices y se cronometra busqueda.buscar con consultas de una y dos palabras,
+prefijos cortos y teléfonos. El objetivo es una mediana por debajo de 10 ms
+con 100k clientes en un mongod local; con mongomock no hay índices y el tiempo
+crece con la colección.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import busqueda
+from benchmarks.carga import conectar
+from datos_demo import APELLIDOS, NOMBRES, generar_clientes, insertar_por_lotes
+from indices import asegurar_indices
+
+
+def consultas(rnd: random.Random, n: int) -> dict:
+    return {
+        "nombre_completo": [f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}" for _ in range(n)],
+        "prefijo_corto": [rnd.choice(APELLIDOS)[:2] for _ in range(n)],
+        "prefijo_sin_acento": [busqueda.normalizar(rnd.choice(APELLIDOS))[:4] for _ in range(n)],
+        "telefono": [f"300{rnd.randint(0, 999):03d}" for _ in range(n)],
+    }
+
+
+async def medir(db, textos: list) -> dict:
+    tiempos = []
+    for texto in textos:
+        inicio = time.perf_counter()
+        await busqueda.buscar(
+            db.clientes, texto,
+            texto_de=lambda c: f"{c['nombre']} {c['apellidos']}",
+            orden=lambda c: (c["apellidos"], c["nombre"]),
+        )
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        "p50_ms": round(statistics.median(tiempos), 3),
+        "p95_ms": round(tiempos[int(len(tiempos) * 0.95) - 1], 3),
+        "max_ms": round(tiempos[-1], 3),
+    }
+
+
+async def ejecutar(args):
+    db = conectar(args.mongo_url, args.db)
+    await db.clientes.drop()
+    rnd = random.Random(args.semilla)
+    await insertar_por_lotes(db.clientes, generar_clientes(args.clientes, rnd))
+    await asegurar_indices(db)
+    return {
+        "clientes": args.clientes,
+        "mongo": "mongod" if args.mongo_url else "mongomock",
+        "consultas": {
+            nombre: await medir(db, textos) for nombre, textos in consultas(rnd, args.repeticiones).items()
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", type=int, default=100000)
+    parser.add_argument("--mongo-url", help="mongod local; sin él se usa mongomock-motor")
+    parser.add_argument("--db", default="bench_busqueda")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="archivo JSON del informe (por defecto stdout)")
+    args = parser.parse_args(argv)
+
+    informe = asyncio.run(ejecutar(args))
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Prueba de carga del backend contra una base local.
+
+Ejemplos:
+
+    python -m benchmarks.carga --ventas 10000
+    python -m benchmarks.carga --ventas 1000000 --mongo-url mongodb://localhost:27017
+    python -m benchmarks.carga --url http://localhost:8001 --mongo-url mongodb://localhost:27017
+
+Sin --mongo-url se usa mongomock-motor en memoria (útil hasta ~50k ventas).
+Sin --url la API se ejecuta en el mismo proceso con httpx.ASGITransport.
+El informe JSON incluye p50/p95/p99, throughput y RSS máximo del proceso.
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import sys
+import time
+from datetime import date, timedelta
+
+import httpx
+
+import analitica
+import esquema
+import resumen_diario
+import server
+from datos_demo import poblar
+from indices import asegurar_indices
+
+
+def escenarios(venta_ids: list, cliente_ids: list, rnd: random.Random):
+    """Peticiones de cada escenario como funciones que reciben el cliente httpx"""
+    hoy = date.today()
+    hace_90 = (hoy - timedelta(days=90)).isoformat()
+
+    def nueva_venta():
+        return {
+            "cliente_id": rnd.choice(cliente_ids),
+            "producto": f"Producto {rnd.randint(1, 50)}",
+            "fecha_venta": (hoy - timedelta(days=rnd.randint(0, 30))).isoformat(),
+            "valor_venta": 100000,
+            "ganancia": 30000,
+        }
+
+    def estado():
+        return {"entregado": rnd.choice([True, False]), "fecha_entrega": hoy.isoformat(), "valor_perdida": 0}
+
+    return {
+        "dashboard": lambda c: c.get("/api/dashboard"),
+        "dashboard_90_dias": lambda c: c.get(
+            "/api/dashboard", params={"fecha_inicio": hace_90, "fecha_final": hoy.isoformat()}
+        ),
+        "dashboard_columnar": lambda c: c.get(
+            "/api/dashboard", params={"fecha_inicio": hace_90, "fecha_final": hoy.isoformat(), "motor": "columnar"}
+        ),
+        "analitica_productos": lambda c: c.get("/api/analytics/productos", params={"orden": "tasa_devolucion"}),
+        "analitica_clientes": lambda c: c.get("/api/analytics/clientes", params={"limit": 50}),
+        "ventas_pagina": lambda c: c.get("/api/ventas", params={"limit": 100}),
+        "ventas_pendientes": lambda c: c.get("/api/ventas/pendientes"),
+        "crear_venta": lambda c: c.post("/api/ventas", json=nueva_venta()),
+        "actualizar_venta": lambda c: c.put(f"/api/ventas/{rnd.choice(venta_ids)}", json=estado()),
+        "actualizar_estados": lambda c: c.put(
+            "/api/ventas/estado", json=[{"id": rnd.choice(venta_ids), **estado()} for _ in range(50)]
+        ),
+    }
+
+
+def percentil(ordenadas: list, p: float) -> float:
+    if not ordenadas:
+        return 0.0
+    k = (len(ordenadas) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenadas) - 1)
+    return ordenadas[i] + (ordenadas[j] - ordenadas[i]) * (k - i)
+
+
+async def medir(cliente, peticion, total: int, concurrencia: int):
+    """Lanzar total peticiones con concurrencia fija y devolver las métricas en ms"""
+    latencias, errores = [], 0
+    pendientes = iter(range(total))
+
+    async def trabajador():
+        nonlocal errores
+        for _ in pendientes:
+            inicio = time.perf_counter()
+            try:
+                respuesta = await peticion(cliente)
+                if respuesta.status_code >= 400:
+                    errores += 1
+            except httpx.HTTPError:
+                errores += 1
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "peticiones": total,
+        "errores": errores,
+        "concurrencia": concurrencia,
+        "p50_ms": round(percentil(latencias, 50), 3),
+        "p95_ms": round(percentil(latencias, 95), 3),
+        "p99_ms": round(percentil(latencias, 99), 3),
+        "max_ms": round(latencias[-1], 3) if latencias else 0,
+        "throughput_rps": round(total / duracion, 2) if duracion else 0,
+    }
+
+
+def rss_maximo_mb() -> float:
+    # En Linux ru_maxrss viene en KiB, en macOS en bytes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def conectar(mongo_url, db_name):
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        return AsyncIOMotorClient(mongo_url)[db_name]
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()[db_name]
+
+
+async def leer_ids(db, coleccion: str, limite: int = 5000) -> list:
+    """Ids de la API de una muestra de documentos; los v2 no tienen id y se deriva del _id"""
+    documentos = await db[coleccion].find({}, {"id": 1}).limit(limite).to_list(length=None)
+    return [esquema.a_api(coleccion, d)["id"] for d in documentos]
+
+
+async def ejecutar(args):
+    db = conectar(args.mongo_url, args.db)
+    if not args.sin_poblar:
+        for coleccion in ("ventas", "clientes", "gastos", "ventas_diarias"):
+            await db[coleccion].drop()
+        inicio = time.perf_counter()
+        datos = await poblar(db, args.ventas, dias=args.dias, semilla=args.semilla)
+        await asegurar_indices(db)
+        await resumen_diario.reconstruir(db)
+        await analitica.reconstruir(db)
+        datos["segundos_carga"] = round(time.perf_counter() - inicio, 2)
+    else:
+        datos = {"ventas": await db.ventas.estimated_document_count()}
+
+    venta_ids = await leer_ids(db, "ventas")
+    cliente_ids = await leer_ids(db, "clientes")
+
+    if args.url:
+        cliente = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        server.db = db
+        if args.sin_cache:
+            server.cache.ttl = 0
+        cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=60)
+
+    rnd = random.Random(args.semilla)
+    todos = escenarios(venta_ids, cliente_ids, rnd)
+    elegidos = args.escenarios.split(",") if args.escenarios else list(todos)
+
+    resultados = {}
+    async with cliente:
+        for nombre in elegidos:
+            # Una petición de calentamiento para no medir la primera carga de índices y caches
+            await todos[nombre](cliente)
+            resultados[nombre] = await medir(cliente, todos[nombre], args.peticiones, args.concurrencia)
+
+    return {
+        "datos": datos,
+        "modo": "http" if args.url else "asgi",
+        "mongo": "mongod" if args.mongo_url else "mongomock",
+        "cache": not args.sin_cache,
+        "escenarios": resultados,
+        "rss_maximo_mb": rss_maximo_mb(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ventas", type=int, default=10000)
+    parser.add_argument("--dias", type=int, default=365, help="días de historia de las ventas generadas")
+    parser.add_argument("--mongo-url", help="mongod local; sin él se usa mongomock-motor")
+    parser.add_argument("--db", default="bench_control_gastos")
+    parser.add_argument("--url", help="API ya levantada (por defecto la app en proceso)")
+    parser.add_argument("--peticiones", type=int, default=200, help="peticiones por escenario")
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--escenarios", help="lista separada por comas; por defecto todos")
+    parser.add_argument("--sin-cache", action="store_true", help="desactivar la cache en proceso")
+    parser.add_argument("--sin-poblar", action="store_true", help="reutilizar los datos existentes")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="archivo JSON del informe (por defecto stdout)")
+    args = parser.parse_args(argv)
+
+    informe = asyncio.run(ejecutar(args))
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
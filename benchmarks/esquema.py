@@ -0,0 +1,153 @@
+"""Ahorro de almacenamiento y de tiempo de consulta del esquema v2.
+
+Ejemplo:
+
+    python -m benchmarks.esquema --ventas 100000 --mongo-url mongodb://localhost:27017
+
+Se pueblan los datos con el esquema v1, se mide, se migran con
+esquema.migrar (también se cronometra) y se vuelve a medir. Con un mongod real
+el tamaño sale de collStats (datos, almacenamiento comprimido e índices); con
+mongomock solo se puede sumar el tamaño BSON de los documentos.
+
+Las consultas medidas son las que cambian con el esquema: conteo por rango
+de fechas, agregación del dashboard sobre ventas, búsqueda por id y una
+página del listado. Se da la mediana en ms de varias repeticiones.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+import bson
+
+import esquema
+from benchmarks.carga import conectar
+from datos_demo import poblar
+from estadisticas import calcular_estadisticas, filtro_fechas_ventas
+from indices import asegurar_indices
+from paginacion import listar_pagina
+from server import Venta
+
+COLECCIONES = ("ventas", "clientes", "gastos")
+
+
+async def tamano(db, nombre: str) -> dict:
+    """Tamaño de la colección en bytes según collStats, o la suma BSON si no hay mongod"""
+    try:
+        stats = await db.command("collStats", nombre)
+        return {
+            "documentos": stats["count"],
+            "datos": stats["size"],
+            "almacenamiento": stats.get("storageSize"),
+            "indices": stats.get("totalIndexSize"),
+            "promedio_documento": stats.get("avgObjSize"),
+        }
+    except Exception:
+        documentos = await db[nombre].find({}).to_list(length=None)
+        datos = sum(len(bson.encode(d)) for d in documentos)
+        return {
+            "documentos": len(documentos),
+            "datos": datos,
+            "almacenamiento": None,
+            "indices": None,
+            "promedio_documento": round(datos / len(documentos), 1) if documentos else 0,
+        }
+
+
+async def mediana_ms(consulta, repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        await consulta()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return round(statistics.median(tiempos), 3)
+
+
+async def medir(db, venta_ids: list, repeticiones: int) -> dict:
+    hoy = date.today()
+    hace_90 = hoy - timedelta(days=90)
+    rnd = random.Random(1)
+
+    async def buscar_ids():
+        for venta_id in rnd.sample(venta_ids, min(100, len(venta_ids))):
+            await db.ventas.find_one(esquema.filtro_id(venta_id))
+
+    consultas = {
+        "conteo_90_dias": lambda: db.ventas.count_documents(filtro_fechas_ventas(hace_90, hoy)),
+        "dashboard_ventas_90_dias": lambda: calcular_estadisticas(db, hace_90, hoy, fuente="ventas", motor="mongo"),
+        "buscar_100_ids": buscar_ids,
+        "pagina_100_ventas": lambda: listar_pagina(
+            db.ventas, ["fecha_venta", "_id"], Venta.model_fields, 100,
+            a_api=lambda d: esquema.a_api("ventas", d)
+        ),
+    }
+    return {
+        "tamano": {nombre: await tamano(db, nombre) for nombre in COLECCIONES},
+        "consultas_ms": {nombre: await mediana_ms(consulta, repeticiones) for nombre, consulta in consultas.items()},
+    }
+
+
+def ahorro(antes, despues):
+    """Fracción ahorrada de cada métrica numérica (positiva si v2 es menor)"""
+    if isinstance(antes, dict):
+        return {k: ahorro(antes[k], despues.get(k)) for k in antes if k != "documentos"}
+    if not antes or despues is None:
+        return None
+    return round(1 - despues / antes, 3)
+
+
+async def ejecutar(args):
+    db = conectar(args.mongo_url, args.db)
+    for nombre in COLECCIONES:
+        await db[nombre].drop()
+    esquema.ESQUEMA = 1
+    await poblar(db, args.ventas, semilla=args.semilla)
+    await asegurar_indices(db)
+    venta_ids = [v["id"] for v in await db.ventas.find({}, {"_id": 0, "id": 1}).limit(5000).to_list(length=None)]
+
+    v1 = await medir(db, venta_ids, args.repeticiones)
+    esquema.ESQUEMA = 2
+    inicio = time.perf_counter()
+    migrados = await esquema.migrar(db, tamano_lote=args.tamano_lote)
+    segundos = time.perf_counter() - inicio
+    v2 = await medir(db, venta_ids, args.repeticiones)
+
+    return {
+        "ventas": args.ventas,
+        "mongo": "mongod" if args.mongo_url else "mongomock",
+        "migracion": {
+            "documentos": migrados,
+            "segundos": round(segundos, 2),
+            "documentos_por_segundo": round(sum(migrados.values()) / segundos, 1) if segundos else None,
+        },
+        "v1": v1,
+        "v2": v2,
+        "ahorro": ahorro(v1, v2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ventas", type=int, default=20000)
+    parser.add_argument("--mongo-url", help="mongod local; sin él se usa mongomock-motor")
+    parser.add_argument("--db", default="bench_esquema")
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--tamano-lote", type=int, default=esquema.TAMANO_LOTE)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="archivo JSON del informe (por defecto stdout)")
+    args = parser.parse_args(argv)
+
+    informe = asyncio.run(ejecutar(args))
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
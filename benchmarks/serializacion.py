@@ -0,0 +1,89 @@
+"""Tiempo de CPU de serializar las respuestas: ruta de FastAPI por defecto frente a orjson.
+
+Ejemplo:
+
+    python -m benchmarks.serializacion --ventas 1000 --repeticiones 50
+
+"antes" reproduce lo que hacía FastAPI con un dict devuelto por el endpoint:
+validar el response_model (solo el dashboard), jsonable_encoder y json.dumps
+como JSONResponse. "despues" es RespuestaJSON, que serializa con orjson sin
+pasar por jsonable_encoder. Se mide time.process_time por respuesta.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+from mongomock_motor import AsyncMongoMockClient
+
+from datos_demo import generar_ventas, poblar
+from estadisticas import calcular_estadisticas
+from respuestas import RespuestaJSON
+from server import EstadisticasResponse
+
+
+def json_fastapi(contenido) -> bytes:
+    # Mismas opciones que starlette.responses.JSONResponse.render
+    return json.dumps(
+        jsonable_encoder(contenido), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def cpu_por_respuesta(funcion, repeticiones: int) -> float:
+    """Milisegundos de CPU por llamada, el mejor de tres intentos"""
+    mejores = []
+    for _ in range(3):
+        inicio = time.process_time()
+        for _ in range(repeticiones):
+            funcion()
+        mejores.append((time.process_time() - inicio) / repeticiones * 1000)
+    return round(min(mejores), 3)
+
+
+def comparar(antes, despues, repeticiones: int) -> dict:
+    assert json.loads(antes()) == json.loads(despues()), "las dos rutas deben producir el mismo JSON"
+    cpu_antes = cpu_por_respuesta(antes, repeticiones)
+    cpu_despues = cpu_por_respuesta(despues, repeticiones)
+    return {
+        "bytes": len(despues()),
+        "cpu_antes_ms": cpu_antes,
+        "cpu_despues_ms": cpu_despues,
+        "aceleracion": round(cpu_antes / cpu_despues, 2) if cpu_despues else None,
+    }
+
+
+async def estadisticas_de_ejemplo(n_ventas: int) -> dict:
+    db = AsyncMongoMockClient()["bench_serializacion"]
+    await poblar(db, n_ventas)
+    return await calcular_estadisticas(db, fuente="ventas")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ventas", type=int, default=1000, help="documentos de la página de ventas")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(args.semilla)
+    ventas = list(generar_ventas(args.ventas, [f"c{i}" for i in range(100)], 365, rnd, 50))
+    estadisticas = asyncio.run(estadisticas_de_ejemplo(min(args.ventas, 10000)))
+    respuesta = RespuestaJSON(None)
+
+    informe = {
+        "lista_ventas": comparar(
+            lambda: json_fastapi(ventas), lambda: respuesta.render(ventas), args.repeticiones
+        ),
+        "dashboard": comparar(
+            lambda: json_fastapi(EstadisticasResponse(**estadisticas)),
+            lambda: respuesta.render(estadisticas),
+            args.repeticiones,
+        ),
+    }
+    print(json.dumps(informe, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Escalado del throughput con el número de workers.
+
+Ejemplo:
+
+    python -m benchmarks.workers --mongo-url mongodb://localhost:27017 --workers 1,2,4
+
+Para cada número de workers se levanta la API con backend/lanzador.py en un
+puerto libre, se espera a /api/ready y se lanza la carga desde varios procesos
+cliente (un solo proceso httpx se satura antes que la API). Necesita un mongod
+real: con mongomock cada worker tendría su propia base en memoria.
+
+El informe JSON da, por escenario, el throughput de cada configuración y la
+aceleración respecto a la primera.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+import analitica
+import resumen_diario
+from benchmarks.carga import conectar, escenarios, medir
+from datos_demo import poblar
+from indices import asegurar_indices
+from lanzador import workers_por_defecto
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def levantar_api(workers: int, puerto: int, mongo_url: str, db_name: str):
+    entorno = {**os.environ, "MONGO_URL": mongo_url, "DB_NAME": db_name,
+               "WEB_CONCURRENCY": str(workers), "HOST": "127.0.0.1", "PORT": str(puerto)}
+    return subprocess.Popen([sys.executable, os.path.join(BACKEND, "lanzador.py")], env=entorno, cwd=BACKEND)
+
+
+def esperar_listo(url: str, workers: int, espera: float = 60):
+    """Esperar a que varias respuestas seguidas de /api/ready sean 200 (cada worker arranca por su cuenta)"""
+    limite = time.monotonic() + espera
+    seguidas = 0
+    while time.monotonic() < limite:
+        try:
+            seguidas = seguidas + 1 if httpx.get(f"{url}/api/ready", timeout=2).status_code == 200 else 0
+        except httpx.HTTPError:
+            seguidas = 0
+        if seguidas >= 5 * workers:
+            return
+        time.sleep(0.1 if seguidas else 0.5)
+    raise RuntimeError(f"La API en {url} no estuvo lista en {espera} s")
+
+
+def generar_carga(url, escenario, peticiones, concurrencia, venta_ids, cliente_ids, semilla):
+    """Proceso cliente: una petición de calentamiento y después la medición"""
+    async def correr():
+        peticion = escenarios(venta_ids, cliente_ids, random.Random(semilla))[escenario]
+        async with httpx.AsyncClient(base_url=url, timeout=60) as cliente:
+            await peticion(cliente)
+            return await medir(cliente, peticion, peticiones, concurrencia)
+
+    return asyncio.run(correr())
+
+
+def medir_configuracion(args, workers, venta_ids, cliente_ids):
+    puerto = puerto_libre()
+    url = f"http://127.0.0.1:{puerto}"
+    proceso = levantar_api(workers, puerto, args.mongo_url, args.db)
+    try:
+        esperar_listo(url, workers)
+        resultados = {}
+        with ProcessPoolExecutor(args.procesos_cliente) as ejecutor:
+            for escenario in args.escenarios.split(","):
+                futuros = [
+                    ejecutor.submit(generar_carga, url, escenario, args.peticiones // args.procesos_cliente,
+                                    args.concurrencia, venta_ids, cliente_ids, args.semilla + i)
+                    for i in range(args.procesos_cliente)
+                ]
+                parciales = [f.result() for f in futuros]
+                resultados[escenario] = {
+                    "throughput_rps": round(sum(p["throughput_rps"] for p in parciales), 2),
+                    "p50_ms": round(max(p["p50_ms"] for p in parciales), 3),
+                    "p99_ms": round(max(p["p99_ms"] for p in parciales), 3),
+                    "errores": sum(p["errores"] for p in parciales),
+                }
+        return resultados
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+
+
+async def preparar_datos(args):
+    db = conectar(args.mongo_url, args.db)
+    if not args.sin_poblar:
+        for coleccion in ("ventas", "clientes", "gastos", "ventas_diarias"):
+            await db[coleccion].drop()
+        await poblar(db, args.ventas, semilla=args.semilla)
+        await asegurar_indices(db)
+        await resumen_diario.reconstruir(db)
+        await analitica.reconstruir(db)
+    venta_ids = [v["id"] for v in await db.ventas.find({}, {"_id": 0, "id": 1}).limit(5000).to_list(length=None)]
+    cliente_ids = [c["id"] for c in await db.clientes.find({}, {"_id": 0, "id": 1}).limit(5000).to_list(length=None)]
+    return venta_ids, cliente_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", required=True, help="mongod compartido por todos los workers")
+    parser.add_argument("--db", default="bench_control_gastos")
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, workers_por_defecto()})),
+                        help="configuraciones separadas por comas; por defecto 1, 2 y una por CPU")
+    parser.add_argument("--ventas", type=int, default=100000)
+    parser.add_argument("--peticiones", type=int, default=2000, help="peticiones por escenario y configuración")
+    parser.add_argument("--concurrencia", type=int, default=16, help="concurrencia de cada proceso cliente")
+    parser.add_argument("--procesos-cliente", type=int, default=workers_por_defecto())
+    parser.add_argument("--escenarios", default="ventas_pagina,actualizar_venta",
+                        help="escenarios de benchmarks.carga; los cacheados escalan poco porque no llegan a Mongo")
+    parser.add_argument("--sin-poblar", action="store_true", help="reutilizar los datos existentes")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="archivo JSON del informe (por defecto stdout)")
+    args = parser.parse_args(argv)
+
+    venta_ids, cliente_ids = asyncio.run(preparar_datos(args))
+    por_workers = {}
+    for workers in (int(n) for n in args.workers.split(",")):
+        por_workers[workers] = medir_configuracion(args, workers, venta_ids, cliente_ids)
+
+    base = next(iter(por_workers.values()))
+    for resultados in por_workers.values():
+        for escenario, r in resultados.items():
+            referencia = base[escenario]["throughput_rps"]
+            r["aceleracion"] = round(r["throughput_rps"] / referencia, 2) if referencia else None
+
+    informe = {"ventas": args.ventas, "procesos_cliente": args.procesos_cliente, "workers": por_workers}
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import {
   Chart as ChartJS,
@@ -31,6 +31,7 @@ import {
   BarChart3,
   Calendar
 } from 'lucide-react';
+import { aplicarVentaAlDashboard, aplicarVentaAPendientes, aplicarClienteNuevo } from './lib/eventos';
 import './App.css';
 
 // Registrar componentes de Chart.js
@@ -48,6 +49,10 @@ ChartJS.register(
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 
+// Tiempo que se espera el evento de una escritura propia antes de recargar
+// (con varios workers y sin change stream el evento puede salir de otro proceso)
+const ESPERA_EVENTO_MS = 2000;
+
 function App() {
   const [dashboardData, setDashboardData] = useState(null);
   const [clientes, setClientes] = useState([]);
@@ -89,26 +94,109 @@ function App() {
     valor_perdida: 0
   });
 
+  // Rango del dashboard mostrado y escrituras propias cuyo evento aún no llegó
+  const rangoDashboard = useRef({ inicio: '', final: '' });
+  const eventosEsperados = useRef(new Map());
+  const eventosRecibidos = useRef(new Set());
+  const clientesRef = useRef([]);
+  clientesRef.current = clientes;
+  // El EventSource se abre una vez: las recargas se llaman a través de una ref para usar los filtros actuales
+  const recargas = useRef({});
+
   useEffect(() => {
     cargarDatos();
   }, []);
 
+  useEffect(() => {
+    const fuente = new EventSource(`${BACKEND_URL}/api/eventos`);
+
+    const recibido = (id) => {
+      if (eventosEsperados.current.has(id)) {
+        clearTimeout(eventosEsperados.current.get(id));
+        eventosEsperados.current.delete(id);
+        return;
+      }
+      // El evento puede llegar antes que la respuesta de la escritura que lo generó
+      eventosRecibidos.current.add(id);
+      setTimeout(() => eventosRecibidos.current.delete(id), ESPERA_EVENTO_MS * 5);
+    };
+
+    const alVenta = (evento) => {
+      const { venta, anterior } = JSON.parse(evento.data);
+      recibido(venta.id);
+      setVentasPendientes((pendientes) => aplicarVentaAPendientes(pendientes, venta, clientesRef.current));
+      if (evento.type === 'venta_actualizada' && !anterior) {
+        // Sin el estado anterior (change stream sin pre-imágenes) no se puede calcular el delta
+        recargas.current.cargarDashboard();
+        return;
+      }
+      setDashboardData((dashboard) => aplicarVentaAlDashboard(dashboard, anterior, venta, rangoDashboard.current));
+    };
+
+    fuente.addEventListener('venta_creada', alVenta);
+    fuente.addEventListener('venta_actualizada', alVenta);
+    fuente.addEventListener('cliente_creado', (evento) => {
+      const { cliente } = JSON.parse(evento.data);
+      recibido(cliente.id);
+      setClientes((actuales) => aplicarClienteNuevo(actuales, cliente));
+    });
+    // El gasto se prorratea por días en el backend: solo se vuelve a pedir el dashboard
+    fuente.addEventListener('gasto_creado', (evento) => {
+      recibido(JSON.parse(evento.data).gasto.id);
+      recargas.current.cargarDashboard();
+    });
+    fuente.addEventListener('recargar', () => recargas.current.cargarDatos());
+
+    return () => fuente.close();
+  }, []);
+
+  // Recargar si el evento de una escritura propia no llega a tiempo
+  const esperarEvento = (id) => {
+    if (eventosRecibidos.current.delete(id)) return;
+    eventosEsperados.current.set(id, setTimeout(() => {
+      eventosEsperados.current.delete(id);
+      recargas.current.cargarDatos();
+    }, ESPERA_EVENTO_MS));
+  };
+
+  const urlDashboard = () => {
+    // Construir URL del dashboard con filtros de fecha
+    let dashboardUrl = `${BACKEND_URL}/api/dashboard`;
+    const params = new URLSearchParams();
+    
+    if (fechaInicio && fechaFinal) {
+      params.append('fecha_inicio', fechaInicio);
+      params.append('fecha_final', fechaFinal);
+      // Agrupar la serie en rangos largos para no dibujar miles de puntos
+      const dias = (new Date(fechaFinal) - new Date(fechaInicio)) / 86400000;
+      if (dias > 366) {
+        params.append('granularidad', 'mes');
+      } else if (dias > 92) {
+        params.append('granularidad', 'semana');
+      }
+      dashboardUrl += `?${params.toString()}`;
+    }
+    return dashboardUrl;
+  };
+
+  const cargarDashboard = async () => {
+    try {
+      const dashboardRes = await axios.get(urlDashboard());
+      setDashboardData(dashboardRes.data);
+    } catch (error) {
+      console.error('Error cargando dashboard:', error);
+    }
+  };
+
   const cargarDatos = async () => {
     try {
       setLoading(true);
-      
-      // Construir URL del dashboard con filtros de fecha
-      let dashboardUrl = `${BACKEND_URL}/api/dashboard`;
-      const params = new URLSearchParams();
-      
-      if (fechaInicio && fechaFinal) {
-        params.append('fecha_inicio', fechaInicio);
-        params.append('fecha_final', fechaFinal);
-        dashboardUrl += `?${params.toString()}`;
-      }
+      rangoDashboard.current = fechaInicio && fechaFinal
+        ? { inicio: fechaInicio, final: fechaFinal }
+        : { inicio: '', final: '' };
       
       const [dashboardRes, clientesRes, ventasPendientesRes] = await Promise.all([
-        axios.get(dashboardUrl),
+        axios.get(urlDashboard()),
         axios.get(`${BACKEND_URL}/api/clientes`),
         axios.get(`${BACKEND_URL}/api/ventas/pendientes`)
       ]);
@@ -123,6 +211,8 @@ function App() {
     }
   };
 
+  recargas.current = { cargarDatos, cargarDashboard };
+
   const aplicarFiltrosFecha = () => {
     if (fechaInicio && fechaFinal) {
       cargarDatos();
@@ -143,7 +233,8 @@ function App() {
   const crearVenta = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${BACKEND_URL}/api/ventas`, ventaForm);
+      const respuesta = await axios.post(`${BACKEND_URL}/api/ventas`, ventaForm);
+      esperarEvento(respuesta.data.id);
       alert('Venta creada exitosamente');
       setVentaForm({
         cliente_id: '',
@@ -152,7 +243,6 @@ function App() {
         valor_venta: '',
         ganancia: ''
       });
-      cargarDatos();
     } catch (error) {
       console.error('Error creando venta:', error);
       alert('Error al crear venta');
@@ -163,6 +253,7 @@ function App() {
     e.preventDefault();
     try {
       await axios.put(`${BACKEND_URL}/api/ventas/${ventaEditando.id}`, editForm);
+      esperarEvento(ventaEditando.id);
       alert('Venta actualizada exitosamente');
       setVentaEditando(null);
       setEditForm({
@@ -170,7 +261,6 @@ function App() {
         entregado: null,
         valor_perdida: 0
       });
-      cargarDatos();
     } catch (error) {
       console.error('Error actualizando venta:', error);
       alert('Error al actualizar venta');
@@ -189,10 +279,10 @@ function App() {
   const crearCliente = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${BACKEND_URL}/api/clientes`, clienteForm);
+      const respuesta = await axios.post(`${BACKEND_URL}/api/clientes`, clienteForm);
+      esperarEvento(respuesta.data.id);
       alert('Cliente creado exitosamente');
       setClienteForm({ nombre: '', apellidos: '', telefono: '' });
-      cargarDatos();
     } catch (error) {
       console.error('Error creando cliente:', error);
       alert('Error al crear cliente');
@@ -202,7 +292,8 @@ function App() {
   const crearGasto = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${BACKEND_URL}/api/gastos`, gastoForm);
+      const respuesta = await axios.post(`${BACKEND_URL}/api/gastos`, gastoForm);
+      esperarEvento(respuesta.data.id);
       alert('Gasto creado exitosamente');
       setGastoForm({
         concepto: '',
@@ -210,7 +301,6 @@ function App() {
         fecha_inicio: '',
         fecha_final: ''
       });
-      cargarDatos();
     } catch (error) {
       console.error('Error creando gasto:', error);
       alert('Error al crear gasto');
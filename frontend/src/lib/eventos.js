@@ -0,0 +1,95 @@
+// Aplicar en el estado local los eventos de /api/eventos sin volver a pedir todo al backend.
+// Cada función recibe el estado actual y devuelve uno nuevo (o el mismo si no cambia).
+
+const SIN_APORTE = { entregados: 0, ganancia: 0, devueltos: 0, perdidas: 0 };
+
+// Lo que una venta suma al dashboard según su estado, igual que el resumen diario del backend
+const aporte = (venta) => {
+  if (!venta) return SIN_APORTE;
+  if (venta.entregado === true) return { ...SIN_APORTE, entregados: 1, ganancia: venta.ganancia || 0 };
+  if (venta.entregado === false) return { ...SIN_APORTE, devueltos: 1, perdidas: venta.valor_perdida || 0 };
+  return SIN_APORTE;
+};
+
+const hoyISO = () => new Date().toISOString().slice(0, 10);
+
+const enRango = (fecha, rango) => !rango.inicio || !rango.final || (rango.inicio <= fecha && fecha <= rango.final);
+
+// Índice del periodo de la serie (día, semana o mes) que contiene la fecha, o -1 si queda fuera
+const indicePeriodo = (serie, fecha, rango) => {
+  if (!serie?.length || fecha < serie[0].fecha || fecha > (rango.final || hoyISO())) return -1;
+  let indice = -1;
+  serie.forEach((periodo, i) => {
+    if (periodo.fecha <= fecha) indice = i;
+  });
+  return indice;
+};
+
+// anterior es el documento antes del cambio; en una venta nueva no existe
+export const aplicarVentaAlDashboard = (dashboard, anterior, venta, rango) => {
+  if (!dashboard || !enRango(venta.fecha_venta, rango)) return dashboard;
+
+  const antes = aporte(anterior);
+  const despues = aporte(venta);
+  const delta = Object.fromEntries(Object.keys(SIN_APORTE).map((campo) => [campo, despues[campo] - antes[campo]]));
+  if (Object.values(delta).every((valor) => valor === 0)) return dashboard;
+
+  const nuevo = {
+    ...dashboard,
+    ganancias_totales: dashboard.ganancias_totales + delta.ganancia,
+    perdidas_totales: dashboard.perdidas_totales + delta.perdidas,
+    productos_vendidos: dashboard.productos_vendidos + delta.entregados,
+    productos_devueltos: dashboard.productos_devueltos + delta.devueltos
+  };
+
+  const indice = indicePeriodo(dashboard.ventas_por_dia, venta.fecha_venta, rango);
+  if (indice >= 0) {
+    nuevo.ventas_por_dia = dashboard.ventas_por_dia.map((periodo, i) =>
+      i === indice ? { ...periodo, ventas: periodo.ventas + delta.entregados } : periodo
+    );
+    nuevo.inversion_por_dia = (dashboard.inversion_por_dia || []).map((periodo, i) => {
+      if (i !== indice) return periodo;
+      const ganancia = periodo.ganancia + delta.ganancia;
+      const roi = periodo.inversion ? (ganancia - periodo.inversion) / periodo.inversion : null;
+      return { ...periodo, ganancia, roi };
+    });
+  }
+
+  if (delta.ganancia !== 0) {
+    const productos = dashboard.ganancias_por_producto || [];
+    const existe = productos.some((p) => p.producto === venta.producto);
+    nuevo.ganancias_por_producto = existe
+      ? productos.map((p) => (p.producto === venta.producto ? { ...p, ganancia: p.ganancia + delta.ganancia } : p))
+      : [...productos, { producto: venta.producto, ganancia: delta.ganancia }];
+  }
+  return nuevo;
+};
+
+// Las ventas sin estado están en la lista de pendientes; las demás se quitan
+export const aplicarVentaAPendientes = (pendientes, venta, clientes) => {
+  const resto = pendientes.filter((v) => v.id !== venta.id);
+  if (venta.entregado !== null && venta.entregado !== undefined) return resto;
+
+  const anterior = pendientes.find((v) => v.id === venta.id);
+  const cliente = clientes.find((c) => c.id === venta.cliente_id);
+  const nombre = cliente ? `${cliente.nombre} ${cliente.apellidos}` : 'Cliente no encontrado';
+  const actualizada = { ...venta, cliente_nombre: anterior?.cliente_nombre || nombre };
+  return anterior ? pendientes.map((v) => (v.id === venta.id ? actualizada : v)) : [...pendientes, actualizada];
+};
+
+// Insertar el cliente en el orden del backend (apellidos, nombre, id)
+export const aplicarClienteNuevo = (clientes, cliente) => {
+  if (clientes.some((c) => c.id === cliente.id)) return clientes;
+  const clave = (c) => [c.apellidos, c.nombre, c.id];
+  const menor = (a, b) => {
+    const [ka, kb] = [clave(a), clave(b)];
+    for (let i = 0; i < ka.length; i++) {
+      if (ka[i] !== kb[i]) return ka[i] < kb[i];
+    }
+    return false;
+  };
+  const posicion = clientes.findIndex((c) => menor(cliente, c));
+  return posicion === -1
+    ? [...clientes, cliente]
+    : [...clientes.slice(0, posicion), cliente, ...clientes.slice(posicion)];
+};
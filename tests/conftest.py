@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+import concurrencia  # noqa: E402
+import paginacion  # noqa: E402
+import reportes  # noqa: E402
+import server  # noqa: E402
+from cache import CacheTTL, NombresClientes  # noqa: E402
+from eventos import Bus  # noqa: E402
+from metricas import Metricas  # noqa: E402
+from publicidad import IndicePublicidad  # noqa: E402
+
+
+def reiniciar(monkeypatch, objeto, nuevo):
+    """Dejar un singleton del servidor como recién creado; monkeypatch lo restaura al terminar"""
+    for nombre, valor in vars(nuevo).items():
+        monkeypatch.setattr(objeto, nombre, valor)
+
+
+@pytest.fixture(autouse=True)
+def servidor(monkeypatch, tmp_path):
+    """Estado del proceso limpio en cada test: base vacía y sin nada guardado en memoria.
+
+    Devuelve la base que usan los endpoints. Los informes mensuales se
+    escriben en el directorio temporal del test.
+    """
+    db = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(server, "db", db)
+    reiniciar(monkeypatch, server.cache, CacheTTL(server.cache.tamano_maximo, server.cache.ttl))
+    reiniciar(monkeypatch, server.nombres_clientes, NombresClientes(server.nombres_clientes.tamano_maximo))
+    reiniciar(monkeypatch, server.indice_publicidad, IndicePublicidad())
+    reiniciar(monkeypatch, paginacion.conteos, paginacion.ConteoEstimado(paginacion.conteos.ttl))
+    reiniciar(monkeypatch, server.bus, Bus(server.bus._historial.maxlen, server.bus.tamano_cola))
+    reiniciar(monkeypatch, server.metricas, Metricas())
+    for clase, limitador in concurrencia.limitadores.items():
+        monkeypatch.setitem(concurrencia.limitadores, clase, concurrencia.Limitador(
+            limitador.nombre, limitador.concurrencia, limitador.cola, limitador.espera
+        ))
+    monkeypatch.setattr(reportes, "DIRECTORIO_REPORTES", str(tmp_path))
+    monkeypatch.setattr(reportes, "generador", reportes.Generador(espera=0))
+    monkeypatch.setattr(reportes, "instantaneas", reportes.Instantaneas())
+    return db
@@ -0,0 +1,103 @@
+import asyncio
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+import analitica
+import server
+from datos_demo import poblar
+
+
+@pytest.fixture
+def cliente_http(servidor):
+    db = servidor
+    asyncio.run(poblar(db, 300, n_productos=8))
+    asyncio.run(analitica.reconstruir(db))
+    return TestClient(server.app)
+
+
+def contadores(db, coleccion, campo_clave):
+    filas = asyncio.run(db[coleccion].find({}, {"_id": 0}).to_list(length=None))
+    return {f[campo_clave]: {c: f.get(c, 0) for c in analitica.CAMPOS} for f in filas}
+
+
+def test_contadores_incrementales_igual_a_reconstruidos(cliente_http):
+    db = server.db
+    rnd = random.Random(5)
+    ids = [v["id"] for v in asyncio.run(db.ventas.find({}, {"id": 1}).to_list(length=None))]
+    cliente_ids = [c["id"] for c in asyncio.run(db.clientes.find({}, {"id": 1}).to_list(length=None))]
+
+    for _ in range(20):
+        cliente_http.post("/api/ventas", json={
+            "cliente_id": rnd.choice(cliente_ids), "producto": "Producto nuevo", "fecha_venta": "2024-03-01",
+            "valor_venta": 2000, "ganancia": rnd.choice([300, 700]),
+        })
+    for venta_id in rnd.sample(ids, 40):
+        cliente_http.put(f"/api/ventas/{venta_id}", json={"entregado": rnd.choice([True, False]), "valor_perdida": 10})
+    cliente_http.put("/api/ventas/estado", json=[
+        {"id": venta_id, "entregado": rnd.choice([True, False]), "valor_perdida": 5} for venta_id in rnd.sample(ids, 40)
+    ])
+
+    incrementales = {c: contadores(db, c, k) for c, k in analitica.COLECCIONES.items()}
+    asyncio.run(analitica.reconstruir(db))
+    for coleccion, campo_clave in analitica.COLECCIONES.items():
+        reconstruidos = contadores(db, coleccion, campo_clave)
+        assert set(incrementales[coleccion]) == set(reconstruidos)
+        for clave, campos in reconstruidos.items():
+            assert incrementales[coleccion][clave] == pytest.approx(campos)
+
+
+@pytest.mark.parametrize("orden", analitica.ORDENES)
+def test_ranking_igual_a_ordenar_todo(cliente_http, orden):
+    todos = [
+        {"producto": c["producto"], **analitica.metricas(c)}
+        for c in asyncio.run(server.db.analitica_productos.find({}, {"_id": 0}).to_list(length=None))
+    ]
+    esperado = sorted(todos, key=lambda f: (f[orden], f["ventas"]), reverse=True)[:3]
+
+    respuesta = cliente_http.get("/api/analytics/productos", params={"orden": orden, "limit": 3})
+    assert respuesta.status_code == 200
+    assert [f[orden] for f in respuesta.json()] == [f[orden] for f in esperado]
+
+
+def test_analitica_clientes(cliente_http):
+    filas = cliente_http.get("/api/analytics/clientes", params={"orden": "tasa_devolucion", "minimo_ventas": 2}).json()
+    assert len(filas) == 10
+    assert all(f["ventas"] >= 2 and f["cliente_nombre"] for f in filas)
+    assert all(0 <= f["tasa_devolucion"] <= 1 and 0.2 <= f["margen_promedio"] <= 0.4 for f in filas)
+    assert cliente_http.get("/api/analytics/clientes", params={"orden": "nombre"}).status_code == 400
+
+
+def test_contadores_con_escrituras_durante_la_reconstruccion(cliente_http, monkeypatch):
+    db = server.db
+    cliente_ids = [c["id"] for c in asyncio.run(db.clientes.find({}, {"id": 1}).to_list(length=None))]
+    coleccion = type(db.ventas)
+    bulk_write = coleccion.bulk_write
+
+    async def con_latencia(self, *args, **kwargs):
+        if self.name.endswith("_tmp"):
+            await asyncio.sleep(0.01)
+        return await bulk_write(self, *args, **kwargs)
+
+    monkeypatch.setattr(coleccion, "bulk_write", con_latencia)
+
+    async def vender():
+        for i, cliente_id in enumerate(cliente_ids[:30]):
+            venta = {"id": f"nueva-{i}", "cliente_id": cliente_id, "producto": f"Producto {i % 3}",
+                     "fecha_venta": "2024-03-01", "valor_venta": 2000, "ganancia": 500, "entregado": True}
+            await db.ventas.insert_one(dict(venta))
+            await analitica.registrar_ventas(db, [(venta, 1)])
+            await asyncio.sleep(0)
+
+    async def ejecutar():
+        await asyncio.gather(analitica.reconstruir(db, tamano_lote=5), vender())
+
+    asyncio.run(ejecutar())
+    durante = {c: contadores(db, c, k) for c, k in analitica.COLECCIONES.items()}
+    asyncio.run(analitica.reconstruir(db))
+    for coleccion, campo_clave in analitica.COLECCIONES.items():
+        reconstruidos = contadores(db, coleccion, campo_clave)
+        assert set(durante[coleccion]) == set(reconstruidos)
+        for clave, campos in reconstruidos.items():
+            assert durante[coleccion][clave] == pytest.approx(campos)
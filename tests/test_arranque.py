@@ -0,0 +1,229 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import analitica
+import bloqueos
+import indices
+import resumen_diario
+import server
+from conexion import opciones_mongo
+from datos_demo import sembrar_demo
+
+
+def test_sembrar_demo_solo_en_base_vacia():
+    db = AsyncMongoMockClient()["test_sembrar"]
+
+    datos = asyncio.run(sembrar_demo(db))
+    assert datos == {"clientes": 4, "ventas": 30, "gastos": 3}
+    assert asyncio.run(sembrar_demo(db)) is None
+    assert asyncio.run(db.ventas.count_documents({})) == 30
+
+
+def test_sembrar_demo_una_sola_vez_con_varios_workers(monkeypatch):
+    db = AsyncMongoMockClient()["test_sembrar_workers"]
+    monkeypatch.setattr(bloqueos, "ESPERA", 0.01)
+    # mongomock responde sin ceder el bucle: una pausa en cada inserción simula la red
+    coleccion = type(db.ventas)
+    insert_many = coleccion.insert_many
+
+    async def con_latencia(self, *args, **kwargs):
+        await asyncio.sleep(0.01)
+        return await insert_many(self, *args, **kwargs)
+
+    monkeypatch.setattr(coleccion, "insert_many", con_latencia)
+
+    async def workers():
+        return await asyncio.gather(*(sembrar_demo(db) for _ in range(3)))
+
+    resultados = asyncio.run(workers())
+    assert sorted(resultados, key=bool) == [None, None, {"clientes": 4, "ventas": 30, "gastos": 3}]
+    assert asyncio.run(db.ventas.count_documents({})) == 30
+    assert asyncio.run(db.bloqueos.count_documents({})) == 0
+
+
+def test_preparar_reintenta_hasta_que_mongo_responde(monkeypatch, servidor):
+    db = servidor
+    monkeypatch.setattr(server, "REINTENTO_INICIAL", 0)
+    monkeypatch.setitem(server.arranque, "listo", False)
+    monkeypatch.setitem(server.arranque, "error", None)
+    asegurar_indices = server.asegurar_indices
+    errores = []
+
+    async def mongo_caido_al_principio(db):
+        if len(errores) < 2:
+            errores.append(server.arranque["error"])
+            raise ConnectionError("Mongo no responde")
+        return await asegurar_indices(db)
+
+    monkeypatch.setattr(server, "asegurar_indices", mongo_caido_al_principio)
+    asyncio.run(server.preparar())
+    # Tras el primer fallo el error queda publicado en /api/ready hasta el intento que funciona
+    assert errores == [None, "Mongo no responde"]
+    assert server.arranque == {"listo": True, "error": None}
+
+
+def test_reconstruccion_de_arranque_en_un_solo_worker(monkeypatch, servidor):
+    db = servidor
+    asyncio.run(sembrar_demo(db))
+    monkeypatch.setattr(bloqueos, "ESPERA", 0.01)
+    coleccion = type(db.ventas)
+    bulk_write = coleccion.bulk_write
+
+    async def con_latencia(self, *args, **kwargs):
+        await asyncio.sleep(0.01)
+        return await bulk_write(self, *args, **kwargs)
+
+    monkeypatch.setattr(coleccion, "bulk_write", con_latencia)
+    reconstrucciones = []
+    for modulo in (resumen_diario, analitica):
+        original = modulo._reconstruir
+
+        async def contar(db, *args, _modulo=modulo, _original=original, **kwargs):
+            reconstrucciones.append(_modulo.__name__)
+            return await _original(db, *args, **kwargs)
+
+        monkeypatch.setattr(modulo, "_reconstruir", contar)
+
+    async def workers():
+        await asyncio.gather(*(server.preparar() for _ in range(3)))
+        arranque = sorted(reconstrucciones)
+        resumen = await db.ventas_diarias.find({}, {"_id": 0}).sort([("fecha", 1), ("producto", 1)]).to_list(None)
+        productos = await db.analitica_productos.find({}, {"_id": 0}).sort("producto", 1).to_list(None)
+        await resumen_diario.reconstruir(db)
+        await analitica.reconstruir(db)
+        return arranque, (
+            resumen, await db.ventas_diarias.find({}, {"_id": 0}).sort([("fecha", 1), ("producto", 1)]).to_list(None),
+            productos, await db.analitica_productos.find({}, {"_id": 0}).sort("producto", 1).to_list(None),
+        )
+
+    arranque, (resumen, resumen_esperado, productos, productos_esperados) = asyncio.run(workers())
+    assert arranque == ["analitica", "resumen_diario"]
+    assert resumen == resumen_esperado and productos == productos_esperados
+    assert asyncio.run(db.list_collection_names()).count("ventas_diarias_tmp") == 0
+
+
+@pytest.mark.parametrize("sembrar", [False, True])
+def test_ready_tras_preparar(monkeypatch, sembrar, servidor):
+    db = servidor
+    monkeypatch.setattr(server, "SEED_DEMO", sembrar)
+    monkeypatch.setitem(server.arranque, "listo", False)
+    cliente = TestClient(server.app)
+
+    assert cliente.get("/api/ready").status_code == 503
+    asyncio.run(server.preparar())
+    respuesta = cliente.get("/api/ready")
+    assert respuesta.status_code == 200, respuesta.json()
+    assert respuesta.json() == {"listo": True}
+    assert (asyncio.run(db.ventas.count_documents({})) > 0) == sembrar
+
+
+def test_opciones_mongo_desde_entorno():
+    opciones = opciones_mongo({
+        "MONGO_MAX_POOL_SIZE": "200",
+        "MONGO_WAIT_QUEUE_TIMEOUT_MS": "1000",
+        "MONGO_READ_PREFERENCE": "secondaryPreferred",
+        "MONGO_MIN_POOL_SIZE": "",
+    })
+    assert opciones == {
+        "maxPoolSize": 200,
+        "waitQueueTimeoutMS": 1000,
+        "readPreference": "secondaryPreferred",
+        "serverSelectionTimeoutMS": 5000,
+        "connectTimeoutMS": 5000,
+    }
+
+
+def test_lifespan_crea_el_cliente_del_worker(monkeypatch):
+    monkeypatch.setattr(server, "client", None)
+    monkeypatch.setattr(server, "db", None)
+    monkeypatch.setitem(server.arranque, "listo", False)
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "7")
+
+    with TestClient(server.app) as cliente:
+        assert server.client.options.pool_options.max_pool_size == 7
+        assert server.db.name == server.DB_NAME
+        assert cliente.get("/api/ready").status_code == 503
+
+
+def test_asegurar_indices_es_idempotente_y_solo_informa_sin_crear():
+    db = AsyncMongoMockClient()["test_indices"]
+
+    async def revisar():
+        sin_crear = await indices.asegurar_indices(db, crear=False)
+        existentes = await db.ventas.index_information()
+        creados = await indices.asegurar_indices(db)
+        repetidos = await indices.asegurar_indices(db)
+        return sin_crear, existentes, creados, repetidos
+
+    sin_crear, existentes, creados, repetidos = asyncio.run(revisar())
+    assert set(sin_crear) == set(indices.INDICES)
+    assert {i["estado"] for estado in sin_crear.values() for i in estado} == {"falta"}
+    assert set(existentes) <= {"_id_"}  # solo informa, no crea nada
+    assert {i["estado"] for estado in creados.values() for i in estado} == {"creado"}
+    assert repetidos == {
+        coleccion: [{"nombre": d["name"], "estado": "ok"} for d in definiciones]
+        for coleccion, definiciones in indices.INDICES.items()
+    }
+
+
+def test_indice_distinto_se_informa_sin_tocarlo():
+    db = AsyncMongoMockClient()["test_indices_distintos"]
+
+    async def revisar():
+        await db.ventas_diarias.create_index([("fecha", 1), ("producto", 1)], name="propio")
+        estado = await indices.asegurar_indices(db)
+        return estado["ventas_diarias"], await db.ventas_diarias.index_information()
+
+    estado, existentes = asyncio.run(revisar())
+    assert estado == [{"nombre": "propio", "estado": "difiere", "esperado": {"unique": True}, "actual": {}}]
+    assert "unique" not in existentes["propio"]
+
+
+def test_admin_indices_resume_los_planes(monkeypatch, servidor):
+    db = servidor
+    plan = {"stage": "FETCH", "inputStage": {"stage": "OR", "inputStages": [
+        {"stage": "IXSCAN", "indexName": "entregado_fecha_venta"}, {"stage": "COLLSCAN"},
+    ]}}
+
+    async def explain(self):
+        return {"queryPlanner": {"winningPlan": plan}}
+
+    # mongomock no implementa explain()
+    monkeypatch.setattr(type(db.ventas.find({})), "explain", explain, raising=False)
+    respuesta = TestClient(server.app).get("/api/admin/indices")
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.json()
+    assert {i["estado"] for estado in cuerpo["indices"].values() for i in estado} == {"falta"}
+    assert asyncio.run(db.list_collection_names()) == []
+    assert set(cuerpo["consultas"]) == set(indices.consultas_principales())
+    assert cuerpo["consultas"]["ventas_pendientes"] == {
+        "coleccion": "ventas",
+        "filtro": {"entregado": None},
+        "etapas": ["FETCH", "OR", "IXSCAN", "COLLSCAN"],
+        "indices": ["entregado_fecha_venta"],
+        "collscan": True,
+    }
+
+
+def test_asegurar_reconstruye_aunque_ya_haya_escrituras():
+    db = AsyncMongoMockClient()["test_asegurar_con_escrituras"]
+    venta = {"producto": "P", "cliente_id": "c1", "fecha_venta": "2024-01-01",
+             "valor_venta": 100, "ganancia": 10, "entregado": True}
+
+    async def ejecutar():
+        await db.ventas.insert_many([dict(venta, id=str(i)) for i in range(100)])
+        # Una venta que llega mientras el worker todavía se prepara crea su fila
+        nueva = dict(venta, id="nueva")
+        await db.ventas.insert_one(dict(nueva))
+        await resumen_diario.registrar_ventas(db, [(nueva, 1)])
+        await analitica.registrar_ventas(db, [(nueva, 1)])
+        await resumen_diario.asegurar_resumen(db)
+        await analitica.asegurar_contadores(db)
+        return await db.ventas_diarias.find_one({"producto": "P"}), await db.analitica_productos.find_one({"producto": "P"})
+
+    fila, contador = asyncio.run(ejecutar())
+    assert fila["entregados"] == 101
+    assert contador["ventas"] == contador["entregados"] == 101
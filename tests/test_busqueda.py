@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import busqueda
+import server
+
+
+@pytest.fixture
+def cliente(servidor):
+    return TestClient(server.app), servidor
+
+
+def test_palabras_sin_acentos_ni_mayusculas():
+    assert busqueda.palabras("  José PEÑA-Díaz ") == ["jose", "pena", "diaz"]
+    assert busqueda.terminos_cliente({"nombre": "Ana", "apellidos": "Díaz", "telefono": "+57 300-123"}) == \
+        ["ana", "diaz", "57300123"]
+
+
+def test_buscar_clientes(cliente):
+    cliente_http, db = cliente
+    for nombre, apellidos, telefono in [
+        ("Anabel", "Díez", "3109990000"), ("Ana", "Díaz Peña", "300 123 4567"), ("José", "Peña", "3201112233"),
+        ("Luis", "Ánaya", "3005550000"),
+    ]:
+        cliente_http.post("/api/clientes", json={"nombre": nombre, "apellidos": apellidos, "telefono": telefono})
+
+    def buscar(q, **params):
+        respuesta = cliente_http.get("/api/clientes/buscar", params={"q": q, **params})
+        assert respuesta.status_code == 200
+        return [f"{c['nombre']} {c['apellidos']}" for c in respuesta.json()]
+
+    # Exacta primero, después las que empiezan por el texto y luego el resto por apellidos
+    assert buscar("ana") == ["Ana Díaz Peña", "Anabel Díez", "Luis Ánaya"]
+    assert buscar("PENA") == ["Ana Díaz Peña", "José Peña"]
+    assert buscar("ana pe") == ["Ana Díaz Peña"]
+    assert buscar("3001") == ["Ana Díaz Peña"]
+    assert buscar("ana", limit=1) == ["Ana Díaz Peña"]
+    assert buscar("xyz") == []
+
+    respuesta = cliente_http.get("/api/clientes/buscar", params={"q": "jose"}).json()
+    assert set(respuesta[0]) == {"id", "nombre", "apellidos", "telefono"}
+    assert all("busqueda" not in c for c in cliente_http.get("/api/clientes").json())
+    assert cliente_http.get("/api/clientes/buscar", params={"q": ""}).status_code == 422
+
+
+def test_buscar_productos(cliente):
+    cliente_http, _ = cliente
+    for producto, n in [("Cafetera", 3), ("Café molido", 1), ("Té verde", 2), ("Café en grano", 2)]:
+        for _ in range(n):
+            cliente_http.post("/api/ventas", json={
+                "cliente_id": "c1", "producto": producto, "fecha_venta": "2024-01-01", "valor_venta": 10, "ganancia": 3,
+            })
+
+    productos = cliente_http.get("/api/ventas/productos", params={"q": "cafe"}).json()
+    # Los que tienen la palabra exacta van primero, ordenados por ventas
+    assert productos == [
+        {"producto": "Café en grano", "ventas": 2}, {"producto": "Café molido", "ventas": 1},
+        {"producto": "Cafetera", "ventas": 3},
+    ]
+    assert cliente_http.get("/api/ventas/productos", params={"q": "te"}).json()[0]["producto"] == "Té verde"
+
+
+def test_indexar_completa_los_documentos_anteriores(cliente):
+    cliente_http, db = cliente
+
+    async def preparar():
+        await db.clientes.insert_one({"id": "c1", "nombre": "Ángela", "apellidos": "Ruiz", "telefono": "1"})
+        await db.analitica_productos.insert_one({"producto": "Galletas", "ventas": 4})
+        return await busqueda.indexar(db), await busqueda.indexar(db)
+
+    primera, segunda = asyncio.run(preparar())
+    assert primera == {"clientes": 1, "analitica_productos": 1}
+    assert set(segunda.values()) == {0}
+    assert [c["id"] for c in cliente_http.get("/api/clientes/buscar", params={"q": "angela"}).json()] == ["c1"]
+    assert cliente_http.get("/api/ventas/productos", params={"q": "gall"}).json() == [{"producto": "Galletas", "ventas": 4}]
@@ -0,0 +1,131 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+from cache import CacheTTL, NombresClientes
+
+
+def test_fallos_concurrentes_se_calculan_una_vez():
+    cache = CacheTTL()
+    llamadas = 0
+
+    async def calcular():
+        nonlocal llamadas
+        llamadas += 1
+        await asyncio.sleep(0.01)
+        return {"total": 1}
+
+    async def ejecutar():
+        clave = cache.clave("dashboard", fecha_inicio=None, granularidad="dia")
+        return await asyncio.gather(*(cache.obtener(clave, ("ventas",), calcular) for _ in range(10)))
+
+    resultados = asyncio.run(ejecutar())
+    assert llamadas == 1
+    assert all(r == {"total": 1} for r in resultados)
+    assert cache.estadisticas()["fallos"] == 1
+    assert cache.estadisticas()["coalescidos"] == 9
+
+
+def test_invalidacion_por_coleccion_y_lru():
+    cache = CacheTTL(tamano_maximo=2)
+
+    async def valor(v):
+        return v
+
+    async def ejecutar():
+        await cache.obtener(("dashboard",), ("ventas", "gastos"), lambda: valor(1))
+        await cache.obtener(("clientes",), ("clientes",), lambda: valor(2))
+        cache.invalidar("gastos")
+        assert await cache.obtener(("clientes",), ("clientes",), lambda: valor(3)) == 2
+        assert await cache.obtener(("dashboard",), ("ventas", "gastos"), lambda: valor(4)) == 4
+        # La tercera clave expulsa a la menos usada recientemente (clientes)
+        await cache.obtener(("pendientes",), ("ventas",), lambda: valor(5))
+        assert await cache.obtener(("clientes",), ("clientes",), lambda: valor(6)) == 6
+
+    asyncio.run(ejecutar())
+    assert cache.estadisticas()["expulsados"] == 2
+
+
+def test_cancelar_al_primero_no_cancela_a_los_agrupados():
+    cache = CacheTTL()
+
+    async def calcular():
+        await asyncio.sleep(0.02)
+        return {"total": 1}
+
+    async def ejecutar():
+        primero = asyncio.create_task(cache.obtener(("dashboard",), ("ventas",), calcular))
+        await asyncio.sleep(0)
+        agrupados = [asyncio.create_task(cache.obtener(("dashboard",), ("ventas",), calcular)) for _ in range(3)]
+        await asyncio.sleep(0)
+        primero.cancel()  # el cliente que inició el cálculo se desconecta
+        resultados = await asyncio.gather(primero, *agrupados, return_exceptions=True)
+        return resultados, await cache.obtener(("dashboard",), ("ventas",), calcular)
+
+    resultados, despues = asyncio.run(ejecutar())
+    assert isinstance(resultados[0], asyncio.CancelledError)
+    assert resultados[1:] == [{"total": 1}] * 3
+    # El cálculo terminó y quedó guardado aunque el primero se cancelara
+    assert despues == {"total": 1} and cache.estadisticas()["aciertos"] == 1
+
+
+def contar_consultas(db, monkeypatch):
+    consultas = []
+    coleccion = type(db.clientes)
+    original = coleccion.find
+
+    def registrar(self, filtro=None, *args, **kwargs):
+        if self.name == "clientes":
+            consultas.append(filtro)
+        return original(self, filtro, *args, **kwargs)
+
+    monkeypatch.setattr(coleccion, "find", registrar)
+    return consultas
+
+
+def test_nombres_clientes_consulta_solo_los_desconocidos(monkeypatch):
+    db = AsyncMongoMockClient()["test_nombres"]
+    asyncio.run(db.clientes.insert_many([
+        {"id": f"c{i}", "nombre": f"Nombre{i}", "apellidos": "Apellido"} for i in range(4)
+    ]))
+    consultas = contar_consultas(db, monkeypatch)
+    nombres = NombresClientes(tamano_maximo=3)
+
+    async def ejecutar():
+        primera = await nombres.obtener(db, ["c0", "c1", "c0", "falta"])
+        segunda = await nombres.obtener(db, ["c0", "c1"])
+        tercera = await nombres.obtener(db, ["c1", "c2", "c3"])
+        return primera, segunda, tercera
+
+    primera, segunda, tercera = asyncio.run(ejecutar())
+    assert primera == segunda == {"c0": "Nombre0 Apellido", "c1": "Nombre1 Apellido"}
+    assert tercera == {f"c{i}": f"Nombre{i} Apellido" for i in (1, 2, 3)}
+    # Una consulta por llamada con faltantes; los desconocidos se vuelven a buscar
+    assert len(consultas) == 2
+    assert sorted(consultas[0]["id"]["$in"]) == ["c0", "c1", "falta"]
+    assert sorted(consultas[1]["id"]["$in"]) == ["c2", "c3"]
+    # Con tamano_maximo=3 se expulsa el menos usado (c0)
+    assert list(nombres._nombres) == ["c1", "c2", "c3"]
+
+
+def test_pendientes_con_nombre_de_cliente(monkeypatch, servidor):
+    db = servidor
+    cliente = TestClient(server.app)
+    ana = cliente.post("/api/clientes", json={"nombre": "Ana", "apellidos": "Díaz", "telefono": "300"}).json()["id"]
+    for cliente_id, entregado in [(ana, None), ("borrado", None), (ana, True)]:
+        venta = cliente.post("/api/ventas", json={
+            "cliente_id": cliente_id, "producto": "P", "fecha_venta": "2024-01-10", "valor_venta": 1000,
+            "ganancia": 300,
+        }).json()["id"]
+        if entregado:
+            cliente.put(f"/api/ventas/{venta}", json={"entregado": True})
+
+    # Ana se guardó al crearla: solo se consulta el cliente que no se conoce
+    consultas = contar_consultas(db, monkeypatch)
+    pendientes = cliente.get("/api/ventas/pendientes").json()
+    assert sorted((v["cliente_id"], v["cliente_nombre"]) for v in pendientes) == [
+        (ana, "Ana Díaz"), ("borrado", "Cliente no encontrado"),
+    ]
+    assert [c["id"]["$in"] for c in consultas] == [["borrado"]]
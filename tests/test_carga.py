@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import datos_demo
+import server
+from benchmarks import carga
+
+
+def test_poblar_genera_datos_reproducibles_por_lotes(monkeypatch):
+    lotes = []
+    coleccion = type(AsyncMongoMockClient()["test_poblar"].ventas)
+    original = coleccion.insert_many
+
+    async def registrar(self, documentos, *args, **kwargs):
+        lotes.append((self.name, len(documentos)))
+        return await original(self, documentos, *args, **kwargs)
+
+    monkeypatch.setattr(coleccion, "insert_many", registrar)
+
+    async def poblar(nombre):
+        db = AsyncMongoMockClient()[nombre]
+        datos = await datos_demo.poblar(db, 6000, dias=30, semilla=7)
+        ventas = await db.ventas.find({}, {"_id": 0}).to_list(length=None)
+        clientes = await db.clientes.find({}, {"_id": 0, "id": 1}).to_list(length=None)
+        return datos, ventas, {c["id"] for c in clientes}
+
+    datos, ventas, clientes = asyncio.run(poblar("test_poblar"))
+    assert datos == {"clientes": 600, "ventas": 6000, "gastos": 6}
+    assert lotes == [("clientes", 600), ("ventas", 5000), ("ventas", 1000), ("gastos", 6)]
+    assert asyncio.run(poblar("test_poblar_otra_vez"))[1] == ventas
+
+    assert {v["cliente_id"] for v in ventas} <= clientes
+    assert len({v["producto"] for v in ventas}) == 50
+    estados = [v["entregado"] for v in ventas]
+    assert estados.count(None) / len(ventas) == pytest.approx(0.4, abs=0.03)
+    assert estados.count(False) / len(ventas) == pytest.approx(0.2, abs=0.03)
+    assert all(v["valor_perdida"] > 0 for v in ventas if v["entregado"] is False)
+    assert all(v["fecha_entrega"] > v["fecha_venta"] for v in ventas if v["entregado"] is not None)
+    assert all(v["fecha_entrega"] is None for v in ventas if v["entregado"] is None)
+
+
+def test_prueba_de_carga_en_proceso(monkeypatch):
+    monkeypatch.setattr(server, "db", None)
+    args = carga.argparse.Namespace(
+        mongo_url=None, db="test_carga", sin_poblar=False, ventas=200, dias=30, semilla=1, url=None,
+        sin_cache=True, escenarios="dashboard,ventas_pendientes,actualizar_venta,actualizar_estados",
+        peticiones=8, concurrencia=3,
+    )
+    informe = asyncio.run(carga.ejecutar(args))
+    assert informe["datos"]["ventas"] == 200
+    assert (informe["modo"], informe["mongo"], informe["cache"]) == ("asgi", "mongomock", False)
+    assert set(informe["escenarios"]) == set(args.escenarios.split(","))
+    for resultado in informe["escenarios"].values():
+        assert (resultado["peticiones"], resultado["errores"]) == (8, 0)
+        assert resultado["p50_ms"] <= resultado["p95_ms"] <= resultado["p99_ms"] <= resultado["max_ms"]
+    assert carga.percentil([1, 2, 3, 4], 50) == 2.5
+    assert carga.percentil([], 99) == 0.0
@@ -0,0 +1,209 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import estadisticas
+import etags
+import server
+from compresion import MiddlewareCompresion, elegir_codificacion
+
+
+class ColeccionSinConsultas:
+    """Colección que solo expone su nombre: cualquier consulta a Mongo falla el test"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, atributo):
+        raise AssertionError(f"Consulta a Mongo inesperada: {self.name}.{atributo}")
+
+
+class SoloVersiones:
+    """Base en la que solo se puede leer la colección de versiones de los ETags"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, nombre):
+        return self[nombre]
+
+    def __getitem__(self, nombre):
+        return self.db[nombre] if nombre == etags.COLECCION else ColeccionSinConsultas(nombre)
+
+
+@pytest.fixture
+def cliente():
+    return TestClient(server.app)
+
+
+def crear_ventas(cliente, n):
+    for i in range(n):
+        cliente.post("/api/ventas", json={
+            "cliente_id": "c1", "producto": f"Producto {i % 5}", "fecha_venta": "2024-01-01",
+            "valor_venta": 100, "ganancia": 30,
+        })
+
+
+def test_elegir_codificacion():
+    assert elegir_codificacion("gzip, deflate") == "gzip"
+    assert elegir_codificacion("gzip;q=0, identity") is None
+    assert elegir_codificacion("") is None
+
+
+def test_comprime_solo_las_respuestas_grandes(cliente):
+    crear_ventas(cliente, 40)
+
+    grande = cliente.get("/api/ventas", headers={"Accept-Encoding": "gzip"})
+    assert grande.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in grande.headers["vary"]
+    assert grande.headers["etag"].endswith('-gzip"')
+    assert len(grande.json()) == 40
+    assert int(grande.headers["content-length"]) < len(grande.content)
+
+    pequena = cliente.get("/api/ventas", params={"limit": 1}, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in pequena.headers
+    assert len(pequena.json()) == 1
+
+
+def test_sse_y_streaming():
+    async def eventos(request):
+        return StreamingResponse(iter([b"data: 1\n\n"] * 300), media_type="text/event-stream")
+
+    async def exportacion(request):
+        return StreamingResponse(iter([b"x" * 100] * 50), media_type="text/csv")
+
+    async def texto(request):
+        return PlainTextResponse("y" * 5000)
+
+    app = MiddlewareCompresion(Starlette(routes=[
+        Route("/eventos", eventos), Route("/exportacion", exportacion), Route("/texto", texto),
+    ]))
+    cliente = TestClient(app)
+
+    sse = cliente.get("/eventos", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in sse.headers
+    assert sse.content == b"data: 1\n\n" * 300
+
+    exportada = cliente.get("/exportacion", headers={"Accept-Encoding": "gzip"})
+    assert exportada.headers["content-encoding"] == "gzip" and exportada.content == b"x" * 5000
+
+    crudo = cliente.get("/texto", headers={"Accept-Encoding": "gzip"})
+    assert crudo.headers["content-encoding"] == "gzip" and crudo.text == "y" * 5000
+    assert "etag" not in crudo.headers
+
+
+def test_etag_responde_304_sin_consultar_los_datos(cliente, monkeypatch):
+    crear_ventas(cliente, 3)
+    cliente.post("/api/clientes", json={"nombre": "Ana", "apellidos": "Díaz", "telefono": "1"})
+    rutas = [
+        "/api/ventas", "/api/clientes", "/api/dashboard?granularidad=mes", "/api/ventas/pendientes",
+        "/api/analytics/productos",
+    ]
+    primeras = {ruta: cliente.get(ruta) for ruta in rutas}
+    assert all(r.status_code == 200 and r.headers["etag"] for r in primeras.values())
+
+    monkeypatch.setattr(server, "db", SoloVersiones(server.db))
+    for ruta, primera in primeras.items():
+        respuesta = cliente.get(ruta, headers={"If-None-Match": primera.headers["etag"]})
+        assert respuesta.status_code == 304 and respuesta.content == b""
+        assert respuesta.headers["etag"] == primera.headers["etag"]
+        # El ETag comprimido también vale para la versión sin comprimir
+        comprimido = primera.headers["etag"][:-1] + '-gzip"'
+        assert cliente.get(ruta, headers={"If-None-Match": f'W/"otro", {comprimido}'}).status_code == 304
+
+
+def test_escritura_cambia_el_etag(cliente):
+    crear_ventas(cliente, 2)
+    antes = cliente.get("/api/ventas").headers["etag"]
+    dashboard = cliente.get("/api/dashboard").headers["etag"]
+    clientes = cliente.get("/api/clientes").headers["etag"]
+
+    crear_ventas(cliente, 1)
+    respuesta = cliente.get("/api/ventas", headers={"If-None-Match": antes})
+    assert respuesta.status_code == 200 and len(respuesta.json()) == 3
+    assert respuesta.headers["etag"] != antes
+    assert cliente.get("/api/dashboard", headers={"If-None-Match": dashboard}).status_code == 200
+    # Las ventas no invalidan el listado de clientes
+    assert cliente.get("/api/clientes", headers={"If-None-Match": clientes}).status_code == 304
+
+
+def test_reconstrucciones_y_migracion_cambian_el_etag(cliente):
+    crear_ventas(cliente, 3)
+    rutas = ("/api/dashboard", "/api/analytics/productos", "/api/analytics/clientes", "/api/ventas")
+    anteriores = {ruta: cliente.get(ruta).headers["etag"] for ruta in rutas}
+
+    # Otro proceso (la CLI) reconstruye sin escribir ventas
+    asyncio.run(server.resumen_diario.reconstruir(server.db))
+    asyncio.run(server.analitica.reconstruir(server.db))
+    for ruta in rutas[:3]:
+        assert cliente.get(ruta, headers={"If-None-Match": anteriores[ruta]}).status_code == 200
+    assert cliente.get("/api/ventas", headers={"If-None-Match": anteriores["/api/ventas"]}).status_code == 304
+
+    asyncio.run(server.esquema.migrar(server.db, colecciones=("ventas",)))
+    assert cliente.get("/api/ventas", headers={"If-None-Match": anteriores["/api/ventas"]}).status_code == 200
+
+
+def test_dashboard_sin_rango_cambia_de_etag_a_medianoche(cliente, monkeypatch):
+    crear_ventas(cliente, 1)
+    hoy = cliente.get("/api/dashboard")
+
+    class Manana(date):
+        @classmethod
+        def today(cls):
+            return date.today() + timedelta(days=1)
+
+    monkeypatch.setattr(estadisticas, "date", Manana)
+    manana = cliente.get("/api/dashboard", headers={"If-None-Match": hoy.headers["etag"]})
+    assert manana.status_code == 200
+    assert manana.json()["ventas_por_dia"][-1]["fecha"] == (date.today() + timedelta(days=1)).isoformat()
+
+
+def test_sin_cache_los_etags_siguen_funcionando(monkeypatch):
+    monkeypatch.setattr(server.cache, "ttl", 0)
+    cliente = TestClient(server.app)
+    crear_ventas(cliente, 1)
+    primera = cliente.get("/api/dashboard")
+    assert primera.status_code == 200
+    assert cliente.get("/api/dashboard", headers={"If-None-Match": primera.headers["etag"]}).status_code == 304
+
+
+def test_etag_compartido_entre_workers(cliente):
+    crear_ventas(cliente, 2)
+    primera = cliente.get("/api/ventas")
+    # Otro worker: su cache y sus contadores de invalidación no tienen nada que ver con los de este
+    server.cache.limpiar()
+    server.cache.invalidar("ventas", "ventas")
+    assert cliente.get("/api/ventas", headers={"If-None-Match": primera.headers["etag"]}).status_code == 304
+
+    # Una escritura de otro worker sin change stream: solo cambia Mongo y la versión compartida
+    cacheada = cliente.get("/api/ventas/pendientes")
+    otra = {**cliente.get("/api/ventas").json()[0], "id": "otro-worker"}
+    asyncio.run(server.db.ventas.insert_one(otra))
+    asyncio.run(etags.incrementar(server.db, ["ventas"]))
+    for ruta, anterior in (("/api/ventas", primera), ("/api/ventas/pendientes", cacheada)):
+        respuesta = cliente.get(ruta, headers={"If-None-Match": anterior.headers["etag"]})
+        assert respuesta.status_code == 200 and len(respuesta.json()) == 3
+
+
+def test_gasto_de_otro_worker_llega_al_dashboard(cliente):
+    crear_ventas(cliente, 1)
+    antes = cliente.get("/api/dashboard").json()["inversion_publicidad"]
+    # Otro worker crea la campaña: este no pasa por registrar_gastos, solo cambia la versión compartida
+    gasto = {"id": "g1", "concepto": "Ads", "valor": 700, "fecha_inicio": "2024-01-01", "fecha_final": "2024-01-07"}
+    asyncio.run(server.db.gastos.insert_one(gasto))
+    asyncio.run(etags.incrementar(server.db, ["gastos"]))
+    assert cliente.get("/api/dashboard").json()["inversion_publicidad"] == antes + 700
+
+
+def test_coincide():
+    etag = etags.calcular(("ventas",), (("a1b2", 1),))
+    assert etags.coincide(etag, etag)
+    assert etags.coincide("*", etag)
+    assert etags.coincide(f'"a", W/{etag}', etag)
+    assert not etags.coincide('"a"', etag)
+    assert not etags.coincide(None, etag)
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import httpx
+
+import concurrencia
+import server
+from concurrencia import Limitador, Saturado, clase_ruta
+
+
+def test_limitador_rechaza_con_cola_llena_y_tras_esperar():
+    async def ejecutar():
+        limitador = Limitador("analitica", concurrencia=1, cola=1, espera=0.05)
+        await limitador.entrar()
+        esperando = asyncio.create_task(limitador.entrar())
+        await asyncio.sleep(0)
+        try:
+            await limitador.entrar()
+        except Saturado as e:
+            cola_llena = e.estado
+        try:
+            await esperando
+        except Saturado as e:
+            vencida = e.estado
+        limitador.salir()
+        await limitador.entrar()
+        return cola_llena, vencida, limitador.estadisticas()
+
+    cola_llena, vencida, estadisticas = asyncio.run(ejecutar())
+    assert (cola_llena, vencida) == (429, 503)
+    assert estadisticas["en_curso"] == 1 and estadisticas["en_cola"] == 0
+
+
+def test_clases_de_ruta():
+    assert clase_ruta("/api/dashboard") == "analitica"
+    assert clase_ruta("/api/analytics/productos") == "analitica"
+    assert clase_ruta("/api/ventas/123") == "crud"
+    assert clase_ruta("/api/eventos") is None
+    assert clase_ruta("/metrics") is None
+
+
+def ocupar_cpu(segundos):
+    fin = time.perf_counter() + segundos
+    total = 0
+    while time.perf_counter() < fin:
+        total += sum(range(1000))
+    return total
+
+
+def test_escrituras_con_latencia_acotada_bajo_carga_de_analitica(monkeypatch):
+    monkeypatch.setitem(concurrencia.limitadores, "analitica", Limitador("analitica", 2, 4, 5))
+    monkeypatch.setitem(concurrencia.limitadores, "crud", Limitador("crud", 64, 64, 5))
+
+    # mongomock ejecuta las agregaciones dentro del bucle de eventos; el cálculo se
+    # simula con 0.3 s de CPU en el pool, como el de pandas y las series del dashboard
+    calculos = []
+
+    async def calculo_pesado(*args, **kwargs):
+        inicio = time.perf_counter()
+        await concurrencia.en_hilo(ocupar_cpu, 0.3)
+        calculos.append(time.perf_counter() - inicio)
+        return {}
+
+    monkeypatch.setattr(server, "calcular_estadisticas", calculo_pesado)
+    venta = {"cliente_id": "c1", "producto": "P", "fecha_venta": "2024-01-01", "valor_venta": 10, "ganancia": 3}
+
+    async def ejecutar():
+        transporte = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+            await cliente.post("/api/ventas", json=venta)
+            dashboards = [
+                asyncio.create_task(cliente.get(
+                    "/api/dashboard", params={"fecha_inicio": f"2020-01-{i + 1:02d}", "fecha_final": "2024-12-31"}
+                ))
+                for i in range(12)
+            ]
+            await asyncio.sleep(0.05)
+            latencias = []
+            for _ in range(10):
+                inicio = time.perf_counter()
+                assert (await cliente.post("/api/ventas", json=venta)).status_code == 200
+                latencias.append(time.perf_counter() - inicio)
+            return latencias, await asyncio.gather(*dashboards)
+
+    latencias, dashboards = asyncio.run(ejecutar())
+    estados = sorted(r.status_code for r in dashboards)
+    # 2 en curso y 4 en cola terminan; el resto se rechaza en el acto
+    assert estados == [200] * 6 + [429] * 6
+    assert all(r.headers["retry-after"] for r in dashboards if r.status_code == 429)
+    # Cada escritura tarda menos que un solo cálculo del dashboard, medido en la misma máquina
+    assert len(calculos) == 6
+    assert max(latencias) < min(calculos)
@@ -0,0 +1,180 @@
+import asyncio
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from bson import Binary
+from bson.int64 import Int64
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import analitica
+import esquema
+import resumen_diario
+import server
+from datos_demo import poblar
+from estadisticas import calcular_estadisticas
+
+
+def test_conversion_ida_y_vuelta():
+    venta = {
+        "id": esquema.nuevo_id(), "cliente_id": "c1", "producto": "Producto 1", "fecha_venta": "2024-02-29",
+        "fecha_entrega": None, "valor_venta": 1234.56, "ganancia": 0.1 + 0.2, "entregado": None, "valor_perdida": 0,
+    }
+    v2 = esquema.a_v2("ventas", venta)
+
+    assert isinstance(v2["_id"], Binary) and "id" not in v2
+    assert v2["fecha_venta"] == datetime(2024, 2, 29)
+    assert v2["valor_venta"] == Int64(123456) and v2["ganancia"] == 30
+    assert esquema.a_api("ventas", v2) == {**venta, "ganancia": 0.3}
+    assert esquema.a_api("ventas", {"_id": 1, **venta}) == venta
+
+
+def test_ids_v7_crecen_en_orden_de_creacion():
+    ids = [esquema.nuevo_id() for _ in range(50)]
+    assert all(i[14] == "7" for i in ids)
+    assert [i[:13] for i in ids] == sorted(i[:13] for i in ids)
+
+
+@pytest.fixture
+def cliente_v2(monkeypatch, servidor):
+    monkeypatch.setattr(esquema, "ESQUEMA", 2)
+    return TestClient(server.app), servidor
+
+
+def test_api_con_esquema_v2(cliente_v2):
+    cliente_http, db = cliente_v2
+    hoy = date.today().isoformat()
+    cliente_id = cliente_http.post("/api/clientes", json={"nombre": "Ana", "apellidos": "Díaz", "telefono": "1"}).json()["id"]
+    ids = [
+        cliente_http.post("/api/ventas", json={
+            "cliente_id": cliente_id, "producto": "Producto 1", "fecha_venta": hoy,
+            "valor_venta": 100.1, "ganancia": 30.1,
+        }).json()["id"]
+        for _ in range(3)
+    ]
+    cliente_http.post("/api/gastos", json={"concepto": "Ads", "valor": 70, "fecha_inicio": hoy, "fecha_final": hoy})
+
+    assert cliente_http.put(f"/api/ventas/{ids[0]}", json={"entregado": True, "fecha_entrega": hoy}).status_code == 200
+    estados = cliente_http.put("/api/ventas/estado", json=[{"id": ids[1], "entregado": False, "valor_perdida": 5.5}])
+    assert estados.json()["modificadas"] == 1
+
+    guardada = asyncio.run(db.ventas.find_one({"_id": esquema.binario(ids[0])}))
+    assert guardada["fecha_entrega"] == datetime.fromisoformat(hoy) and guardada["ganancia"] == 3010
+    assert asyncio.run(db.ventas.count_documents({"id": {"$exists": True}})) == 0
+
+    ventas = cliente_http.get("/api/ventas").json()
+    assert sorted(v["id"] for v in ventas) == sorted(ids)
+    assert {v["fecha_venta"] for v in ventas} == {hoy}
+    pendientes = cliente_http.get("/api/ventas/pendientes").json()
+    assert [(v["id"], v["cliente_nombre"], v["valor_venta"]) for v in pendientes] == [(ids[2], "Ana Díaz", 100.1)]
+
+    dashboard = cliente_http.get("/api/dashboard").json()
+    assert dashboard["ganancias_totales"] == pytest.approx(30.1)
+    assert dashboard["perdidas_totales"] == pytest.approx(5.5)
+    assert dashboard["inversion_publicidad"] == pytest.approx(70)
+    assert (dashboard["productos_vendidos"], dashboard["productos_devueltos"]) == (1, 1)
+
+
+def test_arranque_reconstruye_id_unico_sin_sparse(cliente_v2, monkeypatch):
+    cliente_http, db = cliente_v2
+    monkeypatch.setitem(server.arranque, "listo", False)
+
+    async def indices_originales():
+        for nombre in ("ventas", "clientes", "gastos"):
+            await db[nombre].create_index([("id", 1)], name="id_unico", unique=True)
+
+    asyncio.run(indices_originales())
+    asyncio.run(server.preparar())
+    assert server.arranque["listo"]
+    assert asyncio.run(db.ventas.index_information())["id_unico"].get("sparse")
+    # Los documentos v2 no tienen id: con el índice original el segundo chocaría con el primero
+    for _ in range(2):
+        respuesta = cliente_http.post("/api/ventas", json={
+            "cliente_id": "c1", "producto": "P", "fecha_venta": "2024-01-01", "valor_venta": 10, "ganancia": 3,
+        })
+        assert respuesta.status_code == 200
+
+
+def test_lecturas_con_versiones_mezcladas_y_migracion():
+    rango = (date.today() - timedelta(days=60), date.today())
+
+    async def estado(db, motor_resumen="mongo"):
+        await resumen_diario.reconstruir(db)
+        await analitica.reconstruir(db)
+        return {
+            "ventas": await calcular_estadisticas(db, *rango, fuente="ventas", motor="mongo"),
+            "columnar": await calcular_estadisticas(db, *rango, fuente="ventas", motor="columnar"),
+            "resumen": await calcular_estadisticas(db, *rango, motor=motor_resumen),
+            "productos": await analitica.ranking(db.analitica_productos, "producto", "ganancia", 100),
+        }
+
+    async def ejecutar():
+        db = AsyncMongoMockClient()["test_migracion"]
+        await poblar(db, 400, dias=60, n_productos=6)
+        antes = await estado(db)
+
+        # La mitad de las ventas pasa a v2 como si la migración estuviera a medias
+        ventas = await db.ventas.find({}).to_list(length=None)
+        for venta in random.Random(1).sample(ventas, 200):
+            await db.ventas.insert_one(esquema.a_v2("ventas", venta))
+            await db.ventas.delete_one({"_id": venta["_id"]})
+        # mongomock no compara ObjectId con binarios en $min; Mongo los ordena por tipo BSON
+        mezcla = await estado(db, motor_resumen="columnar")
+
+        migrados = await esquema.migrar(db, tamano_lote=64)
+        despues = await estado(db)
+        return antes, mezcla, migrados, despues, await esquema.migrar(db), db
+
+    antes, mezcla, migrados, despues, repetida, db = asyncio.run(ejecutar())
+
+    assert migrados["ventas"] == 200 and migrados["clientes"] == 40 and migrados["gastos"] == 3
+    assert set(repetida.values()) == {0}
+    for resultado in (mezcla, despues):
+        for clave in ("ventas", "columnar", "resumen"):
+            for campo in ("ganancias_totales", "perdidas_totales", "inversion_publicidad"):
+                assert resultado[clave][campo] == pytest.approx(antes[clave][campo])
+            assert resultado[clave]["ventas_por_dia"] == antes[clave]["ventas_por_dia"]
+            assert sorted(p["producto"] for p in resultado[clave]["ganancias_por_producto"]) == \
+                sorted(p["producto"] for p in antes[clave]["ganancias_por_producto"])
+        assert [(p["producto"], p["ventas"]) for p in resultado["productos"]] == \
+            [(p["producto"], p["ventas"]) for p in antes["productos"]]
+
+
+def test_cursor_recorre_versiones_mezcladas(monkeypatch, servidor):
+    db = servidor
+    cliente_http = TestClient(server.app)
+    for i in range(20):
+        if i == 10:
+            monkeypatch.setattr(esquema, "ESQUEMA", 2)
+        cliente_http.post("/api/ventas", json={
+            "cliente_id": "c1", "producto": "P", "fecha_venta": f"2024-01-{i % 3 + 1:02d}",
+            "valor_venta": 10, "ganancia": 3,
+        })
+
+    vistos, cursor = [], None
+    while True:
+        respuesta = cliente_http.get("/api/ventas", params={"limit": 4, **({"cursor": cursor} if cursor else {})})
+        vistos += [v["id"] for v in respuesta.json()]
+        cursor = respuesta.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(vistos) == len(set(vistos)) == 20
+
+
+def test_migracion_conserva_la_copia_v2_ya_modificada():
+    async def ejecutar():
+        db = AsyncMongoMockClient()["test_copia_previa"]
+        venta = {
+            "id": esquema.nuevo_id(), "cliente_id": "c1", "producto": "P", "fecha_venta": "2024-01-01",
+            "fecha_entrega": None, "valor_venta": 10.0, "ganancia": 3.0, "entregado": None, "valor_perdida": 0,
+        }
+        await db.ventas.insert_one(dict(venta))
+        # Copia de una migración interrumpida que después recibió una escritura con ESQUEMA_DATOS=2
+        await db.ventas.insert_one(esquema.a_v2("ventas", {**venta, "entregado": True}))
+        await esquema.migrar_coleccion(db, "ventas")
+        return await db.ventas.find({}).to_list(length=None)
+
+    documentos = asyncio.run(ejecutar())
+    assert len(documentos) == 1
+    assert esquema.version(documentos[0]) == 2 and documentos[0]["entregado"] is True
@@ -0,0 +1,320 @@
+import asyncio
+import math
+import random
+import uuid
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from pymongo import ReturnDocument
+
+import resumen_diario
+import server
+from publicidad import IndicePublicidad
+from estadisticas import calcular_estadisticas, dias_del_periodo, serie_ventas
+
+
+def generar_datos(n_ventas=500, semilla=7):
+    """Ventas y gastos aleatorios con la misma forma que crear_datos_demo"""
+    rnd = random.Random(semilla)
+    hoy = date.today()
+    productos = [f"Producto {c}" for c in "ABCDEFG"]
+    ventas = []
+    for _ in range(n_ventas):
+        entregado = rnd.choice([None, True, True, False])
+        ventas.append({
+            "id": str(uuid.uuid4()),
+            "cliente_id": str(uuid.uuid4()),
+            "producto": rnd.choice(productos),
+            "fecha_venta": (hoy - timedelta(days=rnd.randint(0, 60))).isoformat(),
+            "valor_venta": round(rnd.uniform(50000, 500000), 2),
+            "ganancia": round(rnd.uniform(10000, 150000), 2),
+            "entregado": entregado,
+            "valor_perdida": round(rnd.uniform(10000, 50000), 2) if entregado is False else 0,
+        })
+    gastos = []
+    for _ in range(20):
+        inicio = hoy - timedelta(days=rnd.randint(0, 60))
+        gastos.append({
+            "id": str(uuid.uuid4()),
+            "concepto": "Ads",
+            "valor": rnd.randint(10000, 300000),
+            "fecha_inicio": inicio.isoformat(),
+            "fecha_final": (inicio + timedelta(days=rnd.randint(0, 15))).isoformat(),
+        })
+    return ventas, gastos
+
+
+def inversion_diaria(gastos):
+    """Gasto de cada día repartiendo cada campaña a partes iguales entre sus días"""
+    por_dia = {}
+    for gasto in gastos:
+        inicio = date.fromisoformat(gasto["fecha_inicio"])
+        dias = (date.fromisoformat(gasto["fecha_final"]) - inicio).days + 1
+        for i in range(dias):
+            dia = (inicio + timedelta(days=i)).isoformat()
+            por_dia[dia] = por_dia.get(dia, 0) + gasto["valor"] / dias
+    return por_dia
+
+
+def estadisticas_en_python(ventas, gastos, fecha_inicio_dt=None, fecha_final_dt=None):
+    """Cálculo original de get_dashboard sobre listas en memoria, con la inversión prorrateada"""
+    inversion_publicidad = sum(g["valor"] for g in gastos)
+    if fecha_inicio_dt and fecha_final_dt:
+        ini, fin = fecha_inicio_dt.isoformat(), fecha_final_dt.isoformat()
+        ventas = [v for v in ventas if ini <= v["fecha_venta"] <= fin]
+        inversion_publicidad = sum(v for d, v in inversion_diaria(gastos).items() if ini <= d <= fin)
+
+    ventas_por_dia = []
+    if fecha_inicio_dt and fecha_final_dt:
+        actual = fecha_inicio_dt
+        while actual <= fecha_final_dt:
+            ventas_por_dia.append({
+                "fecha": actual.isoformat(),
+                "ventas": len([v for v in ventas if v["fecha_venta"] == actual.isoformat() and v.get("entregado") == True]),
+            })
+            actual += timedelta(days=1)
+    else:
+        for i in range(7):
+            fecha = date.today() - timedelta(days=i)
+            ventas_por_dia.append({
+                "fecha": fecha.isoformat(),
+                "ventas": len([v for v in ventas if v["fecha_venta"] == fecha.isoformat() and v.get("entregado") == True]),
+            })
+        ventas_por_dia.reverse()
+
+    productos = {}
+    for venta in ventas:
+        if venta.get("entregado") == True:
+            productos[venta["producto"]] = productos.get(venta["producto"], 0) + venta["ganancia"]
+
+    return {
+        "ganancias_totales": sum(v["ganancia"] for v in ventas if v.get("entregado") == True),
+        "perdidas_totales": sum(v.get("valor_perdida", 0) for v in ventas if v.get("entregado") == False),
+        "inversion_publicidad": inversion_publicidad,
+        "productos_vendidos": len([v for v in ventas if v.get("entregado") == True]),
+        "productos_devueltos": len([v for v in ventas if v.get("entregado") == False]),
+        "ventas_por_dia": ventas_por_dia,
+        "ganancias_por_producto": [{"producto": k, "ganancia": v} for k, v in productos.items()],
+    }
+
+
+def comparar(obtenido, esperado):
+    for campo in ("ganancias_totales", "perdidas_totales", "inversion_publicidad"):
+        assert obtenido[campo] == pytest.approx(esperado[campo])
+    for campo in ("productos_vendidos", "productos_devueltos", "ventas_por_dia"):
+        assert obtenido[campo] == esperado[campo]
+    assert [p["producto"] for p in obtenido["ganancias_por_producto"]] == \
+        [p["producto"] for p in esperado["ganancias_por_producto"]]
+    for p_obtenido, p_esperado in zip(obtenido["ganancias_por_producto"], esperado["ganancias_por_producto"]):
+        assert p_obtenido["ganancia"] == pytest.approx(p_esperado["ganancia"])
+
+
+def test_indice_publicidad_prorratea_solapamientos():
+    _, gastos = generar_datos()
+    gastos.append({"valor": 90, "fecha_inicio": "2000-01-01", "fecha_final": "2099-12-31"})
+    indice = IndicePublicidad(gastos)
+    esperado = inversion_diaria(gastos)
+    inicio, final = date.today() - timedelta(days=70), date.today() + timedelta(days=5)
+
+    por_dia = indice.por_dia(inicio, final)
+    assert set(por_dia) == {d for d in esperado if inicio.isoformat() <= d <= final.isoformat()}
+    for dia, valor in por_dia.items():
+        assert valor == pytest.approx(esperado[dia])
+    # La campaña que cubre todo el rango también cuenta, solo por los días del rango
+    assert indice.total(date(2050, 1, 1), date(2050, 1, 10)) == pytest.approx(90 * 10 / len(esperado_dias(gastos[-1])))
+    assert indice.total() == pytest.approx(sum(g["valor"] for g in gastos))
+
+
+def esperado_dias(gasto):
+    return range((date.fromisoformat(gasto["fecha_final"]) - date.fromisoformat(gasto["fecha_inicio"])).days + 1)
+
+
+@pytest.mark.parametrize("motor", ["mongo", "columnar"])
+@pytest.mark.parametrize("fuente", ["ventas", "resumen"])
+@pytest.mark.parametrize("dias_atras", [None, (45, 10), (5, 5), (90, 70)])
+def test_agregacion_igual_a_calculo_en_python(dias_atras, fuente, motor):
+    ventas, gastos = generar_datos()
+    hoy = date.today()
+    rango = (hoy - timedelta(days=dias_atras[0]), hoy - timedelta(days=dias_atras[1])) if dias_atras else (None, None)
+
+    async def ejecutar():
+        db = AsyncMongoMockClient()["test_estadisticas"]
+        await db.ventas.insert_many([dict(v) for v in ventas])
+        await db.gastos.insert_many([dict(g) for g in gastos])
+        await resumen_diario.reconstruir(db)
+        # La inversión sale del índice de campañas: el resumen solo tiene filas de productos
+        assert await db.ventas_diarias.count_documents({"producto": None}) == 0
+        return await calcular_estadisticas(db, *rango, fuente=fuente, motor=motor)
+
+    comparar(asyncio.run(ejecutar()), estadisticas_en_python(ventas, gastos, *rango))
+
+
+@pytest.mark.parametrize("fuente", ["ventas", "resumen"])
+def test_motor_columnar_igual_a_agregacion(fuente):
+    ventas, gastos = generar_datos(n_ventas=2000)
+    rango = (date.today() - timedelta(days=40), date.today())
+
+    async def ejecutar():
+        db = AsyncMongoMockClient()["test_columnar"]
+        await db.ventas.insert_many([dict(v) for v in ventas])
+        await db.gastos.insert_many([dict(g) for g in gastos])
+        await resumen_diario.reconstruir(db)
+        return [
+            await calcular_estadisticas(db, *rango, granularidad="semana", fuente=fuente, motor=motor)
+            for motor in ("mongo", "columnar")
+        ]
+
+    agregado, columnar = asyncio.run(ejecutar())
+    comparar(columnar, agregado)
+    assert columnar["ventas_por_dia"] == agregado["ventas_por_dia"]
+    assert [p["fecha"] for p in columnar["inversion_por_dia"]] == [p["fecha"] for p in agregado["inversion_por_dia"]]
+    if fuente == "ventas":
+        # Suma correctamente redondeada, como $sum de MongoDB (mongomock suma en orden)
+        entregadas = [v for v in ventas if v["entregado"] is True and rango[0].isoformat() <= v["fecha_venta"]]
+        assert columnar["ganancias_totales"] == math.fsum(v["ganancia"] for v in entregadas)
+
+
+def test_resumen_incremental_igual_a_reconstruido():
+    ventas, _ = generar_datos(n_ventas=200)
+    rnd = random.Random(3)
+
+    async def ejecutar():
+        db = AsyncMongoMockClient()["test_incremental"]
+        documentos = [dict(v, entregado=None) for v in ventas]
+        await db.ventas.insert_many(documentos)
+        # Simular los cambios de estado que hace actualizar_venta, incluidos los que se revierten
+        for venta in rnd.sample(documentos, 150):
+            for estado in rnd.sample([True, False, None], 2):
+                anterior = await db.ventas.find_one_and_update(
+                    {"id": venta["id"]}, {"$set": {"entregado": estado}},
+                    return_document=ReturnDocument.BEFORE,
+                )
+                await resumen_diario.registrar_ventas(db, [(anterior, -1), ({**anterior, "entregado": estado}, 1)])
+        incremental = await calcular_estadisticas(db, date.today() - timedelta(days=60), date.today())
+        esperado = await calcular_estadisticas(
+            db, date.today() - timedelta(days=60), date.today(), fuente="ventas"
+        )
+        return incremental, esperado
+
+    incremental, esperado = asyncio.run(ejecutar())
+    for campo in ("ganancias_totales", "perdidas_totales", "productos_vendidos", "productos_devueltos"):
+        assert incremental[campo] == pytest.approx(esperado[campo])
+    assert incremental["ventas_por_dia"] == esperado["ventas_por_dia"]
+    assert {p["producto"]: pytest.approx(p["ganancia"]) for p in incremental["ganancias_por_producto"]} == \
+        {p["producto"]: p["ganancia"] for p in esperado["ganancias_por_producto"]}
+
+
+def test_escrituras_durante_la_reconstruccion(monkeypatch):
+    ventas, _ = generar_datos(n_ventas=200)
+    nuevas = [dict(v, id=str(uuid.uuid4()), entregado=True) for v in generar_datos(n_ventas=40, semilla=9)[0]]
+
+    async def ejecutar():
+        db = AsyncMongoMockClient()["test_escrituras_reconstruccion"]
+        await db.ventas.insert_many([dict(v) for v in ventas])
+        coleccion = type(db.ventas)
+        bulk_write = coleccion.bulk_write
+
+        # La copia temporal tarda: las ventas siguen llegando entre la agregación y el rename
+        async def con_latencia(self, *args, **kwargs):
+            if self.name.endswith("_tmp"):
+                await asyncio.sleep(0.01)
+            return await bulk_write(self, *args, **kwargs)
+
+        monkeypatch.setattr(coleccion, "bulk_write", con_latencia)
+
+        async def vender():
+            for venta in nuevas:
+                await db.ventas.insert_one(dict(venta))
+                await resumen_diario.registrar_ventas(db, [(venta, 1)])
+                await asyncio.sleep(0)
+
+        await asyncio.gather(resumen_diario.reconstruir(db, tamano_lote=10), vender())
+        filas = await db.ventas_diarias.find({}, {"_id": 0}).sort([("fecha", 1), ("producto", 1)]).to_list(None)
+        incremental = await calcular_estadisticas(db, date.today() - timedelta(days=60), date.today())
+        esperado = await calcular_estadisticas(
+            db, date.today() - timedelta(days=60), date.today(), fuente="ventas"
+        )
+        await resumen_diario.reconstruir(db)
+        reconstruidas = await db.ventas_diarias.find({}, {"_id": 0}).sort([("fecha", 1), ("producto", 1)]).to_list(None)
+        return filas, reconstruidas, incremental, esperado, await db.bloqueos.count_documents({})
+
+    filas, reconstruidas, incremental, esperado, bloqueos = asyncio.run(ejecutar())
+    assert bloqueos == 0
+    assert [f | {"ganancia": pytest.approx(f["ganancia"])} for f in filas] == reconstruidas
+    for campo in ("ganancias_totales", "productos_vendidos", "productos_devueltos"):
+        assert incremental[campo] == pytest.approx(esperado[campo])
+
+
+def test_resumen_incremental_cuenta_con_enteros():
+    async def ejecutar():
+        db = AsyncMongoMockClient()["test_enteros"]
+        venta = {"fecha_venta": "2024-01-01", "producto": "P", "ganancia": 10.5}
+        await resumen_diario.registrar_ventas(db, [
+            ({**venta, "entregado": True}, 1), ({**venta, "entregado": False, "valor_perdida": 2.5}, 1),
+        ])
+        return await db.ventas_diarias.find_one({"producto": "P"})
+
+    fila = asyncio.run(ejecutar())
+    assert type(fila["entregados"]) is int and type(fila["devueltos"]) is int
+    assert (fila["ganancia"], fila["perdidas"]) == (10.5, 2.5)
+
+
+def test_agregacion_sin_datos():
+    async def ejecutar():
+        db = AsyncMongoMockClient()["test_vacio"]
+        return await calcular_estadisticas(db)
+
+    resultado = asyncio.run(ejecutar())
+    assert resultado["productos_vendidos"] == 0
+    assert resultado["inversion_publicidad"] == 0
+    assert len(resultado["ventas_por_dia"]) == 7
+    assert resultado["ganancias_por_producto"] == []
+
+
+@pytest.mark.parametrize("motor", ["mongo", "columnar"])
+@pytest.mark.parametrize("fuente", ["ventas", "resumen"])
+def test_rango_invertido_sin_datos(fuente, motor):
+    ventas, gastos = generar_datos(n_ventas=50)
+
+    async def ejecutar():
+        db = AsyncMongoMockClient()["test_invertido"]
+        await db.ventas.insert_many([dict(v) for v in ventas])
+        await db.gastos.insert_many([dict(g) for g in gastos])
+        await resumen_diario.reconstruir(db)
+        return await calcular_estadisticas(
+            db, date.today(), date.today() - timedelta(days=10), fuente=fuente, motor=motor
+        )
+
+    resultado = asyncio.run(ejecutar())
+    assert resultado["ganancias_totales"] == 0 and resultado["inversion_publicidad"] == 0
+    assert resultado["productos_vendidos"] == 0
+    assert resultado["ventas_por_dia"] == [] and resultado["inversion_por_dia"] == []
+    assert resultado["ganancias_por_producto"] == []
+
+
+def test_serie_por_semana_y_mes():
+    dias = dias_del_periodo(date(2024, 1, 29), date(2024, 2, 6))
+    ventas_dia = {"2024-01-29": 2, "2024-01-31": 1, "2024-02-04": 3, "2024-02-06": 4}
+
+    assert len(serie_ventas(ventas_dia, dias)) == 9
+    assert serie_ventas(ventas_dia, dias, "semana") == [
+        {"fecha": "2024-01-29", "ventas": 6},
+        {"fecha": "2024-02-05", "ventas": 4},
+    ]
+    assert serie_ventas(ventas_dia, dias, "mes") == [
+        {"fecha": "2024-01-29", "ventas": 3},
+        {"fecha": "2024-02-01", "ventas": 7},
+    ]
+
+
+def test_dashboard_limita_el_rango_y_llega_hasta_el_ultimo_dia(monkeypatch):
+    cliente = TestClient(server.app)
+
+    amplio = cliente.get("/api/dashboard", params={"fecha_inicio": "0001-01-01", "fecha_final": "9999-12-31"})
+    assert amplio.status_code == 400
+    ultimo = cliente.get("/api/dashboard", params={"fecha_inicio": "9999-12-01", "fecha_final": "9999-12-31"})
+    assert ultimo.status_code == 200
+    assert [p["fecha"] for p in ultimo.json()["ventas_por_dia"]][-1] == "9999-12-31"
+    assert dias_del_periodo(date.max, date.max) == [date.max]
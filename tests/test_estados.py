@@ -0,0 +1,103 @@
+import asyncio
+from datetime import date
+
+import httpx
+import pytest
+
+import analitica
+import server
+from estadisticas import calcular_estadisticas
+
+
+@pytest.fixture
+def db(servidor):
+    return servidor
+
+
+async def crear_ventas(cliente, n):
+    ids = []
+    for i in range(n):
+        respuesta = await cliente.post("/api/ventas", json={
+            "cliente_id": "c1", "producto": f"Producto {i % 2}", "fecha_venta": "2024-01-10",
+            "valor_venta": 1000, "ganancia": 300,
+        })
+        ids.append(respuesta.json()["id"])
+    return ids
+
+
+def ejecutar(escenario):
+    async def con_cliente():
+        transporte = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+            return await escenario(cliente)
+
+    return asyncio.run(con_cliente())
+
+
+def comprobar_resumenes(db, vendidos, devueltos):
+    rango = (date(2024, 1, 1), date(2024, 1, 31))
+    resumen = asyncio.run(calcular_estadisticas(db, *rango))
+    directo = asyncio.run(calcular_estadisticas(db, *rango, fuente="ventas"))
+    assert (resumen["productos_vendidos"], resumen["productos_devueltos"]) == (vendidos, devueltos)
+    assert resumen["ganancias_totales"] == directo["ganancias_totales"]
+    assert resumen["perdidas_totales"] == directo["perdidas_totales"]
+
+    def contadores():
+        filas = asyncio.run(db.analitica_productos.find({}, {"_id": 0}).to_list(length=None))
+        return {f["producto"]: {c: f.get(c, 0) for c in analitica.CAMPOS} for f in filas}
+
+    incrementales = contadores()
+    asyncio.run(analitica.reconstruir(db))
+    for producto, campos in contadores().items():
+        assert incrementales[producto] == pytest.approx(campos)
+
+
+def test_manifiesto_con_repetidos_y_desconocidos(db):
+    async def escenario(cliente):
+        ids = await crear_ventas(cliente, 3)
+        manifiesto = [
+            {"id": ids[0], "entregado": False, "valor_perdida": 50},
+            {"id": ids[1], "entregado": False, "valor_perdida": 20},
+            {"id": "no-existe", "entregado": True},
+            {"id": ids[0], "entregado": True, "fecha_entrega": "2024-01-12"},  # gana la última entrada
+        ]
+        primera = (await cliente.put("/api/ventas/estado", json=manifiesto)).json()
+        reenvio = (await cliente.put("/api/ventas/estado", json=manifiesto)).json()
+        return ids, primera, reenvio
+
+    ids, primera, reenvio = ejecutar(escenario)
+    assert (primera["encontradas"], primera["modificadas"]) == (2, 2)
+    assert primera["resultados"] == [
+        {"id": ids[0], "encontrada": 1, "modificada": 1},
+        {"id": ids[1], "encontrada": 1, "modificada": 1},
+        {"id": "no-existe", "encontrada": 0, "modificada": 0},
+    ]
+    assert (reenvio["encontradas"], reenvio["modificadas"]) == (2, 0)
+    guardada = asyncio.run(db.ventas.find_one({"id": ids[0]}))
+    assert (guardada["entregado"], guardada["fecha_entrega"], guardada["valor_perdida"]) == (True, "2024-01-12", 0)
+    comprobar_resumenes(db, vendidos=1, devueltos=1)
+
+
+def test_reintentos_simultaneos_no_cuentan_dos_veces(db, monkeypatch):
+    # mongomock responde sin ceder el bucle: una pausa antes de cada escritura
+    # simula la ida y vuelta a Mongo y deja que los reintentos se intercalen
+    coleccion = type(db.ventas)
+    for metodo in ("bulk_write", "find_one_and_update"):
+        original = getattr(coleccion, metodo)
+
+        async def con_latencia(self, *args, _original=original, **kwargs):
+            await asyncio.sleep(0.005)
+            return await _original(self, *args, **kwargs)
+
+        monkeypatch.setattr(coleccion, metodo, con_latencia)
+
+    async def escenario(cliente):
+        ids = await crear_ventas(cliente, 20)
+        manifiesto = [{"id": venta_id, "entregado": True} for venta_id in ids]
+        return await asyncio.gather(*(cliente.put("/api/ventas/estado", json=manifiesto) for _ in range(3)))
+
+    respuestas = [r.json() for r in ejecutar(escenario)]
+    # Cada venta cambia una sola vez aunque los tres reintentos la lean a la vez
+    assert sum(r["modificadas"] for r in respuestas) == 20
+    assert all(r["encontradas"] == 20 for r in respuestas)
+    comprobar_resumenes(db, vendidos=20, devueltos=0)
@@ -0,0 +1,85 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import esquema
+import server
+from eventos import Bus, evento_de_cambio, flujo
+
+
+def test_bus_reenvia_desde_last_event_id_y_pide_recargar():
+    async def ejecutar():
+        bus = Bus(historial=3, tamano_cola=3)
+        for i in range(3):
+            bus.publicar("venta_creada", {"i": i})
+        reanudada = bus.suscribir(ultimo_id=1)
+        reenviados = [reanudada.get_nowait()[2]["i"] for _ in range(reanudada.qsize())]
+        bus.cancelar(reanudada)
+        perdida = Bus(historial=1)
+        perdida.publicar("a", {})
+        perdida.publicar("b", {})
+
+        lenta = bus.suscribir()
+        for i in range(4):
+            bus.publicar("venta_creada", {"i": i})
+        return (
+            reenviados,
+            perdida.suscribir(ultimo_id=0).get_nowait()[1],
+            [lenta.get_nowait()[1] for _ in range(lenta.qsize())],
+        )
+
+    reanudada, perdida, lenta = asyncio.run(ejecutar())
+    # Con la cola llena (3) el cuarto evento vacía la cola y deja solo la orden de recargar
+    assert reanudada == [1, 2]
+    assert perdida == "recargar"
+    assert lenta == ["recargar"]
+
+
+def test_endpoints_publican_deltas(monkeypatch):
+    cliente = TestClient(server.app)
+
+    async def leer(ultimo_id, n):
+        cuerpo = flujo(server.bus, ultimo_id, latido=0.01)
+        marcos = [await cuerpo.__anext__() for _ in range(n + 1)]
+        await cuerpo.aclose()
+        return [m.decode() for m in marcos[1:]]
+
+    venta_id = cliente.post("/api/ventas", json={
+        "cliente_id": "c1", "producto": "P", "fecha_venta": "2024-01-01", "valor_venta": 100, "ganancia": 30,
+    }).json()["id"]
+    cliente.put(f"/api/ventas/{venta_id}", json={"entregado": True, "fecha_entrega": "2024-01-02"})
+    cliente.post("/api/gastos", json={"concepto": "Ads", "valor": 10, "fecha_inicio": "2024-01-01", "fecha_final": "2024-01-02"})
+
+    creada, actualizada, gasto = asyncio.run(leer(0, 3))
+    assert creada.startswith("id: 1\nevent: venta_creada\n") and venta_id in creada
+    assert '"entregado":true' in actualizada and '"anterior":{' in actualizada and '"_id"' not in actualizada
+    assert "event: gasto_creado" in gasto
+    assert asyncio.run(leer(3, 1)) == [": latido\n\n"]
+
+
+def test_evento_de_cambio():
+    insercion = {"operationType": "insert", "ns": {"coll": "clientes"}, "fullDocument": {"_id": 1, "id": "c"}}
+    actualizacion = {"operationType": "update", "ns": {"coll": "ventas"}, "fullDocument": {"id": "v", "entregado": True}}
+    assert evento_de_cambio(insercion) == ("cliente_creado", {"cliente": {"id": "c"}})
+    assert evento_de_cambio(actualizacion) == ("venta_actualizada", {"venta": {"id": "v", "entregado": True}, "anterior": None})
+
+
+def test_migracion_no_se_anuncia_como_ventas_nuevas():
+    db = AsyncMongoMockClient()["test_eventos_migracion"]
+    venta = {"id": "3f2a1c4e-8b7d-4e6f-9a0b-1c2d3e4f5a6b", "cliente_id": "c1", "producto": "P",
+             "fecha_venta": "2024-01-01", "valor_venta": 10.0, "ganancia": 3.0, "entregado": None}
+
+    async def migrar():
+        await db.ventas.insert_one(dict(venta))
+        await esquema.migrar_coleccion(db, "ventas")
+        return await db.ventas.find_one({})
+
+    copia = asyncio.run(migrar())
+    assert esquema.version(copia) == 2
+    insercion = {"operationType": "insert", "ns": {"coll": "ventas"}, "fullDocument": copia}
+    assert evento_de_cambio(insercion) is None
+    # La marca es interna: ni la API ni una actualización posterior la muestran
+    assert esquema.a_api("ventas", copia) == venta
+    actualizacion = {**insercion, "operationType": "update", "fullDocument": {**copia, "entregado": True}}
+    assert evento_de_cambio(actualizacion)[1]["venta"] == {**venta, "entregado": True}
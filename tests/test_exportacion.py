@@ -0,0 +1,67 @@
+import asyncio
+import csv
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import exportacion
+import server
+
+
+@pytest.fixture
+def cliente_http():
+    return TestClient(server.app)
+
+
+def crear_ventas_con_clientes(cliente_http):
+    clientes = [
+        cliente_http.post("/api/clientes", json={"nombre": n, "apellidos": "Díaz", "telefono": "300"}).json()["id"]
+        for n in ("Ana", "Luis")
+    ]
+    for i, dia in enumerate(["03", "01", "02", "01", "15"]):
+        cliente_http.post("/api/ventas", json={
+            "cliente_id": clientes[i % 2] if i < 4 else "borrado", "producto": f"Producto {i}",
+            "fecha_venta": f"2024-01-{dia}", "valor_venta": 1000, "ganancia": 300,
+        })
+    return clientes
+
+
+def test_exportar_ventas_ndjson_y_csv(cliente_http):
+    crear_ventas_con_clientes(cliente_http)
+
+    respuesta = cliente_http.get("/api/ventas/export", params={"fecha_inicio": "2024-01-01", "fecha_final": "2024-01-10"})
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"] == "application/x-ndjson"
+    assert respuesta.headers["content-disposition"] == "attachment; filename=ventas.ndjson"
+    ventas = [json.loads(linea) for linea in respuesta.text.splitlines()]
+    assert [(v["fecha_venta"], v["producto"]) for v in ventas] == [
+        ("2024-01-01", "Producto 1"), ("2024-01-01", "Producto 3"), ("2024-01-02", "Producto 2"),
+        ("2024-01-03", "Producto 0"),
+    ]
+    assert [v["cliente_nombre"] for v in ventas] == ["Luis Díaz", "Luis Díaz", "Ana Díaz", "Ana Díaz"]
+    assert all("_id" not in v for v in ventas)
+
+    respuesta = cliente_http.get("/api/ventas/export", params={"formato": "csv"})
+    assert respuesta.headers["content-type"] == "text/csv; charset=utf-8"
+    filas = list(csv.DictReader(io.StringIO(respuesta.text)))
+    assert list(filas[0]) == exportacion.COLUMNAS_VENTAS
+    assert [f["fecha_venta"] for f in filas] == ["2024-01-01", "2024-01-01", "2024-01-02", "2024-01-03", "2024-01-15"]
+    assert filas[-1]["cliente_nombre"] == "Cliente no encontrado"
+
+    assert cliente_http.get("/api/ventas/export", params={"formato": "xlsx"}).status_code == 400
+
+
+def test_exportar_por_lotes(cliente_http):
+    crear_ventas_con_clientes(cliente_http)
+
+    async def exportar(formato):
+        return [trozo async for trozo in exportacion.exportar_ventas(server.db, {}, formato, tamano_lote=2)]
+
+    ndjson = asyncio.run(exportar("ndjson"))
+    assert [trozo.count(b"\n") for trozo in ndjson] == [2, 2, 1]
+    csv_ = asyncio.run(exportar("csv"))
+    # Cabecera y luego un trozo por lote
+    assert csv_[0].startswith("id,cliente_id,cliente_nombre")
+    assert [len(trozo.splitlines()) for trozo in csv_] == [1, 2, 2, 1]
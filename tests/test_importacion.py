@@ -0,0 +1,132 @@
+import asyncio
+import json
+from datetime import date
+
+import httpx
+import pytest
+
+import importacion
+import server
+from estadisticas import calcular_estadisticas
+
+
+@pytest.fixture
+def db(monkeypatch, servidor):
+    monkeypatch.setattr(importacion, "TAMANO_LOTE", 2)
+    return servidor
+
+
+def trozos(cuerpo: bytes, tamano: int = 7):
+    """Cuerpo enviado en trozos que cortan las líneas por la mitad"""
+    async def generar():
+        for i in range(0, len(cuerpo), tamano):
+            yield cuerpo[i:i + tamano]
+
+    return generar()
+
+
+def importar(ruta, cuerpo: bytes, tipo: str):
+    async def con_cliente():
+        transporte = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+            return await cliente.post(ruta, content=trozos(cuerpo), headers={"content-type": tipo})
+
+    return asyncio.run(con_cliente())
+
+
+def contar_lotes(db, monkeypatch):
+    lotes = []
+    coleccion = type(db.ventas)
+    original = coleccion.insert_many
+
+    async def registrar(self, documentos, *args, **kwargs):
+        documentos = list(documentos)
+        lotes.append(len(documentos))
+        return await original(self, documentos, *args, **kwargs)
+
+    monkeypatch.setattr(coleccion, "insert_many", registrar)
+    return lotes
+
+
+def venta(i: int, **campos) -> dict:
+    return {
+        "cliente_id": "c1", "producto": f"Producto {i % 2}", "fecha_venta": "2024-01-10",
+        "valor_venta": 1000, "ganancia": 300, "entregado": True, **campos,
+    }
+
+
+def ndjson(filas) -> bytes:
+    return b"".join(json.dumps(f).encode() + b"\n" for f in filas)
+
+
+def test_importar_csv_con_cabecera(db):
+    cuerpo = "﻿nombre,apellidos,telefono\r\nAna,\"Díaz, Peña\",300\r\n\r\nLuis,Ánaya,301\r\nSin,Telefono,\r\n"
+    respuesta = importar("/api/clientes/bulk", cuerpo.encode("utf-8"), "text/csv; charset=utf-8")
+    assert respuesta.status_code == 200
+    informe = respuesta.json()
+    assert (informe["total"], informe["insertados"], informe["interrumpida"]) == (3, 2, False)
+    assert [e["fila"] for e in informe["errores"]] == [3]
+    assert "telefono" in informe["errores"][0]["error"]
+    clientes = asyncio.run(db.clientes.find({}, {"_id": 0}).to_list(length=None))
+    assert sorted((c["nombre"], c["apellidos"]) for c in clientes) == [("Ana", "Díaz, Peña"), ("Luis", "Ánaya")]
+
+
+def test_importar_ndjson_con_filas_invalidas(db):
+    cuerpo = ndjson([venta(0), venta(1, valor_venta="mucho")]) + b"{no es json\n" + ndjson([[1, 2], venta(2)])
+    respuesta = importar("/api/ventas/bulk", cuerpo, "application/x-ndjson")
+    assert respuesta.status_code == 200
+    informe = respuesta.json()
+    assert (informe["total"], informe["insertados"], informe["interrumpida"]) == (5, 2, False)
+    errores = {e["fila"]: e["error"] for e in informe["errores"]}
+    assert sorted(errores) == [2, 3, 4]
+    assert errores[2].startswith("valor_venta")
+    assert errores[3].startswith("JSON inválido")
+    assert errores[4] == "Se esperaba un objeto"
+    # Las ventas importadas llegan al resumen diario
+    resumen = asyncio.run(calcular_estadisticas(db, date(2024, 1, 1), date(2024, 1, 31)))
+    assert resumen["productos_vendidos"] == 2
+
+
+def test_importar_csv_con_fila_ilegible(db):
+    cuerpo = "nombre,apellidos,telefono\nAna,Díaz,300\n" + "x" * 200_000 + ",Largo,1\nLuis,Ánaya,301\n"
+    informe = importar("/api/clientes/bulk", cuerpo.encode(), "text/csv").json()
+    assert (informe["total"], informe["insertados"]) == (3, 2)
+    assert informe["errores"][0]["fila"] == 2
+    assert informe["errores"][0]["error"].startswith("CSV inválido")
+
+
+@pytest.mark.parametrize("filas", [4, 5])
+def test_importar_en_lotes(db, monkeypatch, filas):
+    lotes = contar_lotes(db, monkeypatch)
+    informe = importar("/api/ventas/bulk", ndjson(venta(i) for i in range(filas)), "application/jsonl").json()
+    assert (informe["total"], informe["insertados"], informe["errores"]) == (filas, filas, [])
+    assert lotes == [2] * (filas // 2) + [1] * (filas % 2)
+    assert asyncio.run(db.ventas.count_documents({})) == filas
+
+
+def test_corte_a_mitad_informa_lo_insertado(db, monkeypatch):
+    lotes = contar_lotes(db, monkeypatch)
+    cuerpo = ndjson(venta(i) for i in range(3)) + b"\xff\xfe\n" + ndjson([venta(3)])
+    respuesta = importar("/api/ventas/bulk", cuerpo, "application/x-ndjson")
+    # El primer lote ya estaba insertado: se informa junto con la fila donde se cortó
+    assert respuesta.status_code == 200
+    informe = respuesta.json()
+    assert (informe["total"], informe["insertados"], informe["interrumpida"]) == (3, 3, True)
+    assert [e["fila"] for e in informe["errores"]] == [4]
+    assert informe["errores"][0]["error"].startswith("Lectura interrumpida")
+    assert lotes == [2, 1]
+    assert asyncio.run(db.ventas.count_documents({})) == 3
+    assert [evento[1] for evento in server.bus._historial] == ["recargar"]
+    resumen = asyncio.run(calcular_estadisticas(db, date(2024, 1, 1), date(2024, 1, 31)))
+    assert resumen["productos_vendidos"] == 3
+
+
+def test_cuerpo_ilegible_desde_el_principio(db):
+    assert importar("/api/ventas/bulk", b"\xff\xfe\n", "application/x-ndjson").status_code == 400
+    assert importar("/api/ventas/bulk", b'{"no": "lista"}', "application/json").status_code == 400
+    # Sin filas válidas tampoco se inserta nada
+    assert importar("/api/ventas/bulk", ndjson([{"producto": "P"}]), "application/x-ndjson").json()["insertados"] == 0
+    assert asyncio.run(db.ventas.count_documents({})) == 0
+    # Ni cambia el ETag de las ventas ni se pide a los clientes que recarguen
+    assert asyncio.run(db.versiones.count_documents({})) == 0
+    assert not server.bus._historial
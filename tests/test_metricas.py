@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from metricas import BUCKETS, EscuchaComandos
+
+
+@pytest.fixture
+def cliente(servidor):
+    return TestClient(server.app), servidor
+
+
+def series(texto: str) -> dict:
+    """Valores de /metrics por nombre de serie con sus etiquetas"""
+    valores = {}
+    for linea in texto.splitlines():
+        if linea and not linea.startswith("#"):
+            serie, valor = linea.rsplit(" ", 1)
+            valores[serie] = float(valor)
+    return valores
+
+
+def escuchar_comandos(db, monkeypatch):
+    """Emitir los eventos que pymongo mandaría al listener; mongomock no los genera.
+
+    Se emiten desde dentro de la operación, como hace el driver, para que el
+    listener vea la ruta de la petición en curso.
+    """
+    escucha = EscuchaComandos()
+    coleccion = type(db.gastos)
+    original = coleccion.estimated_document_count
+    ids = iter(range(1, 1000))
+
+    def evento(nombre, comando, **campos):
+        return SimpleNamespace(request_id=next(ids), command_name=nombre, command=comando, **campos)
+
+    async def con_eventos(self, *args, **kwargs):
+        total = await original(self, *args, **kwargs)
+        conteo = evento("count", {"count": self.name})
+        escucha.started(conteo)
+        escucha.succeeded(SimpleNamespace(**vars(conteo), duration_micros=3000, reply={"n": total, "ok": 1}))
+        lote = [{"_id": 1, "valor": 10}, {"_id": 2, "valor": 20}]
+        busqueda = evento("find", {"find": self.name})
+        escucha.started(busqueda)
+        escucha.succeeded(SimpleNamespace(
+            **vars(busqueda), duration_micros=20000, reply={"cursor": {"firstBatch": lote}, "ok": 1}
+        ))
+        fallido = evento("aggregate", {"aggregate": self.name})
+        escucha.started(fallido)
+        escucha.failed(fallido)
+        return total
+
+    monkeypatch.setattr(coleccion, "estimated_document_count", con_eventos)
+
+
+def test_metrics_tras_una_peticion(cliente, monkeypatch):
+    cliente_http, db = cliente
+    escuchar_comandos(db, monkeypatch)
+    respuesta = cliente_http.get("/api/gastos")
+    assert respuesta.status_code == 200
+    assert 'mongo;dur=23.00;desc="2 consultas"' in respuesta.headers["server-timing"]
+
+    texto = cliente_http.get("/metrics").text
+    assert "# TYPE http_request_duration_seconds histogram" in texto
+    assert "# TYPE mongo_documents_returned_total counter" in texto
+    valores = series(texto)
+
+    peticion = 'method="GET",route="/api/gastos",status="200"'
+    assert valores[f"http_request_duration_seconds_count{{{peticion}}}"] == 1
+    assert valores[f'http_request_duration_seconds_bucket{{{peticion},le="+Inf"}}'] == 1
+    cubetas = [valores[f'http_request_duration_seconds_bucket{{{peticion},le="{b}"}}'] for b in BUCKETS]
+    assert cubetas == sorted(cubetas)
+
+    conteo = 'route="/api/gastos",command="count",collection="gastos"'
+    busqueda = 'route="/api/gastos",command="find",collection="gastos"'
+    assert valores[f"mongo_command_duration_seconds_count{{{conteo}}}"] == 1
+    assert valores[f"mongo_command_duration_seconds_sum{{{busqueda}}}"] == pytest.approx(0.02)
+    assert valores[f'mongo_command_duration_seconds_bucket{{{busqueda},le="0.01"}}'] == 0
+    assert valores[f'mongo_command_duration_seconds_bucket{{{busqueda},le="0.025"}}'] == 1
+    assert valores[f"mongo_documents_returned_total{{{conteo}}}"] == 0
+    assert valores[f"mongo_documents_returned_total{{{busqueda}}}"] == 2
+    assert valores[f"mongo_bytes_returned_total{{{busqueda}}}"] > 0
+    assert valores['mongo_command_failures_total{route="/api/gastos",command="aggregate"}'] == 1
+    # /metrics también se mide a sí misma, pero después de generar el texto
+    assert 'route="/metrics"' not in texto
+
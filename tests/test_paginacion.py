@@ -0,0 +1,82 @@
+import asyncio
+import base64
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def cliente_http():
+    return TestClient(server.app)
+
+
+def test_recorrer_ventas_con_cursor(cliente_http):
+    for i in range(25):
+        respuesta = cliente_http.post("/api/ventas", json={
+            "cliente_id": "c1",
+            "producto": f"Producto {i}",
+            "fecha_venta": f"2024-01-{i % 5 + 1:02d}",
+            "valor_venta": 1000,
+            "ganancia": 300,
+        })
+        assert respuesta.status_code == 200
+
+    vistos, cursor = [], None
+    while True:
+        params = {"limit": 10, "fields": "id,producto"}
+        if cursor:
+            params["cursor"] = cursor
+        respuesta = cliente_http.get("/api/ventas", params=params)
+        assert respuesta.headers["X-Total-Count"] == "25"
+        pagina = respuesta.json()
+        assert all(set(v) == {"id", "producto"} for v in pagina)
+        vistos.extend(pagina)
+        cursor = respuesta.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    completa = cliente_http.get("/api/ventas").json()
+    assert [v["id"] for v in vistos] == [v["id"] for v in completa]
+    assert len({v["id"] for v in vistos}) == 25
+    assert "_id" not in completa[0]
+
+
+def test_parametros_invalidos(cliente_http):
+    assert cliente_http.get("/api/ventas", params={"cursor": "no-es-un-cursor"}).status_code == 400
+    assert cliente_http.get("/api/clientes", params={"fields": "nombre,clave"}).status_code == 400
+
+
+@pytest.mark.parametrize("valores", [
+    '[{"$oid": "zz"}, 1]', '[{"$binary": {}}, 1]', '[{"$date": {"$numberLong": "x"}}, 1]',
+    '[{"$regex": "a"}, {"$oid": "65a000000000000000000000"}]', '{"a": 1}',
+])
+def test_cursor_manipulado(cliente_http, valores):
+    cursor = base64.urlsafe_b64encode(valores.encode()).decode()
+    respuesta = cliente_http.get("/api/ventas", params={"cursor": cursor})
+    assert respuesta.status_code == 400
+    assert respuesta.json() == {"detail": "Cursor inválido"}
+
+
+@pytest.mark.parametrize("motor", ["mongo", "columnar"])
+def test_dashboard_sin_validacion_cumple_el_esquema(cliente_http, motor):
+    venta_id = cliente_http.post("/api/ventas", json={
+        "cliente_id": "c1", "producto": "Producto 1", "fecha_venta": "2024-01-01",
+        "valor_venta": 1000, "ganancia": 300,
+    }).json()["id"]
+    cliente_http.put(f"/api/ventas/{venta_id}", json={"entregado": True})
+    # Fila del resumen con los conteos como double, como los guardaban versiones anteriores
+    asyncio.run(server.db.ventas_diarias.insert_one(
+        {"fecha": "2024-01-02", "producto": "Producto 2", "entregados": 2.0, "devueltos": 1.0, "ganancia": 10.0}
+    ))
+    respuesta = cliente_http.get(
+        "/api/dashboard", params={"fecha_inicio": "2024-01-01", "fecha_final": "2024-01-03", "motor": motor}
+    )
+    assert respuesta.headers["content-type"] == "application/json"
+    dashboard = respuesta.json()
+    assert server.EstadisticasResponse(**dashboard).model_dump() == dashboard
+    # == no distingue 3.0 de 3: los conteos declarados como int deben llegar como int
+    assert (dashboard["productos_vendidos"], dashboard["productos_devueltos"]) == (3, 1)
+    assert type(dashboard["productos_vendidos"]) is int and type(dashboard["productos_devueltos"]) is int
+    assert [type(dia["ventas"]) for dia in dashboard["ventas_por_dia"]] == [int] * 3
@@ -0,0 +1,125 @@
+import asyncio
+import os
+from datetime import date
+
+import httpx
+import pytest
+
+import reportes
+import server
+
+
+def test_meses():
+    assert reportes.ultimo_dia("2024-02") == date(2024, 2, 29)
+    with pytest.raises(ValueError):
+        reportes.ultimo_dia("9999-12")
+    assert reportes.meses_entre("2023-12-20", "2024-02-01") == ["2023-12", "2024-01", "2024-02"]
+    assert reportes.cerrado("2024-01", hoy=date(2024, 2, 1))
+    assert not reportes.cerrado("2024-02", hoy=date(2024, 2, 29))
+    assert reportes.ultimo_cerrado(hoy=date(2024, 3, 5)) == "2024-02"
+    with pytest.raises(ValueError):
+        reportes.primer_dia("2024-13")
+
+
+def test_informe_desde_disco_y_regeneracion_tardia(monkeypatch, tmp_path):
+    generador = reportes.generador
+    archivo = tmp_path / "2024-01.json.gz"
+
+    async def ejecutar():
+        transporte = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+            # 3000 en 30 días: 15 días (1500) caen en enero
+            await cliente.post("/api/gastos", json={
+                "concepto": "Ads", "valor": 3000, "fecha_inicio": "2023-12-17", "fecha_final": "2024-01-15",
+            })
+            ids = []
+            for dia in ("2024-01-10", "2024-01-20", "2024-03-01"):
+                respuesta = await cliente.post("/api/ventas", json={
+                    "cliente_id": "c1", "producto": "P", "fecha_venta": dia, "valor_venta": 1000, "ganancia": 300,
+                })
+                ids.append(respuesta.json()["id"])
+            await cliente.put(f"/api/ventas/{ids[0]}", json={"entregado": True, "fecha_entrega": "2024-01-11"})
+            assert not archivo.exists()
+
+            primero = await cliente.get("/api/reportes/2024-01", headers={"Accept-Encoding": "identity"})
+            comprimido = await cliente.get("/api/reportes/2024-01", headers={"Accept-Encoding": "gzip"})
+            no_modificado = await cliente.get(
+                "/api/reportes/2024-01", headers={"If-None-Match": primero.headers["etag"]}
+            )
+            no_modificado_gzip = await cliente.get(
+                "/api/reportes/2024-01", headers={"If-None-Match": comprimido.headers["etag"], "Accept-Encoding": "gzip"}
+            )
+            errores = [
+                (await cliente.get(f"/api/reportes/{mes}")).status_code
+                for mes in ("2024-13", "9999-12", "2999-01", "2023-11", "0001-01")
+            ]
+
+            # Venta tardía de un mes con informe: se borra y se regenera en segundo plano
+            await cliente.put(f"/api/ventas/{ids[1]}", json={"entregado": False, "valor_perdida": 50})
+            borrado = not archivo.exists()
+            await asyncio.gather(*list(generador._en_curso.values()))
+            regenerado = await cliente.get("/api/reportes/2024-01")
+
+            # Un mes sin informe no se genera por una escritura
+            await cliente.put(f"/api/ventas/{ids[2]}", json={"entregado": True})
+            await asyncio.gather(*list(generador._en_curso.values()))
+            return primero, comprimido, (no_modificado, no_modificado_gzip), errores, borrado, regenerado
+
+    primero, comprimido, no_modificados, errores, borrado, regenerado = asyncio.run(ejecutar())
+
+    informe = primero.json()
+    assert primero.status_code == 200 and "content-encoding" not in primero.headers
+    assert informe["mes"] == "2024-01"
+    assert (informe["ganancias_totales"], informe["perdidas_totales"]) == (300, 0)
+    assert informe["inversion_publicidad"] == pytest.approx(1500)
+    assert informe["utilidad_neta"] == pytest.approx(300 - 1500)
+    assert informe["ganancias_por_producto"] == [{"producto": "P", "ganancia": 300}]
+    assert len(informe["ventas_por_dia"]) == 31
+
+    assert comprimido.headers["content-encoding"] == "gzip" and comprimido.json() == informe
+    # Dos representaciones, dos ETags; las dos varían según Accept-Encoding
+    assert comprimido.headers["etag"] == primero.headers["etag"][:-1] + '-gzip"'
+    assert all("Accept-Encoding" in r.headers["vary"] for r in (primero, comprimido))
+    assert [r.status_code for r in no_modificados] == [304, 304]
+    assert no_modificados[1].headers["etag"] == comprimido.headers["etag"]
+    # 2023-11 y 0001-01 están cerrados pero no tienen ventas: no se generan
+    assert errores == [400, 400, 409, 404, 404]
+    assert sorted(os.listdir(tmp_path)) == ["2024-01.json.gz"]
+
+    assert borrado and archivo.exists()
+    assert regenerado.json()["perdidas_totales"] == 50
+    assert regenerado.json()["productos_devueltos"] == 1
+    assert regenerado.headers["etag"] != primero.headers["etag"]
+    assert sorted(os.listdir(tmp_path)) == ["2024-01.json.gz"]
+
+
+@pytest.mark.parametrize("borrados, estado", [(1, 200), (reportes.REINTENTOS_LECTURA, 503)])
+def test_informe_borrado_tras_generarlo(monkeypatch, tmp_path, borrados, estado):
+    escribir = reportes.escribir
+    escrituras = []
+
+    def escribir_y_borrar(mes, informe, directorio=None):
+        # Una escritura tardía borra el archivo antes de que la petición lo abra
+        destino = escribir(mes, informe, directorio)
+        escrituras.append(mes)
+        if len(escrituras) <= borrados:
+            os.remove(destino)
+        return destino
+
+    monkeypatch.setattr(reportes, "escribir", escribir_y_borrar)
+    asyncio.run(server.db.ventas_diarias.insert_one(
+        {"fecha": "2024-01-05", "producto": "P", "entregados": 1, "ganancia": 300}
+    ))
+
+    async def pedir():
+        transporte = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+            return await cliente.get("/api/reportes/2024-01")
+
+    respuesta = asyncio.run(pedir())
+    assert respuesta.status_code == estado
+    assert len(escrituras) == min(borrados + 1, reportes.REINTENTOS_LECTURA)
+    if estado == 200:
+        assert respuesta.json()["mes"] == "2024-01"
+    else:
+        assert respuesta.headers["retry-after"] == "1"